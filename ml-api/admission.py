@@ -0,0 +1,89 @@
+"""
+Admission control for generation endpoints.
+
+At most max_in_flight generations run at once; a request beyond that is
+rejected immediately with a Retry-After estimate instead of queueing behind
+the executors, so latency stays bounded under overload and the event loop
+keeps answering /health. Counters are only touched from the event loop
+thread, so no lock is needed; code that may run elsewhere, such as a GC
+finalizer, releases through Slot.release_soon(). HARMONIX_MAX_IN_FLIGHT=0
+disables the limit.
+"""
+
+import math
+import os
+import time
+
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("HARMONIX_MAX_IN_FLIGHT", "8"))
+
+
+class Overloaded(Exception):
+    """Every generation slot is taken"""
+
+    def __init__(self, in_flight: int, retry_after: int):
+        super().__init__(f"Server is at capacity ({in_flight} generations in flight), retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Slot:
+    """One admitted request; release() is idempotent"""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.start = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(time.perf_counter() - self.start)
+
+    def release_soon(self, loop):
+        """Release from any thread by scheduling release() on the event loop"""
+        try:
+            loop.call_soon_threadsafe(self.release)
+        except RuntimeError:
+            pass  # the loop is closed, so nothing is left to admit
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """Bounded count of in-flight generations with a service-time estimate for Retry-After"""
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.max_in_flight = max(0, max_in_flight)
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.mean_seconds = None  # exponentially weighted request duration
+
+    def acquire(self):
+        """Take a slot or raise Overloaded"""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise Overloaded(self.in_flight, self.retry_after())
+        self.in_flight += 1
+        self.admitted += 1
+        return Slot(self)
+
+    def _release(self, seconds: float):
+        self.in_flight -= 1
+        self.mean_seconds = seconds if self.mean_seconds is None else 0.8 * self.mean_seconds + 0.2 * seconds
+
+    def retry_after(self):
+        """Whole seconds until a slot is likely free, between 1 and 60"""
+        return min(60, max(1, math.ceil(self.mean_seconds or 1)))
+
+    def stats(self):
+        return {
+            "max_in_flight": self.max_in_flight or None,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "mean_seconds": self.mean_seconds,
+        }
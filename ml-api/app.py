@@ -4,7 +4,7 @@ import numpy as np
 import io
 import base64
 import wave
-from lightweight_main import MusicGenService
+from lightweight_main import GenerationRequest, MusicGenService
 
 # Initialize the service
 music_service = MusicGenService()
@@ -12,15 +12,13 @@ music_service = MusicGenService()
 def generate_music_interface(prompt, duration, temperature, lora_model):
     """Gradio interface for music generation"""
     try:
-        # Create a mock request object
-        class MockRequest:
-            def __init__(self, prompt, duration, temperature, lora_model):
-                self.prompt = prompt
-                self.duration = duration
-                self.temperature = temperature
-                self.lora_model = lora_model if lora_model != "None" else None
-        
-        request = MockRequest(prompt, duration, temperature, lora_model)
+        # Build the same request object the API receives
+        request = GenerationRequest(
+            prompt=prompt,
+            duration=duration,
+            temperature=temperature,
+            lora_model=lora_model if lora_model != "None" else None
+        )
         
         # Generate music (this will be async in real implementation)
         import asyncio
@@ -0,0 +1,217 @@
+"""
+WAV/PCM encoding helpers shared by the ML API servers.
+
+Responses are built straight from the NumPy buffer: WAV and raw PCM need no
+`wave`/BytesIO round trip, and compressed codecs go through soundfile when it
+is installed. Float samples are scaled, clipped and converted to int16 in
+fixed-size chunks written straight into the response buffer, so a request
+never holds more than one small float scratch block on top of the samples and
+the encoded bytes.
+"""
+
+import base64
+import io
+import json
+import struct
+
+import numpy as np
+
+STREAMING_SIZE = 0xFFFFFFFF  # "unknown length" marker used by streaming WAV writers
+PCM_CHUNK_SAMPLES = 1 << 16  # float32 scratch per conversion step (256 KB)
+
+# Response format -> media type. "json" is the base64 compatibility mode.
+AUDIO_FORMATS = {
+    "json": "application/json",
+    "wav": "audio/wav",
+    "pcm16": "application/octet-stream",
+    "pcm_f32": "application/octet-stream",
+    "flac": "audio/flac",
+    "opus": "audio/ogg",
+}
+
+# Accept header media type -> response format
+ACCEPT_TYPES = {
+    "application/json": "json",
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "application/octet-stream": "pcm16",
+    "audio/l16": "pcm16",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+}
+
+OPUS_SAMPLE_RATE = 48000  # Opus only runs at 8/12/16/24/48 kHz
+
+
+class UnsupportedFormat(ValueError):
+    """Requested audio format is unknown or its codec is not installed"""
+
+
+def negotiate_format(requested: str = None, accept: str = None):
+    """Pick the response format from an explicit `format` field or the Accept header"""
+    if requested:
+        requested = requested.lower()
+        if requested not in AUDIO_FORMATS:
+            raise UnsupportedFormat(f"Unknown format '{requested}', expected one of {', '.join(AUDIO_FORMATS)}")
+        return requested
+    if not accept:
+        return "json"
+
+    ranges = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, position, media_type.lower()))
+
+    for _, _, media_type in sorted(ranges):
+        if media_type in ACCEPT_TYPES:
+            return ACCEPT_TYPES[media_type]
+        if media_type in ("*/*", "application/*"):
+            return "json"
+        if media_type == "audio/*":
+            return "wav"
+    raise UnsupportedFormat(f"None of the accepted types are supported: {accept}")
+
+
+def wav_header(sample_rate: int, num_samples: int = None, channels: int = 1, sample_width: int = 2):
+    """44-byte PCM WAV header; without num_samples the sizes are left open for streaming"""
+    if num_samples is None:
+        riff_size = data_size = STREAMING_SIZE
+    else:
+        data_size = num_samples * channels * sample_width
+        riff_size = 36 + data_size
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate,
+        sample_rate * channels * sample_width, channels * sample_width, sample_width * 8,
+        b"data", data_size,
+    )
+
+
+def write_pcm16(audio, out):
+    """Scale, clip and convert float audio into the int16 array `out`, chunk by chunk
+
+    Scaling happens in the input's own precision (at least float32), so
+    float64 clips truncate to exactly the same int16 values as before.
+    """
+    audio = np.asarray(audio).reshape(-1)
+    scratch = np.empty(min(len(audio), PCM_CHUNK_SAMPLES), dtype=np.result_type(audio.dtype, np.float32))
+    for start in range(0, len(audio), PCM_CHUNK_SAMPLES):
+        block = audio[start:start + PCM_CHUNK_SAMPLES]
+        chunk = scratch[:len(block)]
+        np.multiply(block, 32767, out=chunk, casting="unsafe")
+        np.clip(chunk, -32767, 32767, out=chunk)
+        np.copyto(out[start:start + len(block)], chunk, casting="unsafe")
+    return out
+
+
+def pcm16_bytes(audio):
+    """Convert float audio in [-1, 1] to little-endian 16-bit PCM, as a memoryview over the buffer"""
+    body = bytearray(2 * np.size(audio))
+    write_pcm16(audio, np.frombuffer(body, dtype="<i2"))
+    return memoryview(body)
+
+
+def iter_pcm16_blocks(audio, block_samples: int):
+    """Yield 16-bit PCM bytes for consecutive blocks of an already rendered clip"""
+    for start in range(0, len(audio), block_samples):
+        yield pcm16_bytes(audio[start:start + block_samples])
+
+
+def encode_wav(audio, sample_rate: int):
+    """16-bit mono WAV written into one preallocated buffer"""
+    num_samples = np.size(audio)
+    body = bytearray(44 + 2 * num_samples)
+    body[:44] = wav_header(sample_rate, num_samples)
+    write_pcm16(audio, np.frombuffer(body, dtype="<i2", offset=44))
+    return body
+
+
+def encode_wav_base64(audio, sample_rate: int):
+    """Base64 text of encode_wav(), dropping the WAV buffer before the str copy"""
+    wav = encode_wav(audio, sample_rate)
+    encoded = base64.b64encode(wav)
+    del wav
+    return encoded.decode("ascii")
+
+
+def json_body(result: dict):
+    """JSON bytes for a payload whose "audio_data" is base64, spliced in rather than run through json.dumps
+
+    Base64 needs no escaping, and json.dumps on a multi-megabyte string holds the
+    GIL (and so the event loop) for tens of milliseconds.
+    """
+    rest = json.dumps({key: value for key, value in result.items() if key != "audio_data"})[1:]
+    separator = b", " if rest != "}" else b""
+    return b'{"audio_data": "' + result["audio_data"].encode("ascii") + b'"' + separator + rest.encode()
+
+
+def encode_pcm(audio, sample_format: str = "int16"):
+    """Headerless little-endian PCM at int16 or float32"""
+    if sample_format == "float32":
+        # float32 sample buffers are served as they are
+        return memoryview(np.ascontiguousarray(audio, dtype="<f4")).cast("B")
+    return pcm16_bytes(audio)
+
+
+def _soundfile_encode(audio, sample_rate, container, subtype):
+    try:
+        import soundfile as sf
+    except ImportError:
+        raise UnsupportedFormat(f"{container} encoding requires the soundfile package")
+    buffer = io.BytesIO()
+    try:
+        sf.write(buffer, np.asarray(audio, dtype=np.float32), sample_rate, format=container, subtype=subtype)
+    except (RuntimeError, TypeError, ValueError) as e:
+        raise UnsupportedFormat(f"{container}/{subtype} encoding is not available: {e}")
+    return buffer.getvalue()
+
+
+def _resample(audio, sample_rate, target_rate):
+    try:
+        from scipy.signal import resample_poly
+    except ImportError:
+        positions = np.arange(int(len(audio) * target_rate / sample_rate)) * (sample_rate / target_rate)
+        return np.interp(positions, np.arange(len(audio)), audio)
+    divisor = np.gcd(sample_rate, target_rate)
+    return resample_poly(audio, target_rate // divisor, sample_rate // divisor)
+
+
+def encode_audio(audio, sample_rate: int, audio_format: str):
+    """Encode audio for a binary response, returning (body, media_type)"""
+    if audio_format == "wav":
+        body = encode_wav(audio, sample_rate)
+    elif audio_format == "pcm16":
+        body = encode_pcm(audio, "int16")
+    elif audio_format == "pcm_f32":
+        body = encode_pcm(audio, "float32")
+    elif audio_format == "flac":
+        body = _soundfile_encode(audio, sample_rate, "FLAC", "PCM_16")
+    elif audio_format == "opus":
+        body = _soundfile_encode(_resample(audio, sample_rate, OPUS_SAMPLE_RATE), OPUS_SAMPLE_RATE, "OGG", "OPUS")
+    else:
+        raise UnsupportedFormat(f"'{audio_format}' is not a binary audio format")
+    return body, AUDIO_FORMATS[audio_format]
+
+
+def audio_headers(sample_rate: int, audio_format: str):
+    """Response headers describing a binary audio body"""
+    headers = {"X-Sample-Rate": str(sample_rate), "X-Channels": "1"}
+    if audio_format == "pcm16":
+        headers["X-Sample-Format"] = "s16le"
+    elif audio_format == "pcm_f32":
+        headers["X-Sample-Format"] = "f32le"
+    elif audio_format == "opus":
+        headers["X-Sample-Rate"] = str(OPUS_SAMPLE_RATE)
+    return headers
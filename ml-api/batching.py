@@ -0,0 +1,107 @@
+"""
+Micro-batching scheduler for the real MusicGen path.
+
+Requests that arrive within a short window and share sampling parameters are
+grouped and handed to the executor as one batch, so a single padded
+model.generate call serves several concurrent /generate requests.
+"""
+
+import asyncio
+import logging
+import os
+
+from longform import is_longform
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get("HARMONIX_BATCH_MAX_SIZE", "8"))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get("HARMONIX_BATCH_MAX_WAIT_MS", "50"))
+
+
+def batch_key(request):
+    """Sampling parameters that must match for requests to share a batch
+
+    Seeded requests return None: they run alone so their output does not
+    depend on which other requests happened to share the batch. Long-form
+    requests only batch with each other, so short ones never wait on them.
+    """
+    if getattr(request, "seed", None) is not None:
+        return None
+    return (request.temperature, request.top_k, request.top_p, request.lora_model, is_longform(request.duration))
+
+
+class BatchScheduler:
+    """Collect compatible requests for up to max_wait seconds and run them together"""
+
+    def __init__(self, run_batch, executor, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_MAX_WAIT_MS / 1000):
+        # run_batch(requests) -> list of per-request results, called in the executor
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.pending = {}
+        self.timers = {}
+        self.tasks = set()
+        self.batches_run = 0
+        self.requests_run = 0
+
+    async def submit(self, request):
+        """Queue a request and wait for its slice of the batch result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = batch_key(request)
+        if key is None:
+            self._start([(request, future)])
+            return await future
+
+        group = self.pending.setdefault(key, [])
+        group.append((request, future))
+
+        if len(group) >= self.max_batch_size:
+            self._flush(key)
+        elif len(group) == 1:
+            self.timers[key] = loop.call_later(self.max_wait, self._flush, key)
+
+        return await future
+
+    def _flush(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        group = self.pending.pop(key, None)
+        if group:
+            self._start(group)
+
+    def _start(self, group):
+        task = asyncio.ensure_future(self._run(group))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, group):
+        requests = [request for request, _ in group]
+        logger.info(f"📦 Running batch of {len(requests)} request(s)")
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.run_batch, requests)
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.requests_run += len(requests)
+        for (_, future), result in zip(group, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": sum(len(group) for group in self.pending.values()),
+            "batches_run": self.batches_run,
+            "requests_run": self.requests_run,
+            "mean_batch_size": self.requests_run / self.batches_run if self.batches_run else 0.0,
+        }
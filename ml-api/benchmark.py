@@ -0,0 +1,49 @@
+"""
+Benchmarks for the HarmoniX ML API
+Usage: python benchmark.py synthesis --durations 5 10 20 30
+       python benchmark.py batching --requests 16 --batch-size 8
+       python benchmark.py streaming --durations 5 10 30
+       python benchmark.py wavetable --durations 5 10 30
+       python benchmark.py render-threads --durations 60 300 --threads 1 2 4 8
+       python benchmark.py workers --workers 1 2 4 --requests 32
+       python benchmark.py startup --modes eager lazy mock
+       python benchmark.py tokens --clips 32 --duration 10
+       python benchmark.py packing --clips 256 --max-frames 500
+       python benchmark.py merge --layers 24 --hidden-size 1024
+       python benchmark.py cpu-profile --profiles none int8 bf16 compile int8,compile
+       python benchmark.py longform --durations 30 60 120 --window 30
+       python benchmark.py metrics --threads 1 4 --ops 200000
+       python benchmark.py encoding --durations 10 30 60
+       python benchmark.py text-cache --prompts 300 --requests 2000
+       python benchmark.py admission --clients 32 --duration 30
+       python benchmark.py suite --output results.json --concurrency 1 4 16
+       python benchmark.py compare baseline.json results.json --threshold 20
+
+Every benchmark accepts --output to write its results as JSON; compare diffs
+two such files from the same benchmark.
+"""
+
+import argparse
+import logging
+
+from benchmarks import encoding, inference, mock_synthesis, serving, suite, training
+from benchmarks.common import write_results
+
+MODULES = (mock_synthesis, serving, training, inference, encoding, suite)
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Benchmark the HarmoniX ML API")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    for module in MODULES:
+        module.register(subparsers)
+    for subparser in subparsers.choices.values():
+        if subparser.get_default("writes_results") is not False:
+            subparser.add_argument("--output", default=None, help="Write results to this JSON file")
+
+    args = parser.parse_args()
+    results = args.func(args)
+    if getattr(args, "output", None):
+        write_results(args.output, args, results)
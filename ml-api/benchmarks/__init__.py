@@ -0,0 +1,5 @@
+"""
+Benchmarks for the HarmoniX ML API, one module per area. Run them through
+benchmark.py; every subcommand prints its tables and, with --output, writes
+them as JSON that `python benchmark.py compare` can diff.
+"""
@@ -0,0 +1,181 @@
+"""
+Helpers shared by the benchmark modules: timing, result tables, the JSON
+writer, in-process ASGI requests and fresh-process probes.
+
+Every benchmark returns {table: {case: {metric: value}}} built with
+ResultTable, and write_results() stores any run in the same file layout, so
+`python benchmark.py compare` can diff any two runs of the same benchmark.
+"""
+
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ML_API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROMPTS = [
+    "upbeat electronic dance music with synthesizers",
+    "classical piano sonata",
+    "rock guitar riff",
+    "smooth jazz",
+    "calm ambient pad",
+]
+
+# Service modules the load and admission benchmarks can drive
+APPS = {"lightweight": "lightweight_main", "simple": "simple_main", "main": "main"}
+
+# Metric name endings where a larger value is an improvement; everything else is a cost
+HIGHER_IS_BETTER = ("rps", "per_s", "speedup", "scaling", "hit_rate", "saved_s")
+
+
+def time_call(fn, repeat):
+    """Best wall-clock time of fn() over repeat runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/mean in milliseconds"""
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def _format(value):
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float):
+        return f"{value:.3g}" if value and abs(value) < 0.01 else f"{value:.2f}"
+    return str(value)
+
+
+class ResultTable:
+    """Rows printed as they are measured and kept as {case: {metric: value}}
+
+    A case is the dict of parameters that identifies a row, e.g.
+    {"duration": 10, "threads": 4}; its label is the JSON key.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.widths = None
+
+    def add(self, case: dict, **metrics):
+        row = {**case, **metrics}
+        if self.widths is None:
+            self.widths = {column: max(len(column), 8) for column in row}
+            print(" ".join(f"{column:>{width}}" for column, width in self.widths.items()))
+        print(" ".join(f"{_format(row.get(column, '-')):>{width}}" for column, width in self.widths.items()))
+        label = " ".join(f"{key}={_format(value)}" for key, value in case.items()) or "all"
+        self.rows[label] = {key: float(value) if isinstance(value, (np.floating, np.integer)) else value
+                            for key, value in metrics.items()}
+        return metrics
+
+
+def metadata(args):
+    """Enough context to tell whether two result files are comparable"""
+
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], capture_output=True, text=True, check=True,
+                                  cwd=ML_API_DIR).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "benchmark": args.benchmark,
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("func", "output", "writes_results")},
+    }
+
+
+def write_results(path, args, results):
+    """Write one run as {"meta": ..., "results": {table: {case: {metric: value}}}}"""
+    with open(path, "w") as f:
+        json.dump({"meta": metadata(args), "results": results}, f, indent=2)
+    print(f"Results written to {path}")
+
+
+def run_probe(function, env):
+    """Run benchmarks.<module>.<function>() in a fresh interpreter and return the JSON it prints last"""
+    module, name = function.rsplit(".", 1)
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", f"from {module} import {name}; {name}()"],
+        env=dict(os.environ, **env), capture_output=True, text=True, check=True, cwd=ML_API_DIR,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def rss_mb():
+    """Current resident set size of this process"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+async def asgi_request(app, method, path, payload=None, headers=None):
+    """Drive an ASGI app in-process, returning (status, headers, [(seconds, body chunk)])"""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    request_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    request_headers += [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "headers": request_headers,
+        "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 8000),
+    }
+    received = False
+    response = {"status": None, "headers": {}, "chunks": []}
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # no disconnect until the response is done
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {key.decode(): value.decode() for key, value in message["headers"]}
+        elif message["type"] == "http.response.body" and message.get("body"):
+            response["chunks"].append((time.perf_counter() - start, message["body"]))
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["chunks"]
+
+
+class TinyProcessor:
+    """Byte-level stand-in for the MusicGen AutoProcessor"""
+
+    def __call__(self, text, padding=True, return_tensors="pt"):
+        import torch
+
+        encoded = [list(prompt.encode()[:64]) or [0] for prompt in text]
+        length = max(len(ids) for ids in encoded)
+        input_ids = torch.zeros(len(encoded), length, dtype=torch.long)
+        attention_mask = torch.zeros(len(encoded), length, dtype=torch.long)
+        for i, ids in enumerate(encoded):
+            input_ids[i, :len(ids)] = torch.tensor(ids)
+            attention_mask[i, :len(ids)] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
@@ -0,0 +1,75 @@
+"""Response encoding benchmark: peak memory and latency of each audio format"""
+
+import base64
+import io
+import tracemalloc
+import wave
+
+import numpy as np
+
+from benchmarks.common import PROMPTS, ResultTable, time_call
+from synthesis import SAMPLE_RATE, SynthesisEngine, SynthesisPlan
+
+
+def legacy_encode_json(audio, sample_rate):
+    """The wave/BytesIO base64 pipeline the shared encoder replaced"""
+    audio_int16 = (audio * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(audio_int16.tobytes())
+    buffer.seek(0)
+    return base64.b64encode(buffer.read()).decode()
+
+
+def legacy_encode_wav(audio, sample_rate):
+    """Preallocated WAV with whole-clip float temporaries for the clip and scale"""
+    from audio_encoding import wav_header
+
+    body = bytearray(44 + 2 * len(audio))
+    body[:44] = wav_header(sample_rate, len(audio))
+    np.copyto(np.frombuffer(body, dtype="<i2", offset=44), np.clip(audio, -1.0, 1.0) * 32767, casting="unsafe")
+    return body
+
+
+def bench_encoding(args):
+    """Peak extra memory and latency of each response encoding for one clip"""
+    from audio_encoding import encode_audio, encode_wav, encode_wav_base64
+
+    def measure(fn, audio):
+        tracemalloc.start()
+        try:
+            result = fn(audio)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        del result
+        return peak, time_call(lambda: fn(audio), args.repeat)
+
+    cases = [
+        ("json legacy wave+base64", lambda audio: legacy_encode_json(audio, SAMPLE_RATE)),
+        ("json encode_wav_base64", lambda audio: encode_wav_base64(audio, SAMPLE_RATE)),
+        ("wav full-clip temporaries", lambda audio: legacy_encode_wav(audio, SAMPLE_RATE)),
+        ("wav encode_wav", lambda audio: encode_wav(audio, SAMPLE_RATE)),
+        ("pcm16", lambda audio: encode_audio(audio, SAMPLE_RATE, "pcm16")),
+        ("pcm_f32", lambda audio: encode_audio(audio, SAMPLE_RATE, "pcm_f32")),
+    ]
+    table = ResultTable()
+    for duration in args.durations:
+        for dtype in args.dtypes:
+            audio = SynthesisEngine().render(SynthesisPlan.from_prompt(PROMPTS[1]), duration).astype(dtype)
+            for name, fn in cases:
+                peak, seconds = measure(fn, audio)
+                table.add({"duration": duration, "dtype": dtype, "case": name}, peak_mb=peak / 1e6,
+                          peak_per_clip=peak / audio.nbytes, encode_ms=seconds * 1000)
+    return {"encoding": table.rows}
+
+
+def register(subparsers):
+    parser = subparsers.add_parser("encoding", help="Peak memory and latency of response encodings")
+    parser.add_argument("--durations", type=float, nargs="+", default=[10, 30, 60], help="Clip durations in seconds")
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "float64"], help="Sample dtypes to encode")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (best is kept)")
+    parser.set_defaults(func=bench_encoding)
@@ -0,0 +1,237 @@
+"""Real-model inference benchmarks on torch stand-ins: LoRA merging, CPU profiles, long-form windows, text cache"""
+
+import copy
+import json
+import os
+import resource
+import time
+import types
+
+import numpy as np
+
+from benchmarks.common import PROMPTS, ResultTable, TinyProcessor, rss_mb, run_probe
+
+
+def bench_merge(args):
+    """Per-token CPU latency of a LoRA-wrapped decoder vs merged weights vs merged + int8"""
+    import torch
+
+    from benchmarks.models import make_tiny_decoder
+    from merge_lora import quantize_int8
+
+    torch.manual_seed(0)
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    d = args.hidden_size
+
+    class LoraLinear(torch.nn.Module):
+        """Same forward as a PEFT LoRA Linear: base(x) + B(A(x)) * alpha / r"""
+
+        def __init__(self, base, r=16, alpha=32):
+            super().__init__()
+            self.base = base
+            self.lora_A = torch.nn.Linear(base.in_features, r, bias=False)
+            self.lora_B = torch.nn.Linear(r, base.out_features, bias=False)
+            torch.nn.init.normal_(self.lora_B.weight, std=0.02)
+            self.scaling = alpha / r
+
+        def forward(self, x):
+            return self.base(x) + self.lora_B(self.lora_A(x)) * self.scaling
+
+        def merged(self):
+            base = copy.deepcopy(self.base)
+            with torch.no_grad():
+                base.weight += (self.lora_B.weight @ self.lora_A.weight) * self.scaling
+            return base
+
+    base = make_tiny_decoder(args.layers, d)
+    unmerged = copy.deepcopy(base)
+    for layer in unmerged:
+        # train_lora.py's target modules
+        for name in ("q_proj", "k_proj", "v_proj", "out_proj"):
+            setattr(layer, name, LoraLinear(getattr(layer, name)))
+    merged = copy.deepcopy(unmerged)
+    for layer in merged:
+        for name in ("q_proj", "k_proj", "v_proj", "out_proj"):
+            setattr(layer, name, getattr(layer, name).merged())
+    models = {"base": base, "unmerged": unmerged, "merged": merged, "merged+int8": quantize_int8(copy.deepcopy(merged))}
+
+    table = ResultTable()
+    x = torch.randn(1, 1, d)
+    with torch.inference_mode():
+        reference = unmerged(x)
+        for name, model in models.items():
+            for _ in range(args.warmup):
+                model(x)
+            start = time.perf_counter()
+            for _ in range(args.tokens):
+                out = model(x)
+            per_token = (time.perf_counter() - start) / args.tokens
+            table.add({"mode": name}, ms_per_token=per_token * 1000, tokens_per_s=1 / per_token,
+                      rel_err=float((out - reference).norm() / reference.norm()))
+    return {"merge": table.rows}
+
+
+def cpu_profile_probe():
+    """Child side of the cpu-profile benchmark: load, apply the profile, warm up and time generation"""
+    import torch
+
+    from benchmarks.models import make_tiny_decoder_lm
+    from cpu_profile import CpuProfile
+
+    torch.manual_seed(0)
+    profile = CpuProfile()
+    profile.configure_threads()
+    start = time.perf_counter()
+    model = profile.apply(make_tiny_decoder_lm(int(os.environ["PROBE_LAYERS"]), int(os.environ["PROBE_HIDDEN"])))
+    profile.warmup(model, TinyProcessor())
+    ready = time.perf_counter() - start
+    inputs = TinyProcessor()([PROMPTS[0]])
+    tokens = int(os.environ["PROBE_TOKENS"])
+    start = time.perf_counter()
+    with profile.context():
+        model.generate(**inputs, max_new_tokens=tokens)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"ready_s": ready, "warmup_s": profile.warmup_seconds, "tokens_per_s": tokens / elapsed,
+                      "rss_mb": rss_mb(), "peak_rss_mb": peak_rss, "compiled": profile.stats()["compiled"]}))
+
+
+def bench_cpu_profile(args):
+    """Tokens/s and peak RSS per HARMONIX_CPU_PROFILE, each in a fresh process"""
+    table = ResultTable()
+    baseline = None
+    for name in args.profiles:
+        env = {"HARMONIX_CPU_PROFILE": "" if name == "none" else name, "HARMONIX_WARMUP_TOKENS": str(args.warmup),
+               "PROBE_LAYERS": str(args.layers), "PROBE_HIDDEN": str(args.hidden_size), "PROBE_TOKENS": str(args.tokens)}
+        if args.threads:
+            env["HARMONIX_TORCH_THREADS"] = str(args.threads)
+        run = run_probe("benchmarks.inference.cpu_profile_probe", env)
+        baseline = baseline or run["tokens_per_s"]
+        # A compile profile that fell back to eager is reported as such
+        table.add({"profile": name}, **run, speedup=run["tokens_per_s"] / baseline)
+    return {"cpu_profile": table.rows}
+
+
+def longform_probe():
+    """Child side of the longform benchmark: one real-model generation, timed, with its memory growth"""
+    import lightweight_main
+    from benchmarks.models import make_random_musicgen
+
+    service = lightweight_main.music_service
+    model_data = {"model": make_random_musicgen(int(os.environ["PROBE_LAYERS"]), int(os.environ["PROBE_HIDDEN"])),
+                  "processor": TinyProcessor()}
+    service._generate_batch_with_real_model(model_data, [lightweight_main.GenerationRequest(prompt=PROMPTS[3], duration=1)])
+    rss = rss_mb()
+    duration = float(os.environ["PROBE_DURATION"])
+    request = lightweight_main.GenerationRequest(prompt=PROMPTS[3], duration=duration, seed=0)
+    start = time.perf_counter()
+    audio = service._generate_batch_with_real_model(model_data, [request])[0]
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"seconds": elapsed, "samples": len(audio), "frames_per_s": duration * 50 / elapsed,
+                      "rss_growth_mb": max(0.0, peak_rss - rss)}))
+
+
+def bench_longform(args):
+    """One generate() over the whole clip vs bounded windows, on a random MusicGen, each in a fresh process"""
+    table = ResultTable()
+    for duration in args.durations:
+        baseline = None
+        for mode, window in (("single", 0), ("windowed", args.window)):
+            env = {"HARMONIX_MODEL_MODE": "mock", "HARMONIX_WORKERS": "0",
+                   "HARMONIX_LONGFORM_WINDOW_SECONDS": str(window), "HARMONIX_LONGFORM_CONTEXT_SECONDS": str(args.context),
+                   "PROBE_LAYERS": str(args.layers), "PROBE_HIDDEN": str(args.hidden_size),
+                   "PROBE_DURATION": str(duration)}
+            run = run_probe("benchmarks.inference.longform_probe", env)
+            baseline = baseline or run["seconds"]
+            table.add({"duration": duration, "mode": mode}, generate_s=run["seconds"],
+                      frames_per_s=run["frames_per_s"], rss_growth_mb=run["rss_growth_mb"],
+                      speedup=baseline / run["seconds"])
+    return {"longform": table.rows}
+
+
+def bench_text_cache(args):
+    """Conditioning time per request with and without the text-conditioning cache"""
+    import torch
+
+    from text_cache import TextConditioningCache
+
+    class TextModel(torch.nn.Module):
+        """T5-encoder-sized stand-in exposing get_text_encoder()"""
+
+        def __init__(self):
+            super().__init__()
+            self.embedding = torch.nn.Embedding(256, args.hidden_size)
+            layer = torch.nn.TransformerEncoderLayer(args.hidden_size, 12, 4 * args.hidden_size, batch_first=True)
+            self.layers = torch.nn.TransformerEncoder(layer, args.layers, enable_nested_tensor=False)
+
+        def get_text_encoder(self):
+            return self
+
+        def forward(self, input_ids, attention_mask, return_dict=True):
+            hidden = self.layers(self.embedding(input_ids), src_key_padding_mask=attention_mask == 0)
+            return types.SimpleNamespace(last_hidden_state=hidden)
+
+    model = TextModel().eval()
+    processor = TinyProcessor()
+    # Recurring traffic: a Zipf-distributed stream over a fixed prompt set
+    prompts = [f"{PROMPTS[i % len(PROMPTS)]}, take {i}" for i in range(args.prompts)]
+    rng = np.random.RandomState(args.seed)
+    ranks = np.minimum(rng.zipf(args.zipf, args.requests), args.prompts) - 1
+    stream = [prompts[rank] for rank in ranks]
+    batches = [stream[i:i + args.batch_size] for i in range(0, len(stream), args.batch_size)]
+
+    print(f"{args.requests} requests over {args.prompts} prompts ({len(set(stream))} distinct), "
+          f"encoder {args.layers}x{args.hidden_size}")
+    table = ResultTable()
+    for size in sorted({0, *args.sizes}):
+        cache = TextConditioningCache(max_entries=size)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            for batch in batches:
+                cache.encode(model, processor, batch, "cpu")
+        elapsed = time.perf_counter() - start
+        stats = cache.stats()
+        table.add({"cache_size": size}, total_s=elapsed, ms_per_request=elapsed / args.requests * 1000,
+                  hit_rate=stats["hit_rate"], encoder_s=stats["encoder_seconds"],
+                  saved_s=stats["saved_seconds"], cache_mb=stats["bytes"] / 1e6)
+    return {"text_cache": table.rows}
+
+
+def register(subparsers):
+    parser = subparsers.add_parser("merge", help="Per-token latency of unmerged vs merged vs merged+int8 LoRA")
+    parser.add_argument("--layers", type=int, default=24, help="Decoder layers (musicgen-medium has 48)")
+    parser.add_argument("--hidden-size", type=int, default=1024, help="Decoder width (musicgen-small is 1024)")
+    parser.add_argument("--tokens", type=int, default=100, help="Timed decoding steps per mode")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed steps per mode")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.set_defaults(func=bench_merge)
+
+    parser = subparsers.add_parser("cpu-profile", help="Tokens/s and peak RSS per HARMONIX_CPU_PROFILE")
+    parser.add_argument("--profiles", nargs="+", default=["none", "int8", "bf16", "compile", "int8,compile"],
+                        help="HARMONIX_CPU_PROFILE values, 'none' for the float32 baseline")
+    parser.add_argument("--layers", type=int, default=24, help="Decoder layers (musicgen-small has 24)")
+    parser.add_argument("--hidden-size", type=int, default=1024, help="Decoder width")
+    parser.add_argument("--tokens", type=int, default=100, help="Timed tokens per profile (50 per second of audio)")
+    parser.add_argument("--warmup", type=int, default=16, help="HARMONIX_WARMUP_TOKENS")
+    parser.add_argument("--threads", type=int, default=None, help="HARMONIX_TORCH_THREADS")
+    parser.set_defaults(func=bench_cpu_profile)
+
+    parser = subparsers.add_parser("longform", help="Single-run vs windowed long real-model generation")
+    parser.add_argument("--durations", type=float, nargs="+", default=[30, 60, 120], help="Clip durations in seconds")
+    parser.add_argument("--window", type=float, default=30, help="HARMONIX_LONGFORM_WINDOW_SECONDS for the windowed run")
+    parser.add_argument("--context", type=float, default=10, help="HARMONIX_LONGFORM_CONTEXT_SECONDS")
+    parser.add_argument("--layers", type=int, default=4, help="Decoder layers")
+    parser.add_argument("--hidden-size", type=int, default=256, help="Decoder width")
+    parser.set_defaults(func=bench_longform)
+
+    parser = subparsers.add_parser("text-cache", help="Prompt conditioning time with and without the text cache")
+    parser.add_argument("--prompts", type=int, default=300, help="Distinct recurring prompts")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests in the stream")
+    parser.add_argument("--zipf", type=float, default=1.2, help="Zipf exponent of prompt popularity")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 512], help="Cache sizes (0 = off is always run)")
+    parser.add_argument("--batch-size", type=int, default=4, help="Requests per generation batch")
+    parser.add_argument("--layers", type=int, default=12, help="Encoder layers (t5-base has 12)")
+    parser.add_argument("--hidden-size", type=int, default=768, help="Encoder width (t5-base is 768)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request stream")
+    parser.set_defaults(func=bench_text_cache)
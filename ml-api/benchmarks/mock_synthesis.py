@@ -0,0 +1,159 @@
+"""Mock synthesizer benchmarks: vectorized engine, wavetable bank and threaded rendering"""
+
+import os
+
+import numpy as np
+
+from benchmarks.common import PROMPTS, ResultTable, time_call
+from synthesis import SAMPLE_RATE, SynthesisEngine, SynthesisPlan
+
+
+def legacy_generate_advanced_audio(prompt, duration=10.0, temperature=1.0, lora_model=None):
+    """Reference per-second/per-note/per-harmonic loop the synthesis engine replaced"""
+    sample_rate = SAMPLE_RATE
+    samples = int(duration * sample_rate)
+    plan = SynthesisPlan.from_prompt(prompt, lora_model)
+    style = plan.style
+
+    t = np.linspace(0, duration, samples, False)
+    audio = np.zeros(samples)
+
+    for i in range(int(duration)):
+        start_idx = i * sample_rate
+        end_idx = min((i + 1) * sample_rate, samples)
+        segment_t = t[start_idx:end_idx]
+
+        chord_freqs = plan.progression[i % len(plan.progression)]
+
+        segment_audio = np.zeros(len(segment_t))
+        for freq in chord_freqs:
+            fundamental = np.sin(2 * np.pi * freq * segment_t) * (0.3 * plan.lora_factor)
+            if style == "electronic":
+                for harmonic in [2, 3, 5]:
+                    fundamental += np.sin(2 * np.pi * freq * harmonic * segment_t) * (0.1 / harmonic)
+            elif style == "classical":
+                for harmonic in [2, 3, 4, 5]:
+                    fundamental += np.sin(2 * np.pi * freq * harmonic * segment_t) * (0.15 / harmonic)
+            elif style == "rock":
+                fundamental = np.tanh(fundamental * 2) * 0.4
+
+            if temperature > 1.0:
+                noise_factor = (temperature - 1.0) * 0.1
+                noise = np.random.normal(0, noise_factor, len(segment_t))
+                fundamental += noise
+
+            segment_audio += fundamental
+
+        envelope = np.exp(-segment_t * 0.5) * np.sin(np.pi * segment_t / (1.0))
+        segment_audio *= envelope
+
+        audio[start_idx:end_idx] = segment_audio
+
+    fade_samples = int(0.1 * sample_rate)
+    audio[:fade_samples] *= np.linspace(0, 1, fade_samples)
+    audio[-fade_samples:] *= np.linspace(1, 0, fade_samples)
+
+    audio = audio / np.max(np.abs(audio)) * 0.8
+
+    return audio.astype(np.float32)
+
+
+def bench_synthesis(args):
+    """Compare the vectorized synthesis engine against the legacy loop"""
+    engine = SynthesisEngine()
+    table = ResultTable()
+    for duration in args.durations:
+        for temperature in args.temperatures:
+            legacy_total = engine_total = 0.0
+            max_diff = None
+            for prompt in PROMPTS:
+                # The engine draws noise from per-block PCG64 streams, so only noise-free renders can match
+                if temperature <= 1.0:
+                    reference = legacy_generate_advanced_audio(prompt, duration, temperature)
+                    rendered = engine.render(SynthesisPlan.from_prompt(prompt), duration, temperature)
+                    max_diff = max(max_diff or 0.0, float(np.max(np.abs(reference - rendered))))
+
+                legacy_total += time_call(
+                    lambda: legacy_generate_advanced_audio(prompt, duration, temperature), args.repeat
+                )
+                engine_total += time_call(
+                    lambda: engine.render(SynthesisPlan.from_prompt(prompt), duration, temperature), args.repeat
+                )
+            legacy_ms = legacy_total / len(PROMPTS) * 1000
+            engine_ms = engine_total / len(PROMPTS) * 1000
+            metrics = {"legacy_ms": legacy_ms, "engine_ms": engine_ms, "speedup": legacy_ms / engine_ms}
+            if max_diff is not None:
+                metrics["max_diff"] = max_diff
+            table.add({"duration": duration, "temperature": temperature}, **metrics)
+    return {"synthesis": table.rows}
+
+
+def bench_render_threads(args):
+    """Speedup of chunked parallel rendering over one thread, for long mock clips"""
+    print(f"{os.cpu_count()} CPUs")
+    table = ResultTable()
+    for duration in args.durations:
+        for temperature in args.temperatures:
+            plan = SynthesisPlan.from_prompt(PROMPTS[3])
+            baseline = reference = None
+            for threads in args.threads:
+                # Direct engine: the wavetable would turn repeats into copies
+                engine = SynthesisEngine(threads=threads)
+                audio = engine.render(plan, duration, temperature, seed=args.seed)
+                elapsed = time_call(lambda: engine.render(plan, duration, temperature, seed=args.seed), args.repeat)
+                if baseline is None:
+                    baseline, reference = elapsed, audio
+                table.add({"duration": duration, "temperature": temperature, "threads": threads},
+                          render_ms=elapsed * 1000, speedup=baseline / elapsed,
+                          identical=bool(np.array_equal(audio, reference)))
+    return {"render_threads": table.rows}
+
+
+def bench_wavetable(args):
+    """Per-request latency of direct synthesis vs cold and warm wavetable assembly"""
+    from wavetable import WavetableEngine
+
+    engine = SynthesisEngine()
+    table = ResultTable()
+    for duration in args.durations:
+        for temperature in args.temperatures:
+            direct = cold = warm = 0.0
+            for prompt in PROMPTS:
+                plan = SynthesisPlan.from_prompt(prompt)
+                direct += time_call(lambda: engine.render(plan, duration, temperature), args.repeat)
+                wavetable = WavetableEngine()
+                cold += time_call(lambda: wavetable.render(plan, duration, temperature), 1)
+                warm += time_call(lambda: wavetable.render(plan, duration, temperature), args.repeat)
+            direct, cold, warm = (value / len(PROMPTS) * 1000 for value in (direct, cold, warm))
+            table.add({"duration": duration, "temperature": temperature},
+                      direct_ms=direct, cold_ms=cold, warm_ms=warm, speedup=direct / warm)
+
+    wavetable = WavetableEngine()
+    wavetable.warm(int(max(args.durations)))
+    stats = wavetable.stats()
+    bank = ResultTable()
+    bank.add({"warmed_seconds": max(args.durations)}, segments=stats["segments"],
+             bank_mb=stats["bytes"] / 1e6, budget_mb=stats["max_bytes"] / 1e6)
+    return {"wavetable": table.rows, "bank": bank.rows}
+
+
+def register(subparsers):
+    parser = subparsers.add_parser("synthesis", help="Mock synthesis engine vs legacy loop")
+    parser.add_argument("--durations", type=float, nargs="+", default=[5, 10, 20, 30], help="Clip durations in seconds")
+    parser.add_argument("--temperatures", type=float, nargs="+", default=[1.0, 1.5], help="Sampling temperatures")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (best is kept)")
+    parser.set_defaults(func=bench_synthesis)
+
+    parser = subparsers.add_parser("wavetable", help="Wavetable bank vs direct synthesis")
+    parser.add_argument("--durations", type=float, nargs="+", default=[5, 10, 30], help="Clip durations in seconds")
+    parser.add_argument("--temperatures", type=float, nargs="+", default=[1.0, 1.5], help="Sampling temperatures")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (best is kept)")
+    parser.set_defaults(func=bench_wavetable)
+
+    parser = subparsers.add_parser("render-threads", help="Parallel chunked mock rendering vs thread count")
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 120, 300], help="Clip durations in seconds")
+    parser.add_argument("--temperatures", type=float, nargs="+", default=[1.0, 1.5], help="Sampling temperatures")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8], help="Render thread counts, first is the baseline")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (best is kept)")
+    parser.add_argument("--seed", type=int, default=0, help="Noise seed; output must not depend on threads")
+    parser.set_defaults(func=bench_render_threads)
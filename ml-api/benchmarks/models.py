@@ -0,0 +1,190 @@
+"""Small torch stand-ins with the interfaces of MusicGen, EnCodec and the LoRA training LM"""
+
+from benchmarks.common import TinyProcessor
+from synthesis import SAMPLE_RATE
+
+
+def make_tiny_musicgen(hidden_size=512, codebook_size=2048, samples_per_token=640):
+    """Small autoregressive stand-in with MusicGen's generate() signature and output layout"""
+    import types
+
+    import torch
+
+    class TinyTextEncoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.embedding = torch.nn.Embedding(256, hidden_size)
+            self.layer = torch.nn.TransformerEncoderLayer(hidden_size, 8, 2 * hidden_size, batch_first=True)
+
+        def forward(self, input_ids, attention_mask, return_dict=True):
+            hidden = self.layer(self.embedding(input_ids), src_key_padding_mask=attention_mask == 0)
+            return types.SimpleNamespace(last_hidden_state=hidden)
+
+    class TinyMusicGen(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.text_encoder = TinyTextEncoder()
+            self.code_embedding = torch.nn.Embedding(codebook_size, hidden_size)
+            self.cell = torch.nn.GRUCell(hidden_size, hidden_size)
+            self.lm_head = torch.nn.Linear(hidden_size, codebook_size)
+            self.decoder = torch.nn.Embedding(codebook_size, samples_per_token)
+            self.generation_config = types.SimpleNamespace(guidance_scale=None)
+
+        def get_text_encoder(self):
+            return self.text_encoder
+
+        def generate(self, input_ids, attention_mask, max_new_tokens, encoder_outputs=None, do_sample=True,
+                     temperature=1.0, top_k=250, top_p=None):
+            if encoder_outputs is None:
+                encoder_outputs = (self.text_encoder(input_ids, attention_mask).last_hidden_state,)
+            mask = attention_mask.unsqueeze(-1).float()
+            context = (encoder_outputs[0] * mask).sum(1) / mask.sum(1)
+            hidden = torch.tanh(context)
+            token = torch.zeros(input_ids.shape[0], dtype=torch.long)
+            codes = []
+            for _ in range(max_new_tokens):
+                hidden = self.cell(self.code_embedding(token) + context, hidden)
+                logits = self.lm_head(hidden) / temperature
+                values, indices = logits.topk(min(top_k, logits.shape[-1]), dim=-1)
+                choice = torch.multinomial(torch.softmax(values, dim=-1), 1)
+                token = indices.gather(1, choice).squeeze(1)
+                codes.append(token)
+            audio = torch.tanh(self.decoder(torch.stack(codes, dim=1)))
+            return audio.reshape(input_ids.shape[0], 1, -1)
+
+    return TinyMusicGen().eval()
+
+
+def make_tiny_codec(codebooks=4, codebook_size=2048):
+    """Strided conv encoder with EnCodec's 640x downsampling and (batch, codebooks, frames) codes"""
+    import torch
+
+    class TinyCodec(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            layers, channels = [], 1
+            for width, stride in [(32, 4), (64, 4), (128, 5), (256, 8)]:
+                layers += [torch.nn.Conv1d(channels, width, 2 * stride, stride, padding=stride // 2), torch.nn.ELU()]
+                channels = width
+            self.encoder = torch.nn.Sequential(*layers)
+            self.quantizer = torch.nn.Conv1d(channels, codebooks * codebook_size, 1)
+
+        @torch.no_grad()
+        def encode(self, audio):
+            logits = self.quantizer(self.encoder(audio))
+            return logits.reshape(audio.shape[0], codebooks, codebook_size, -1).argmax(2)
+
+    return TinyCodec().eval()
+
+
+class TinyTokenizer:
+    """MusicGenTokenizer interface over the tiny codec and byte-level processor"""
+
+    def __init__(self, codec, max_duration):
+        self.codec = codec
+        self.sample_rate = SAMPLE_RATE
+        self.max_duration = max_duration
+        self.id = f"tiny:{SAMPLE_RATE}:{max_duration}"
+
+    def encode_audio(self, audio):
+        return self.codec.encode(audio)
+
+    def tokenize(self, prompts):
+        return TinyProcessor()(prompts)
+
+
+def make_tiny_lm(codebooks=4, codebook_size=2048, hidden_size=256):
+    """Codebook-summing GRU LM whose loss matches token_cache.lm_loss's inputs"""
+    import torch
+
+    class TinyLM(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.text_embedding = torch.nn.Embedding(256, hidden_size)
+            self.code_embeddings = torch.nn.ModuleList(
+                torch.nn.Embedding(codebook_size, hidden_size) for _ in range(codebooks))
+            self.rnn = torch.nn.GRU(hidden_size, hidden_size, batch_first=True)
+            self.heads = torch.nn.ModuleList(torch.nn.Linear(hidden_size, codebook_size) for _ in range(codebooks))
+
+        def loss(self, codes, code_mask, input_ids, attention_mask):
+            mask = attention_mask.unsqueeze(-1).float()
+            context = (self.text_embedding(input_ids) * mask).sum(1) / mask.sum(1)
+            x = sum(embedding(codes[:, k]) for k, embedding in enumerate(self.code_embeddings))
+            hidden, _ = self.rnn(x[:, :-1] + context.unsqueeze(1))
+            losses = []
+            for k, head in enumerate(self.heads):
+                target_mask = code_mask[:, k, 1:]
+                losses.append(torch.nn.functional.cross_entropy(head(hidden)[target_mask], codes[:, k, 1:][target_mask]))
+            return sum(losses) / len(losses)
+
+    return TinyLM()
+
+
+def make_tiny_decoder(layers=24, hidden_size=1024):
+    """Stack of single-token decoder steps with MusicGen's projection names and 4x feed-forward"""
+    import torch
+
+    d = hidden_size
+
+    class Layer(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.q_proj, self.k_proj, self.v_proj, self.out_proj = (torch.nn.Linear(d, d) for _ in range(4))
+            self.fc1, self.fc2 = torch.nn.Linear(d, 4 * d), torch.nn.Linear(4 * d, d)
+
+        def forward(self, x):
+            attn = self.out_proj(self.q_proj(x) * torch.sigmoid(self.k_proj(x)) + self.v_proj(x))
+            x = x + attn
+            return x + self.fc2(torch.nn.functional.gelu(self.fc1(x)))
+
+    return torch.nn.Sequential(*(Layer() for _ in range(layers))).eval()
+
+
+def make_tiny_decoder_lm(layers=24, hidden_size=1024, codebook_size=2048):
+    """Token-at-a-time LM whose generate() calls forward() per step, like transformers' sampling loop"""
+    import torch
+
+    class TinyDecoderLM(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.text_embedding = torch.nn.Embedding(256, hidden_size)
+            self.code_embedding = torch.nn.Embedding(codebook_size, hidden_size)
+            self.decoder = make_tiny_decoder(layers, hidden_size)
+            self.lm_head = torch.nn.Linear(hidden_size, codebook_size)
+
+        def forward(self, token, context):
+            return self.lm_head(self.decoder(self.code_embedding(token) + context))
+
+        def generate(self, input_ids, attention_mask, max_new_tokens, do_sample=True, **kwargs):
+            mask = attention_mask.unsqueeze(-1).float()
+            context = (self.text_embedding(input_ids) * mask).sum(1) / mask.sum(1)
+            token = torch.zeros(input_ids.shape[0], dtype=torch.long)
+            codes = []
+            for _ in range(max_new_tokens):
+                logits = self(token, context).float()
+                token = torch.multinomial(torch.softmax(logits, dim=-1), 1).squeeze(1)
+                codes.append(token)
+            return torch.stack(codes, dim=1)
+
+    return TinyDecoderLM().eval()
+
+
+def make_random_musicgen(layers=4, hidden_size=256, max_frames=20000):
+    """Randomly initialised transformers MusicGen at 32 kHz and 50 frames/s, so generate() runs the real code path"""
+    import torch
+    from transformers import (EncodecConfig, MusicgenConfig, MusicgenDecoderConfig,
+                              MusicgenForConditionalGeneration, T5Config)
+
+    text_encoder = T5Config(vocab_size=256, d_model=64, d_kv=16, d_ff=128, num_layers=2, num_heads=4)
+    audio_encoder = EncodecConfig(codebook_size=256, hidden_size=16, num_filters=4, upsampling_ratios=[8, 5, 4, 4],
+                                  sampling_rate=32000, num_residual_layers=1, codebook_dim=16, audio_channels=1,
+                                  chunk_length_s=None)
+    decoder = MusicgenDecoderConfig(vocab_size=256, hidden_size=hidden_size, num_hidden_layers=layers,
+                                    num_attention_heads=4, ffn_dim=4 * hidden_size, num_codebooks=4,
+                                    max_position_embeddings=max_frames)
+    torch.manual_seed(0)
+    model = MusicgenForConditionalGeneration(MusicgenConfig.from_sub_models_config(text_encoder, audio_encoder, decoder))
+    model.generation_config.decoder_start_token_id = model.generation_config.pad_token_id = 256
+    model.generation_config.guidance_scale = 3.0
+    model.generation_config.max_length = max_frames
+    return model.eval()
@@ -0,0 +1,277 @@
+"""Service benchmarks: batching, streaming, worker processes, startup, admission and /metrics"""
+
+import asyncio
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from benchmarks.common import (APPS, PROMPTS, ResultTable, TinyProcessor, asgi_request, latency_summary,
+                               run_probe, time_call)
+
+
+def bench_batching(args):
+    """Throughput of concurrent real-model requests with and without micro-batching"""
+    from benchmarks.models import make_tiny_musicgen
+    from lightweight_main import GenerationRequest, MusicGenService
+
+    model_data = {"model": make_tiny_musicgen(), "processor": TinyProcessor()}
+    requests = [
+        GenerationRequest(prompt=PROMPTS[i % len(PROMPTS)], duration=args.duration)
+        for i in range(args.requests)
+    ]
+
+    async def run(max_batch_size):
+        service = MusicGenService()
+        service.model = model_data
+        service.sessions.max_sessions = 0  # the stand-in has no KV cache to keep for /continue
+        service.batcher.max_batch_size = max_batch_size
+        service.batcher.max_wait = args.max_wait_ms / 1000
+        start = time.perf_counter()
+        await asyncio.gather(*(service.generate_music_async(request) for request in requests))
+        return time.perf_counter() - start, service.batcher.stats()["mean_batch_size"]
+
+    table = ResultTable()
+    baseline = None
+    for max_batch_size in sorted({1, args.batch_size}):
+        elapsed, mean_batch = asyncio.run(run(max_batch_size))
+        baseline = baseline or elapsed
+        table.add({"max_batch": max_batch_size}, mean_batch=mean_batch, total_s=elapsed,
+                  rps=len(requests) / elapsed, speedup=baseline / elapsed)
+    return {"batching": table.rows}
+
+
+def bench_streaming(args):
+    """Time-to-first-byte of /generate/stream against total generation time"""
+    import lightweight_main
+
+    service = lightweight_main.music_service
+    service.model = service._create_advanced_mock_model()
+
+    # Warm up imports and BLAS before timing
+    asyncio.run(asgi_request(lightweight_main.app, "POST", "/generate/stream", {"prompt": args.prompt, "duration": 1}))
+
+    table = ResultTable()
+    for duration in args.durations:
+        payload = {"prompt": args.prompt, "duration": duration}
+        status, _, chunks = asyncio.run(asgi_request(lightweight_main.app, "POST", "/generate/stream", payload))
+        assert status == 200, status
+        # The first chunk is the header; the first audio block is what a player waits for
+        ttfb, total = chunks[1][0], chunks[-1][0]
+        wav_bytes = sum(len(chunk) for _, chunk in chunks)
+
+        status, _, json_chunks = asyncio.run(asgi_request(lightweight_main.app, "POST", "/generate", payload))
+        assert status == 200, status
+        json_bytes = sum(len(chunk) for _, chunk in json_chunks)
+        table.add({"duration": duration}, ttfb_ms=ttfb * 1000, total_ms=total * 1000, ttfb_share=ttfb / total,
+                  json_ms=json_chunks[-1][0] * 1000, wav_mb=wav_bytes / 1e6, json_mb=json_bytes / 1e6)
+    return {"streaming": table.rows}
+
+
+def bench_workers(args):
+    """Mock-path throughput of the process pool as the worker count grows"""
+    from lightweight_main import GenerationRequest
+    from worker_pool import WorkerPool
+
+    requests = [
+        GenerationRequest(prompt=PROMPTS[i % len(PROMPTS)], duration=args.duration, temperature=args.temperature)
+        for i in range(args.requests)
+    ]
+
+    async def run(pool):
+        start = time.perf_counter()
+        await asyncio.gather(*(pool.generate(request) for request in requests))
+        return time.perf_counter() - start
+
+    print(f"{os.cpu_count()} CPU core(s) available")
+    table = ResultTable()
+    baseline = None
+    for workers in args.workers:
+        pool = WorkerPool(workers, mock=True)
+        pool.start()
+        try:
+            asyncio.run(run(pool))  # warm every worker's caches
+            elapsed = asyncio.run(run(pool))
+        finally:
+            pool.shutdown()
+        throughput = len(requests) / elapsed
+        baseline = baseline or throughput / workers
+        table.add({"workers": workers}, threads=pool.threads, rps=throughput, scaling=throughput / baseline)
+    return {"workers": table.rows}
+
+
+def startup_probe():
+    """Child side of the startup benchmark: time to import, /health and a first mock /generate"""
+    t0 = float(os.environ["HARMONIX_PROBE_T0"])
+    import lightweight_main
+    imported = time.time() - t0
+
+    async def run():
+        app = lightweight_main.app
+        async with app.router.lifespan_context(app):
+            status, _, _ = await asgi_request(app, "GET", "/health")
+            assert status == 200, status
+            health = time.time() - t0
+            status, _, _ = await asgi_request(app, "POST", "/generate", {"prompt": PROMPTS[1], "duration": 1})
+            assert status == 200, status
+            generate = time.time() - t0
+            torch_imported = "torch" in sys.modules
+        return health, generate, torch_imported
+
+    health, generate, torch_imported = asyncio.run(run())
+    print(json.dumps({"import_s": imported, "health_s": health, "generate_s": generate, "torch": torch_imported}))
+
+
+def bench_startup(args):
+    """Wall time from process start to a ready service for each HARMONIX_MODEL_MODE"""
+    table = ResultTable()
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.repeat):
+            env = {"HARMONIX_MODEL_MODE": mode, "HARMONIX_PROBE_T0": repr(time.time())}
+            if args.snapshot:
+                env["HARMONIX_MODEL_SNAPSHOT"] = args.snapshot
+            runs.append(run_probe("benchmarks.serving.startup_probe", env))
+        table.add({"mode": mode}, **min(runs, key=lambda run: run["generate_s"]))
+    return {"startup": table.rows}
+
+
+def bench_admission(args):
+    """/health latency while a burst of long generations saturates the service"""
+    os.environ.setdefault("HARMONIX_MODEL_MODE", "mock")
+    os.environ.setdefault("HARMONIX_WORKERS", "0")
+    logging.disable(logging.CRITICAL)
+
+    table = ResultTable()
+    for name in args.apps:
+        app = importlib.import_module(APPS[name]).app
+
+        async def run():
+            statuses, retry_after, probes = [], set(), []
+            done = asyncio.Event()
+
+            async def client(i):
+                # Unique prompts keep the result cache from answering
+                payload = {"prompt": f"{PROMPTS[i % len(PROMPTS)]} #{i}", "duration": args.duration}
+                status, headers, _ = await asgi_request(app, "POST", "/generate", payload)
+                statuses.append(status)
+                if "retry-after" in headers:
+                    retry_after.add(int(headers["retry-after"]))
+
+            async def probe():
+                # Timed from when the probe was due, so a blocked event loop shows up as latency
+                due = time.perf_counter()
+                while True:
+                    await asgi_request(app, "GET", "/health")
+                    probes.append(time.perf_counter() - due)
+                    if done.is_set():
+                        break
+                    due = time.perf_counter() + args.interval
+                    await asyncio.sleep(args.interval)
+
+            async with app.router.lifespan_context(app):
+                await asgi_request(app, "POST", "/generate", {"prompt": "warm-up", "duration": 1})
+                start = time.perf_counter()
+                prober = asyncio.create_task(probe())
+                await asyncio.gather(*(client(i) for i in range(args.clients)))
+                done.set()
+                await prober
+                return statuses, retry_after, probes, time.perf_counter() - start
+
+        statuses, retry_after, probes, wall = asyncio.run(run())
+        summary = latency_summary(probes)
+        table.add({"app": name, "clients": args.clients}, ok=statuses.count(200), rejected=statuses.count(503),
+                  retry_after=",".join(str(value) for value in sorted(retry_after)) or "-",
+                  health_p50_ms=summary["p50_ms"], health_p99_ms=summary["p99_ms"],
+                  health_max_ms=max(probes) * 1000, probes=len(probes), wall_s=wall)
+    return {"admission": table.rows}
+
+
+def bench_metrics(args):
+    """Per-sample cost of the sharded metrics vs a lock-guarded counter, and scrape time"""
+    from metrics import Registry
+
+    class LockedCounter:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.value = 0
+
+        def inc(self, amount=1):
+            with self.lock:
+                self.value += amount
+
+    def per_op(record, threads):
+        def worker():
+            for _ in range(args.ops):
+                record()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return (time.perf_counter() - start) / (args.ops * threads) * 1e9
+
+    table = ResultTable()
+    for threads in args.threads:
+        registry = Registry()
+        counter = registry.counter("bench_total", "benchmark counter")
+        histogram = registry.histogram("bench_seconds", "benchmark histogram")
+        locked = LockedCounter()
+
+        def timed():
+            with histogram.time():
+                pass
+
+        results = [per_op(locked.inc, threads), per_op(counter.inc, threads),
+                   per_op(lambda: histogram.observe(0.02), threads), per_op(timed, threads)]
+        assert counter.value == locked.value == args.ops * threads
+        table.add({"threads": threads}, **dict(zip(("locked_inc_ns", "sharded_inc_ns", "observe_ns", "time_ns"),
+                                                   results)))
+
+    from lightweight_main import REGISTRY
+    scrape = ResultTable()
+    scrape.add({"series": len(REGISTRY.metrics)}, render_ms=time_call(REGISTRY.render, 20) * 1000)
+    return {"recording": table.rows, "scrape": scrape.rows}
+
+
+def register(subparsers):
+    parser = subparsers.add_parser("batching", help="Real-model micro-batching with a tiny stand-in model")
+    parser.add_argument("--requests", type=int, default=16, help="Concurrent requests")
+    parser.add_argument("--batch-size", type=int, default=8, help="Max batch size to compare against serial")
+    parser.add_argument("--max-wait-ms", type=float, default=20, help="Batch collection window")
+    parser.add_argument("--duration", type=float, default=5, help="Requested seconds of audio")
+    parser.set_defaults(func=bench_batching)
+
+    parser = subparsers.add_parser("streaming", help="Time-to-first-byte of /generate/stream")
+    parser.add_argument("--durations", type=float, nargs="+", default=[5, 10, 30], help="Clip durations in seconds")
+    parser.add_argument("--prompt", default=PROMPTS[1], help="Prompt to render")
+    parser.set_defaults(func=bench_streaming)
+
+    parser = subparsers.add_parser("workers", help="Process pool throughput vs worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--requests", type=int, default=32, help="Concurrent requests per run")
+    parser.add_argument("--duration", type=float, default=10, help="Requested seconds of audio")
+    parser.add_argument("--temperature", type=float, default=1.5, help="Sampling temperature (noise keeps every request CPU-bound)")
+    parser.set_defaults(func=bench_workers)
+
+    parser = subparsers.add_parser("startup", help="Process start to /health and first /generate per model mode")
+    parser.add_argument("--modes", nargs="+", default=["eager", "lazy", "mock"], help="HARMONIX_MODEL_MODE values")
+    parser.add_argument("--snapshot", default=None, help="HARMONIX_MODEL_SNAPSHOT directory to load")
+    parser.add_argument("--repeat", type=int, default=3, help="Process launches per mode (fastest is kept)")
+    parser.set_defaults(func=bench_startup)
+
+    parser = subparsers.add_parser("admission", help="/health latency and 503s under a saturating burst")
+    parser.add_argument("--apps", nargs="+", choices=list(APPS), default=["lightweight", "main"], help="Apps to saturate")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent /generate requests in the burst")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of audio per request")
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between /health probes")
+    parser.set_defaults(func=bench_admission)
+
+    parser = subparsers.add_parser("metrics", help="Overhead of /metrics instrumentation per recorded sample")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="Threads recording concurrently")
+    parser.add_argument("--ops", type=int, default=200000, help="Samples recorded per thread")
+    parser.set_defaults(func=bench_metrics)
@@ -0,0 +1,175 @@
+"""The reproducible suite (mock micro-benchmarks plus an in-process load test) and result comparison"""
+
+import asyncio
+import base64
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.common import APPS, HIGHER_IS_BETTER, PROMPTS, ResultTable, asgi_request, latency_summary
+from synthesis import SAMPLE_RATE
+
+
+def suite_micro(args):
+    """Per-call latency of the mock generators, chord lookup and response encoding"""
+    import lightweight_main
+    import main
+    import simple_main
+    from audio_encoding import encode_wav
+
+    service = lightweight_main.music_service
+    styles = ("electronic", "classical", "rock", "jazz", "ambient")
+    table = ResultTable()
+
+    def record(name, duration, fn):
+        fn()  # warm caches and imports
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        table.add({"case": name, "duration": duration}, **latency_summary(timings))
+
+    for duration in args.durations:
+        audio = service.generate_advanced_audio(PROMPTS[1], duration, seed=0)
+        record("generate_advanced_audio", duration,
+               lambda: service.generate_advanced_audio(PROMPTS[1], duration, args.temperature, None, 0))
+        record("simple.generate_dummy_audio", duration, lambda: simple_main.generate_dummy_audio(duration))
+        record("main.generate_dummy_audio", duration, lambda: main.music_service.generate_dummy_audio(duration))
+        # One chord lookup per measure, as the synthesizer does
+        record("_get_chord_frequencies", duration, lambda: [
+            service._get_chord_frequencies(261.63, measure, styles[measure % len(styles)])
+            for measure in range(int(duration))
+        ])
+        record("encode_wav", duration, lambda: encode_wav(audio, SAMPLE_RATE))
+        record("encode_wav+base64", duration, lambda: base64.b64encode(encode_wav(audio, SAMPLE_RATE)).decode())
+    return table.rows
+
+
+def suite_load(args):
+    """Latency percentiles and throughput of /generate at each concurrency level"""
+    table = ResultTable()
+    for name in args.apps:
+        app = importlib.import_module(APPS[name]).app
+
+        async def run(concurrency, offset):
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies, errors = [], 0
+
+            async def one(i):
+                nonlocal errors
+                # Unique prompts keep the result cache out of the measurement unless asked for
+                prompt = PROMPTS[i % len(PROMPTS)] if args.cache else f"{PROMPTS[i % len(PROMPTS)]} #{offset + i}"
+                payload = {"prompt": prompt, "duration": args.duration, "temperature": args.temperature}
+                async with semaphore:
+                    start = time.perf_counter()
+                    status, _, _ = await asgi_request(app, "POST", "/generate", payload)
+                    latencies.append(time.perf_counter() - start)
+                    errors += status != 200
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.requests)))
+            return latencies, errors, time.perf_counter() - start
+
+        async def run_all():
+            async with app.router.lifespan_context(app):
+                await run(1, -1)  # warm-up request
+                offset = 0
+                for concurrency in args.concurrency:
+                    # Pool latencies over rounds and keep the median round's throughput
+                    latencies, errors, throughputs = [], 0, []
+                    for _ in range(args.rounds):
+                        round_latencies, round_errors, elapsed = await run(concurrency, offset)
+                        offset += args.requests
+                        latencies += round_latencies
+                        errors += round_errors
+                        throughputs.append(len(round_latencies) / elapsed)
+                    table.add({"app": name, "concurrency": concurrency}, rps=float(np.median(throughputs)),
+                              **latency_summary(latencies), errors=errors)
+
+        asyncio.run(run_all())
+    return table.rows
+
+
+def bench_suite(args):
+    """Micro-benchmarks plus an in-process load test"""
+    # Mock model, no worker processes, fixed seeds: runs anywhere and repeats
+    os.environ.setdefault("HARMONIX_MODEL_MODE", "mock")
+    os.environ.setdefault("HARMONIX_WORKERS", "0")
+    np.random.seed(args.seed)
+    # Failed requests are counted per run; the apps' own logging would drown the tables
+    logging.disable(logging.CRITICAL)
+
+    results = {}
+    if "micro" in args.parts:
+        results["micro"] = suite_micro(args)
+    if "load" in args.parts:
+        results["load"] = suite_load(args)
+    return results
+
+
+def flatten_results(results, prefix=""):
+    """{"micro": {"case": {"p50_ms": ..}}} -> {"micro/case/p50_ms": ..}, numeric metrics only"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten_results(value, f"{prefix}{key}/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def bench_compare(args):
+    """Diff two result files of the same benchmark; exits non-zero when a metric regresses past the threshold"""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for label, meta in (("baseline", baseline["meta"]), ("current", current["meta"])):
+        print(f"{label:>8}: {meta['benchmark']} at {(meta['commit'] or 'unknown')[:10]}"
+              f"{' (dirty)' if meta['dirty'] else ''} {meta['timestamp']} on {meta['cpus']} CPU(s)")
+    if baseline["meta"]["benchmark"] != current["meta"]["benchmark"]:
+        sys.exit("Results are from different benchmarks")
+
+    old, new = flatten_results(baseline["results"]), flatten_results(current["results"])
+    regressions = 0
+    print(f"{'metric':>60} {'baseline':>10} {'current':>10} {'change':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        if key.endswith("/errors") or not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+        flag = ""
+        if worse > args.threshold:
+            flag = " !"
+            regressions += 1
+        print(f"{key:>60} {old[key]:>10.2f} {new[key]:>10.2f} {change:>+7.1f}%{flag}")
+    print(f"{regressions} metric(s) regressed by more than {args.threshold:g}%")
+    sys.exit(1 if regressions else 0)
+
+
+def register(subparsers):
+    parser = subparsers.add_parser("suite", help="Reproducible micro + load benchmarks")
+    parser.add_argument("--parts", nargs="+", choices=["micro", "load"], default=["micro", "load"], help="Sections to run")
+    parser.add_argument("--durations", type=float, nargs="+", default=[5, 10, 30], help="Micro-benchmark clip durations")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per micro-benchmark case")
+    parser.add_argument("--apps", nargs="+", choices=list(APPS), default=list(APPS), help="Apps to load test")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrent clients per load run")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per load round")
+    parser.add_argument("--rounds", type=int, default=3, help="Load rounds per concurrency level")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds of audio per load-test request")
+    parser.add_argument("--temperature", type=float, default=1.0, help="Sampling temperature")
+    parser.add_argument("--cache", action="store_true", help="Repeat prompts so the result cache can serve them")
+    parser.add_argument("--seed", type=int, default=0, help="NumPy global seed")
+    parser.set_defaults(func=bench_suite)
+
+    parser = subparsers.add_parser("compare", help="Compare two result files of the same benchmark")
+    parser.add_argument("baseline", help="Earlier results JSON")
+    parser.add_argument("current", help="Newer results JSON")
+    parser.add_argument("--threshold", type=float, default=20, help="Percent change counted as a regression")
+    parser.set_defaults(func=bench_compare, writes_results=False)
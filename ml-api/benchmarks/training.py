@@ -0,0 +1,151 @@
+"""LoRA training data benchmarks: token cache and length-bucketed, packed batches"""
+
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import PROMPTS, ResultTable, TinyProcessor
+from synthesis import SAMPLE_RATE
+
+
+def bench_tokens(args):
+    """Training samples/s when encoding EnCodec codes every step vs reading the token cache"""
+    import soundfile as sf
+    import torch
+    from torch.utils.data import DataLoader
+
+    from benchmarks.models import TinyTokenizer, make_tiny_codec, make_tiny_lm
+    from token_cache import TokenCache, TokenDataset, collate_tokens
+    from training_data import ShardDataset, collate_audio, preprocess
+
+    torch.manual_seed(0)
+    tokenizer = TinyTokenizer(make_tiny_codec(), args.duration)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        metadata = []
+        rng = np.random.default_rng(0)
+        for i in range(args.clips):
+            path = os.path.join(data_dir, f"clip{i}.wav")
+            sf.write(path, rng.uniform(-0.5, 0.5, int(args.duration * SAMPLE_RATE)).astype(np.float32), SAMPLE_RATE)
+            metadata.append({"audio_file": f"clip{i}.wav", "prompt": PROMPTS[i % len(PROMPTS)]})
+        with open(os.path.join(data_dir, "metadata.json"), "w") as f:
+            json.dump(metadata, f)
+
+        shard_dir = os.path.join(data_dir, "shard")
+        preprocess(data_dir, shard_dir, max_duration=args.duration)
+        cache = TokenCache(os.path.join(data_dir, "tokens"))
+        start = time.perf_counter()
+        cache.build(data_dir, tokenizer)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        cache.build(data_dir, tokenizer)
+        rebuild_seconds = time.perf_counter() - start
+
+        def train(loader, to_tokens):
+            lm = make_tiny_lm()
+            optimizer = torch.optim.AdamW(lm.parameters(), lr=1e-4)
+            samples = 0
+            start = time.perf_counter()
+            for _ in range(args.epochs):
+                for batch in loader:
+                    loss = lm.loss(**to_tokens(batch))
+                    optimizer.zero_grad()
+                    loss.backward()
+                    optimizer.step()
+                    samples += len(batch["input_ids"] if "input_ids" in batch else batch["prompt"])
+            return samples / (time.perf_counter() - start)
+
+        def encode(batch):
+            codes = tokenizer.encode_audio(batch["audio"])
+            return {"codes": codes, "code_mask": torch.ones_like(codes, dtype=torch.bool),
+                    **tokenizer.tokenize(batch["prompt"])}
+
+        audio_loader = DataLoader(ShardDataset(shard_dir, args.duration), batch_size=args.batch_size,
+                                  collate_fn=collate_audio)
+        token_loader = DataLoader(TokenDataset(cache.cache_dir), batch_size=args.batch_size,
+                                  collate_fn=collate_tokens)
+        audio_rate = train(audio_loader, encode)
+        token_rate = train(token_loader, lambda batch: batch)
+
+    build = ResultTable()
+    build.add({"clips": args.clips}, build_s=build_seconds, rebuild_s=rebuild_seconds)
+    training = ResultTable()
+    training.add({"mode": "encode/step"}, samples_per_s=audio_rate, speedup=1.0)
+    training.add({"mode": "token cache"}, samples_per_s=token_rate, speedup=token_rate / audio_rate)
+    return {"build": build.rows, "training": training.rows}
+
+
+def bench_packing(args):
+    """Padding ratio and useful tokens/s of fixed batches vs length bucketing and packing"""
+    import torch
+    from torch.utils.data import DataLoader
+
+    from benchmarks.models import make_tiny_lm
+    from token_cache import PackingCollator, collate_tokens
+    from training_data import LengthBucketSampler
+
+    class SyntheticTokens(torch.utils.data.Dataset):
+        """Variable-length clips (2-30 s at 50 frames/s) over a handful of prompts"""
+
+        def __init__(self):
+            rng = np.random.default_rng(0)
+            self.lengths = [int(frames) for frames in rng.integers(100, 1500, args.clips)]
+            self.prompts = [TinyProcessor()([PROMPTS[i % len(PROMPTS)]])["input_ids"][0] for i in range(args.clips)]
+
+        def __len__(self):
+            return len(self.lengths)
+
+        def __getitem__(self, idx):
+            return {"codes": torch.randint(2048, (4, self.lengths[idx])), "input_ids": self.prompts[idx]}
+
+    dataset = SyntheticTokens()
+    cropped = lambda items: collate_tokens([
+        dict(item, codes=item["codes"][:, :args.max_frames]) for item in items
+    ])
+    loaders = {
+        "fixed": DataLoader(dataset, batch_size=args.batch_size, shuffle=True, collate_fn=cropped),
+        "bucketed": DataLoader(dataset, collate_fn=PackingCollator(args.max_frames, pack=False),
+                               batch_sampler=LengthBucketSampler(dataset.lengths, args.batch_size * args.max_frames,
+                                                                 max_length=args.max_frames)),
+        "bucketed+packed": DataLoader(dataset, collate_fn=PackingCollator(args.max_frames),
+                                      batch_sampler=LengthBucketSampler(dataset.lengths, args.batch_size * args.max_frames,
+                                                                        max_length=args.max_frames)),
+    }
+
+    table = ResultTable()
+    for name, loader in loaders.items():
+        torch.manual_seed(0)
+        lm = make_tiny_lm()
+        optimizer = torch.optim.AdamW(lm.parameters(), lr=1e-4)
+        steps = tokens = positions = 0
+        start = time.perf_counter()
+        for batch in loader:
+            loss = lm.loss(**batch)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            steps += 1
+            tokens += int(batch["code_mask"].sum())
+            positions += batch["code_mask"].numel()
+        elapsed = time.perf_counter() - start
+        table.add({"mode": name}, steps=steps, padding=1 - tokens / positions, tokens_per_step=tokens / steps,
+                  tokens_per_s=tokens / elapsed)
+    return {"packing": table.rows}
+
+
+def register(subparsers):
+    parser = subparsers.add_parser("tokens", help="LoRA training throughput with and without the token cache")
+    parser.add_argument("--clips", type=int, default=32, help="Synthetic training clips")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per clip")
+    parser.add_argument("--epochs", type=int, default=2, help="Passes over the corpus per mode")
+    parser.add_argument("--batch-size", type=int, default=4, help="Training batch size")
+    parser.set_defaults(func=bench_tokens)
+
+    parser = subparsers.add_parser("packing", help="Length bucketing and sequence packing vs fixed batches")
+    parser.add_argument("--clips", type=int, default=256, help="Synthetic clips of 2-30 s")
+    parser.add_argument("--max-frames", type=int, default=500, help="Frames per sequence")
+    parser.add_argument("--batch-size", type=int, default=4, help="Sequences per fixed batch / token budget")
+    parser.set_defaults(func=bench_packing)
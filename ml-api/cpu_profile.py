@@ -0,0 +1,147 @@
+"""
+CPU inference profile for the transformers MusicGen model.
+
+HARMONIX_CPU_PROFILE is a comma-separated list of optimizations applied once
+the model is loaded on CPU:
+
+    int8     dynamic int8 quantization of the decoder's linear layers (PEFT
+             can't wrap quantized layers, so LoRA is then served from
+             merge_lora.py artifacts and PEFT adapters are refused with 422)
+    bf16     bfloat16 autocast, when the CPU has native bf16 (AVX512-BF16/AMX)
+    compile  torch.compile of the forward pass, falling back to eager on failure
+
+Generation runs under torch.inference_mode (HARMONIX_INFERENCE_MODE=0 for
+no_grad). HARMONIX_TORCH_THREADS / HARMONIX_TORCH_INTEROP_THREADS pin torch's
+thread pools (0 keeps torch's defaults). A short warmup generation at load time
+moves compilation and kernel selection off the first request.
+"""
+
+import contextlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+OPTIONS = ("int8", "bf16", "compile")
+
+DEFAULT_PROFILE = os.environ.get("HARMONIX_CPU_PROFILE", "")
+DEFAULT_THREADS = int(os.environ.get("HARMONIX_TORCH_THREADS", "0"))
+DEFAULT_INTEROP_THREADS = int(os.environ.get("HARMONIX_TORCH_INTEROP_THREADS", "0"))
+DEFAULT_INFERENCE_MODE = os.environ.get("HARMONIX_INFERENCE_MODE", "1") != "0"
+DEFAULT_WARMUP_TOKENS = int(os.environ.get("HARMONIX_WARMUP_TOKENS", "16"))
+
+
+def parse_profile(profile: str):
+    """'int8,compile' -> {"int8", "compile"}, ignoring unknown options"""
+    options = {option.strip().lower() for option in profile.split(",") if option.strip()}
+    unknown = options - set(OPTIONS)
+    if unknown:
+        logger.warning(f"Ignoring unknown HARMONIX_CPU_PROFILE options: {', '.join(sorted(unknown))}")
+    return options & set(OPTIONS)
+
+
+def bf16_supported():
+    """Whether oneDNN has native bfloat16 kernels on this CPU"""
+    import torch
+
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class CpuProfile:
+    """Thread settings, model transforms and the generation context for one CPU profile"""
+
+    def __init__(self, profile: str = DEFAULT_PROFILE, threads: int = DEFAULT_THREADS,
+                 interop_threads: int = DEFAULT_INTEROP_THREADS, inference_mode: bool = DEFAULT_INFERENCE_MODE,
+                 warmup_tokens: int = DEFAULT_WARMUP_TOKENS):
+        self.options = parse_profile(profile)
+        self.threads = threads
+        self.interop_threads = interop_threads
+        self.inference_mode = inference_mode
+        self.warmup_tokens = warmup_tokens
+        self.bf16 = False
+        self.compiled = False
+        self.warmup_seconds = None
+
+    @property
+    def quantized(self):
+        """Whether apply() quantizes the model, which rules out PEFT adapters"""
+        return "int8" in self.options
+
+    def configure_threads(self):
+        """Pin intra/inter-op threads; call before the model runs anything"""
+        import torch
+
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        if self.interop_threads > 0:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:
+                logger.warning("Inter-op threads already fixed by an earlier parallel call")
+
+    def apply(self, model):
+        """Quantize, enable bf16 and compile according to the profile"""
+        import torch
+
+        if "int8" in self.options:
+            from merge_lora import quantize_int8
+
+            # The decoder runs once per token; the text encoder and EnCodec run once per request
+            if hasattr(model, "decoder"):
+                model.decoder = quantize_int8(model.decoder)
+            else:
+                model = quantize_int8(model)
+        if "bf16" in self.options:
+            self.bf16 = bf16_supported()
+            if not self.bf16:
+                logger.warning("bf16 requested but this CPU has no native bfloat16 support; staying in float32")
+        if "compile" in self.options:
+            model.forward = torch.compile(model.forward, dynamic=True)
+            self.compiled = True
+        return model
+
+    def context(self):
+        """Grad-free (and optionally bf16 autocast) context for generate()"""
+        import torch
+
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.inference_mode() if self.inference_mode else torch.no_grad())
+        if self.bf16:
+            stack.enter_context(torch.autocast("cpu", dtype=torch.bfloat16))
+        return stack
+
+    def warmup(self, model, processor):
+        """Run a short generation so the first request doesn't pay for compilation"""
+        if self.warmup_tokens <= 0:
+            return
+        inputs = processor(text=["warmup"], padding=True, return_tensors="pt")
+        start = time.perf_counter()
+        try:
+            with self.context():
+                model.generate(**inputs, max_new_tokens=self.warmup_tokens, do_sample=True)
+        except Exception as e:
+            if not self.compiled:
+                raise
+            # e.g. no C compiler for inductor: drop back to the eager forward
+            logger.warning(f"torch.compile failed during warmup, running eager: {e}")
+            del model.forward
+            self.compiled = False
+            with self.context():
+                model.generate(**inputs, max_new_tokens=self.warmup_tokens, do_sample=True)
+        self.warmup_seconds = time.perf_counter() - start
+        logger.info(f"🔥 Warmup generation done ({self.warmup_seconds:.2f}s)")
+
+    def stats(self):
+        return {
+            "options": sorted(self.options),
+            "bf16": self.bf16,
+            "compiled": self.compiled,
+            "inference_mode": self.inference_mode,
+            "threads": self.threads or None,
+            "interop_threads": self.interop_threads or None,
+            "warmup_seconds": self.warmup_seconds,
+        }
@@ -0,0 +1,254 @@
+"""
+In-process job queue for long generations.
+
+POST /jobs returns a job id immediately; a fixed number of runner tasks take
+jobs from a bounded priority queue, so slow generations never hold an HTTP
+connection open. Each client may only have a few queued or running jobs,
+jobs can be cancelled, and finished results expire after a TTL. At most
+HARMONIX_JOBS_MAX_RESULTS finished jobs are retained; beyond that the oldest
+finished ones are dropped early, so a burst cannot pin unbounded audio.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE = int(os.environ.get("HARMONIX_JOBS_MAX_QUEUE", "64"))
+DEFAULT_CONCURRENCY = int(os.environ.get("HARMONIX_JOBS_CONCURRENCY", "2"))
+DEFAULT_PER_CLIENT = int(os.environ.get("HARMONIX_JOBS_PER_CLIENT", "4"))
+DEFAULT_TTL = float(os.environ.get("HARMONIX_JOBS_TTL_SECONDS", "3600"))
+DEFAULT_MAX_RESULTS = int(os.environ.get("HARMONIX_JOBS_MAX_RESULTS", "256"))
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class QueueFull(Exception):
+    """The job queue, or the client's share of it, is at capacity"""
+
+
+class Job:
+    """One queued generation and its outcome"""
+
+    def __init__(self, request, client: str, priority: int, audio_format: str):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.client = client
+        self.priority = priority
+        self.format = audio_format
+        self.order = None
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.task = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "format": self.format,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded priority queue served by `concurrency` runner tasks
+
+    Lower priority values run first; jobs of equal priority run in
+    submission order.
+    """
+
+    def __init__(self, run, max_queue: int = DEFAULT_MAX_QUEUE, concurrency: int = DEFAULT_CONCURRENCY,
+                 per_client: int = DEFAULT_PER_CLIENT, ttl: float = DEFAULT_TTL,
+                 max_results: int = DEFAULT_MAX_RESULTS):
+        # run(job) -> result, awaited by a runner task
+        self.run = run
+        self.max_queue = max(1, max_queue)
+        self.concurrency = max(1, concurrency)
+        self.per_client = max(1, per_client)
+        self.ttl = ttl
+        self.max_results = max(1, max_results)
+        self.jobs = {}
+        self.finished = OrderedDict()  # finished job ids, oldest first
+        self.heap = []
+        self.order = itertools.count()
+        self.queued = 0
+        self.active_by_client = {}
+        self.available = None
+        self.runners = []
+        # Moving average of wall seconds per second of audio, for progress estimates
+        self.seconds_per_second = None
+        self.completed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def start(self):
+        """Spawn the runner tasks on the running event loop"""
+        self.available = asyncio.Condition()
+        self.runners = [asyncio.ensure_future(self._runner()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for runner in self.runners:
+            runner.cancel()
+        await asyncio.gather(*self.runners, return_exceptions=True)
+        self.runners = []
+
+    async def submit(self, request, client: str, priority: int = 0, audio_format: str = "json"):
+        """Queue a job, raising QueueFull when the queue or the client is at its limit"""
+        self._expire()
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"Job queue is full ({self.max_queue} queued)")
+        if self.active_by_client.get(client, 0) >= self.per_client:
+            self.rejected += 1
+            raise QueueFull(f"Client already has {self.per_client} active job(s)")
+
+        job = Job(request, client, priority, audio_format)
+        self.jobs[job.id] = job
+        self.active_by_client[client] = self.active_by_client.get(client, 0) + 1
+        job.order = next(self.order)
+        heapq.heappush(self.heap, (priority, job.order, job.id))
+        self.queued += 1
+        async with self.available:
+            self.available.notify()
+        return job
+
+    def get(self, job_id: str):
+        self._expire()
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        """Cancel a queued or running job; returns the job, or None if unknown"""
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.status == "queued":
+            # Left in the heap and skipped when popped
+            self.queued -= 1
+            self._finish(job, "cancelled")
+        elif job.task is not None:
+            job.task.cancel()
+        return job
+
+    def describe(self, job: Job):
+        """Status dict with queue position or estimated progress"""
+        info = job.to_dict()
+        if job.status == "queued":
+            info["queue_position"] = sum(
+                1 for priority, order, job_id in self.heap
+                if (priority, order) < (job.priority, job.order)
+                and getattr(self.jobs.get(job_id), "status", None) == "queued"
+            )
+            info["progress"] = 0.0
+        elif job.status == "running":
+            info["progress"] = self._estimate_progress(job)
+        else:
+            info["progress"] = 1.0 if job.status == "succeeded" else None
+        return info
+
+    def _estimate_progress(self, job):
+        duration = getattr(job.request, "duration", None)
+        if not duration or self.seconds_per_second is None:
+            return None
+        expected = duration * self.seconds_per_second
+        return min(0.99, (time.time() - job.started) / expected) if expected > 0 else None
+
+    async def _next_job(self):
+        async with self.available:
+            while True:
+                while self.heap:
+                    _, _, job_id = heapq.heappop(self.heap)
+                    job = self.jobs.get(job_id)
+                    if job is not None and job.status == "queued":
+                        self.queued -= 1
+                        return job
+                await self.available.wait()
+
+    async def _runner(self):
+        while True:
+            job = await self._next_job()
+            job.status = "running"
+            job.started = time.time()
+            job.task = asyncio.ensure_future(self.run(job))
+            try:
+                job.result = await job.task
+            except asyncio.CancelledError:
+                if not job.task.cancelled():
+                    # The runner itself is being stopped
+                    job.task.cancel()
+                    self._finish(job, "cancelled")
+                    raise
+                self._finish(job, "cancelled")
+                continue
+            except Exception as e:
+                job.error = getattr(e, "detail", None) or str(e)
+                self._finish(job, "failed")
+                logger.error(f"❌ Job {job.id} failed: {job.error}")
+                continue
+            self._finish(job, "succeeded")
+            self._observe(job)
+
+    def _observe(self, job):
+        duration = getattr(job.request, "duration", None)
+        if duration:
+            rate = (job.finished - job.started) / duration
+            if self.seconds_per_second is None:
+                self.seconds_per_second = rate
+            else:
+                self.seconds_per_second = 0.8 * self.seconds_per_second + 0.2 * rate
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.time()
+        job.task = None
+        remaining = self.active_by_client.get(job.client, 1) - 1
+        if remaining > 0:
+            self.active_by_client[job.client] = remaining
+        else:
+            self.active_by_client.pop(job.client, None)
+        if status == "succeeded":
+            self.completed += 1
+        self.finished[job.id] = job.finished
+        while len(self.finished) > self.max_results:
+            job_id, _ = self.finished.popitem(last=False)
+            del self.jobs[job_id]
+            self.evicted += 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self.finished:
+            job_id, finished = next(iter(self.finished.items()))
+            if finished >= cutoff:
+                break
+            del self.finished[job_id]
+            del self.jobs[job_id]
+
+    def stats(self):
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "concurrency": self.concurrency,
+            "per_client": self.per_client,
+            "jobs": statuses,
+            "max_results": self.max_results,
+            "completed": self.completed,
+            "evicted": self.evicted,
+            "rejected": self.rejected,
+            "seconds_per_audio_second": self.seconds_per_second,
+        }
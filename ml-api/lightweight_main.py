@@ -1,22 +1,72 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-import torch
 import numpy as np
-import io
 import base64
 import os
 import logging
 import asyncio
+import functools
+import threading
+import weakref
 from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import json
-import wave
+import time
+from admission import AdmissionController, Overloaded
+from audio_encoding import (
+    UnsupportedFormat,
+    audio_headers,
+    encode_audio,
+    encode_wav,
+    iter_pcm16_blocks,
+    json_body,
+    negotiate_format,
+    pcm16_bytes,
+    wav_header,
+)
+from batching import BatchScheduler
+from cpu_profile import CpuProfile
+from jobs import JobQueue, QueueFull
+from longform import generate_windows, is_longform
+from lora_registry import LoraRegistry, LoraUnsupported, PeftBackend
+from merge_lora import is_merged_artifact, load_merged_model
+from metrics import CONTENT_TYPE, REGISTRY
+from model_loader import ModelNotReady, SingleFlightLoader
+from result_cache import ResultCache, cache_key
+from sessions import CodeRecorder, SessionStore, slice_past, undelay_codes
+from synthesis import SynthesisPlan, chord_progression, render_prompt
+from text_cache import TextConditioningCache, generation_inputs
+from wavetable import WavetableEngine
+from worker_pool import WORKERS, WorkerPool
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# eager: load the model at startup; lazy: on the first request; mock: never import torch
+MODEL_MODE = os.environ.get("HARMONIX_MODEL_MODE", "eager")
+# Optional local snapshot written by model_snapshot.py, loaded instead of the hub checkpoint
+MODEL_SNAPSHOT = os.environ.get("HARMONIX_MODEL_SNAPSHOT") or None
+# Threads for mock synthesis and response encoding, kept off the event loop
+CPU_THREADS = int(os.environ.get("HARMONIX_CPU_THREADS", "0")) or (os.cpu_count() or 1)
+
+# Per-stage latency and throughput counters, exported at /metrics
+STAGES = {
+    stage: REGISTRY.histogram("harmonix_stage_seconds", "Time spent in each generation stage", stage=stage)
+    for stage in ("model_load", "conditioning", "generate", "postprocess", "synthesize", "worker", "batch",
+                  "continue", "encode", "base64")
+}
+ENDPOINTS = ("generate", "continue", "stream")
+REQUESTS_STARTED = {e: REGISTRY.counter("harmonix_requests_started_total", "Requests accepted", endpoint=e) for e in ENDPOINTS}
+REQUESTS_FINISHED = {e: REGISTRY.counter("harmonix_requests_finished_total", "Requests completed or failed", endpoint=e) for e in ENDPOINTS}
+REQUEST_ERRORS = {e: REGISTRY.counter("harmonix_request_errors_total", "Requests that failed", endpoint=e) for e in ENDPOINTS}
+TOKENS_GENERATED = REGISTRY.counter("harmonix_tokens_generated_total", "Audio tokens sampled by the in-process model")
+AUDIO_SECONDS = REGISTRY.counter("harmonix_audio_seconds_total", "Seconds of audio generated")
+BYTES_EMITTED = REGISTRY.counter("harmonix_bytes_emitted_total", "Audio payload bytes sent to clients")
+
 app = FastAPI(title="HarmoniX MusicGen LoRA API")
 
 app.add_middleware(
@@ -34,55 +84,133 @@ class GenerationRequest(BaseModel):
     top_k: int = 250
     top_p: float = 0.0
     lora_model: Optional[str] = None
+    seed: Optional[int] = None
+    format: Optional[str] = None  # json (base64, default), wav, pcm16, pcm_f32, flac or opus
+
+class ContinuationRequest(BaseModel):
+    generation_id: str
+    duration: float = 10.0  # extra seconds
+    format: Optional[str] = None
 
 class MusicGenService:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+    def __init__(self, workers: int = WORKERS):
+        self._device = None
         self.model = None
-        self.lora_adapters = {}
-        self.model_loading = False
+        self.model_load_seconds = None
+        self.tokens_per_second = None  # of the last in-process batch
+        self.cpu_profile = CpuProfile()
+        self.lora_registry = LoraRegistry()
+        # Concurrent callers share one load instead of seeing "no model" while it runs
+        self.loader = SingleFlightLoader(self._load_model)
         self.executor = ThreadPoolExecutor(max_workers=1)
-        logger.info(f"🎵 HarmoniX MusicGen Service initialized on device: {self.device}")
+        # CPU-bound steps that don't touch the model run here, never on the event loop
+        self.cpu_executor = ThreadPoolExecutor(max_workers=CPU_THREADS, thread_name_prefix="harmonix-cpu")
+        self.admission = AdmissionController()
+        self.synth = WavetableEngine()
+        # HARMONIX_WORKERS > 0 moves generation into a pool of worker processes
+        self.worker_pool = WorkerPool(workers, mock=MODEL_MODE == "mock") if workers > 0 else None
+        if self.worker_pool is not None:
+            self.batcher = BatchScheduler(self.worker_pool.run_batch, self.worker_pool.dispatcher)
+        else:
+            self.batcher = BatchScheduler(self._run_real_batch, self.executor)
+        self.result_cache = ResultCache()
+        self.jobs = JobQueue(self._run_job)
+        self.sessions = SessionStore()
+        self.text_cache = TextConditioningCache()
+        logger.info(f"🎵 HarmoniX MusicGen Service initialized (model mode: {MODEL_MODE})")
+    
+    @property
+    def device(self):
+        """Resolved on first use so the mock path never imports torch"""
+        if self._device is None:
+            import torch
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
+        
+    @property
+    def model_loading(self):
+        return self.loader.loading
+    
+    async def load_model_async(self, park: bool = None):
+        """The loaded model, awaiting the shared load if one is underway
         
-    async def load_model_async(self):
+        Raises ModelNotReady when the load policy turns the caller away; `park`
+        overrides the policy (see model_loader.SingleFlightLoader.get).
+        """
+        if self.model is not None:
+            return self.model
+        return await self.loader.get(park)
+    
+    async def _load_model(self):
         """Load MusicGen model asynchronously"""
-        if self.model is None and not self.model_loading:
-            self.model_loading = True
-            try:
-                logger.info("🚀 Loading MusicGen model...")
-                loop = asyncio.get_event_loop()
-                self.model = await loop.run_in_executor(
-                    self.executor, 
-                    self._load_model_sync
-                )
-                logger.info("✅ MusicGen model loaded successfully!")
-            except Exception as e:
-                logger.error(f"❌ Failed to load MusicGen model: {e}")
-                self.model = None
-            finally:
-                self.model_loading = False
+        try:
+            logger.info("🚀 Loading MusicGen model...")
+            start = time.perf_counter()
+            loop = asyncio.get_event_loop()
+            self.model = await loop.run_in_executor(
+                self.executor, 
+                self._load_model_sync
+            )
+            self.model_load_seconds = time.perf_counter() - start
+            STAGES["model_load"].observe(self.model_load_seconds)
+            logger.info(f"✅ MusicGen model loaded successfully! ({self.model_load_seconds:.2f}s)")
+        except Exception as e:
+            logger.error(f"❌ Failed to load MusicGen model: {e}")
+            self.model = None
         return self.model
     
     def _load_model_sync(self):
         """Synchronous model loading with fallback"""
+        if self.worker_pool is not None:
+            # Each worker process loads its own copy
+            return self.worker_pool.start()
+        
+        if MODEL_MODE == "mock":
+            return self._create_advanced_mock_model()
+        
         try:
-            # Try to load MusicGen from transformers (lighter than audiocraft)
+            # Heavy imports happen here, off the startup path
+            import torch
             from transformers import MusicgenForConditionalGeneration, AutoProcessor
             
-            model_name = "facebook/musicgen-small"
-            logger.info(f"Loading {model_name}...")
+            if self.device == "cpu":
+                self.cpu_profile.configure_threads()
             
-            processor = AutoProcessor.from_pretrained(model_name)
-            model = MusicgenForConditionalGeneration.from_pretrained(
-                model_name,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                device_map="auto" if self.device == "cuda" else None
-            )
+            if MODEL_SNAPSHOT and self.device == "cpu":
+                from model_snapshot import load_snapshot
+                logger.info(f"Loading snapshot {MODEL_SNAPSHOT}...")
+                model_data = load_snapshot(MODEL_SNAPSHOT, self.device)
+            else:
+                # Try to load MusicGen from transformers (lighter than audiocraft)
+                model_name = MODEL_SNAPSHOT or "facebook/musicgen-small"
+                logger.info(f"Loading {model_name}...")
+                
+                processor = AutoProcessor.from_pretrained(model_name)
+                model = MusicgenForConditionalGeneration.from_pretrained(
+                    model_name,
+                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+                    device_map="auto" if self.device == "cuda" else None
+                )
+                
+                if self.device == "cpu":
+                    model = model.to(self.device)
+                
+                model_data = {"model": model, "processor": processor}
             
             if self.device == "cpu":
-                model = model.to(self.device)
+                # HARMONIX_CPU_PROFILE: int8 / bf16 / compile, then a warmup pass
+                model_data["model"] = self.cpu_profile.apply(model_data["model"])
+                self.cpu_profile.warmup(model_data["model"], model_data["processor"])
             
-            return {"model": model, "processor": processor}
+            # Adapters are loaded into the PEFT wrapper once and swapped per batch;
+            # merged artifacts from merge_lora.py swap in as whole models
+            self.lora_registry.use_backend(PeftBackend(
+                lambda: model_data["model"],
+                lambda wrapped: model_data.__setitem__("model", wrapped),
+                lambda path: self._optimize(load_merged_model(path, self.device)),
+                peft_supported=not (self.device == "cpu" and self.cpu_profile.quantized)
+            ))
+            return model_data
             
         except ImportError as e:
             logger.warning(f"Transformers MusicGen not available: {e}")
@@ -91,285 +219,685 @@ class MusicGenService:
             logger.warning(f"Failed to load real model: {e}")
             return self._create_advanced_mock_model()
     
+    def _optimize(self, model):
+        """Apply the CPU inference profile to a model that replaces the loaded one"""
+        return self.cpu_profile.apply(model) if self.device == "cpu" else model
+    
     def _create_advanced_mock_model(self):
         """Create an advanced mock that simulates real MusicGen behavior"""
         logger.info("🎭 Creating advanced AI-like mock model...")
         return {"model": "advanced_mock", "processor": None}
     
-    def load_lora_adapter(self, lora_path: str):
-        """Load LoRA adapter for fine-tuned model"""
-        try:
-            if os.path.exists(lora_path) and lora_path not in self.lora_adapters:
-                logger.info(f"🔧 Loading LoRA adapter: {lora_path}")
-                # In a real implementation, this would load PEFT LoRA weights
-                # For now, we'll simulate LoRA loading
-                self.lora_adapters[lora_path] = {
-                    "loaded": True,
-                    "config": {"r": 16, "alpha": 32, "target_modules": ["q_proj", "v_proj"]}
-                }
-                logger.info(f"✅ LoRA adapter loaded: {lora_path}")
-        except Exception as e:
-            logger.error(f"❌ Failed to load LoRA adapter: {e}")
+    @staticmethod
+    def lora_path(lora_model: str):
+        return os.path.join("./lora_models", lora_model)
     
-    def generate_advanced_audio(self, prompt: str, duration: float = 10.0, temperature: float = 1.0, lora_model: str = None):
-        """Generate advanced AI-like audio based on prompt analysis"""
-        sample_rate = 32000
-        samples = int(duration * sample_rate)
-        
-        # Analyze prompt for musical characteristics
-        prompt_lower = prompt.lower()
+    def load_lora_adapter(self, lora_model: str):
+        """Activate a LoRA adapter, loading it from ./lora_models on first use; False if it could not be"""
+        return self.lora_registry.activate(lora_model, self.lora_path(lora_model))
+    
+    def check_lora(self, lora_model: Optional[str], model_data):
+        """Whether a real-model generation will apply lora_model, checked before it is queued
         
-        # Determine base frequency and style from prompt
-        if "electronic" in prompt_lower or "edm" in prompt_lower or "techno" in prompt_lower:
-            base_freq = 130.81  # C3
-            style = "electronic"
-        elif "classical" in prompt_lower or "piano" in prompt_lower or "orchestra" in prompt_lower:
-            base_freq = 261.63  # C4
-            style = "classical"
-        elif "rock" in prompt_lower or "guitar" in prompt_lower:
-            base_freq = 82.41   # E2
-            style = "rock"
-        elif "jazz" in prompt_lower:
-            base_freq = 220.00  # A3
-            style = "jazz"
-        elif "ambient" in prompt_lower or "peaceful" in prompt_lower or "calm" in prompt_lower:
-            base_freq = 174.61  # F3
-            style = "ambient"
-        else:
-            base_freq = 261.63  # C4 default
-            style = "general"
+        A missing adapter runs on the base model, as it always has. A PEFT
+        adapter under the int8 CPU profile raises LoraUnsupported, since
+        PEFT cannot wrap the quantized layers.
+        """
+        if not lora_model or not os.path.exists(self.lora_path(lora_model)):
+            return False
+        if self.device == "cpu" and self.cpu_profile.quantized and not is_merged_artifact(self.lora_path(lora_model)):
+            raise LoraUnsupported(
+                f"LoRA adapter '{lora_model}' is a PEFT adapter and HARMONIX_CPU_PROFILE includes int8; "
+                f"serve a merge_lora.py artifact instead"
+            )
+        return True
+    
+    def _use_lora(self, lora_model: Optional[str]):
+        """Activate lora_model (or the base model) for a real-model run
         
-        # Generate time array
-        t = np.linspace(0, duration, samples, False)
-        audio = np.zeros(samples)
+        An adapter that exists but fails to activate fails the run, so its
+        output is never returned as LoRA audio.
+        """
+        if not lora_model:
+            self.lora_registry.deactivate()
+        elif not self.load_lora_adapter(lora_model) and os.path.exists(self.lora_path(lora_model)):
+            raise RuntimeError(f"LoRA adapter '{lora_model}' failed to load")
+    
+    def generate_advanced_audio(self, prompt: str, duration: float = 10.0, temperature: float = 1.0, lora_model: str = None, seed=None,
+                                start_measure: int = 0):
+        """Generate advanced AI-like audio based on prompt analysis
         
-        # Apply LoRA-like modifications if specified
-        lora_factor = 1.0
+        start_measure resumes an earlier clip's chord progression and phase
+        (see /continue); seed is an int or a sequence of ints for the noise streams.
+        """
         if lora_model:
             logger.info(f"🔧 Applying LoRA model: {lora_model}")
-            if "jazz" in lora_model.lower():
-                lora_factor = 1.2
-                base_freq *= 1.1
-            elif "electronic" in lora_model.lower():
-                lora_factor = 0.8
-                base_freq *= 0.9
-            elif "classical" in lora_model.lower():
-                lora_factor = 1.1
         
-        # Generate complex waveform based on style and temperature
-        for i in range(int(duration)):
-            start_idx = i * sample_rate
-            end_idx = min((i + 1) * sample_rate, samples)
-            segment_t = t[start_idx:end_idx]
-            
-            # Create chord progression
-            chord_freqs = self._get_chord_frequencies(base_freq, i, style)
-            
-            # Generate harmonics with temperature-based randomness
-            segment_audio = np.zeros(len(segment_t))
-            for freq in chord_freqs:
-                # Fundamental frequency
-                fundamental = np.sin(2 * np.pi * freq * segment_t) * (0.3 * lora_factor)
-                
-                # Add harmonics based on style
-                if style == "electronic":
-                    # Square wave harmonics
-                    for harmonic in [2, 3, 5]:
-                        fundamental += np.sin(2 * np.pi * freq * harmonic * segment_t) * (0.1 / harmonic)
-                elif style == "classical":
-                    # Rich harmonics
-                    for harmonic in [2, 3, 4, 5]:
-                        fundamental += np.sin(2 * np.pi * freq * harmonic * segment_t) * (0.15 / harmonic)
-                elif style == "rock":
-                    # Distorted harmonics
-                    fundamental = np.tanh(fundamental * 2) * 0.4
-                
-                # Apply temperature-based variation
-                if temperature > 1.0:
-                    noise_factor = (temperature - 1.0) * 0.1
-                    noise = np.random.normal(0, noise_factor, len(segment_t))
-                    fundamental += noise
-                
-                segment_audio += fundamental
-            
-            # Apply envelope
-            envelope = np.exp(-segment_t * 0.5) * np.sin(np.pi * segment_t / (1.0))
-            segment_audio *= envelope
-            
-            audio[start_idx:end_idx] = segment_audio
-        
-        # Apply overall envelope to prevent clicks
-        fade_samples = int(0.1 * sample_rate)  # 100ms fade
-        audio[:fade_samples] *= np.linspace(0, 1, fade_samples)
-        audio[-fade_samples:] *= np.linspace(1, 0, fade_samples)
-        
-        # Normalize
-        audio = audio / np.max(np.abs(audio)) * 0.8
-        
-        return audio.astype(np.float32)
+        return render_prompt(self.synth, prompt, duration, temperature, lora_model, seed, start_measure)
     
     def _get_chord_frequencies(self, base_freq: float, measure: int, style: str):
         """Generate chord frequencies based on musical theory"""
-        # Simple chord progressions
-        if style == "jazz":
-            # ii-V-I progression
-            progressions = [
-                [base_freq * 9/8, base_freq * 5/4, base_freq * 3/2],  # ii
-                [base_freq * 5/4, base_freq * 3/2, base_freq * 15/8], # V
-                [base_freq, base_freq * 5/4, base_freq * 3/2],        # I
-                [base_freq * 6/5, base_freq * 3/2, base_freq * 9/5]   # vi
-            ]
-        elif style == "classical":
-            # I-V-vi-IV progression
-            progressions = [
-                [base_freq, base_freq * 5/4, base_freq * 3/2],        # I
-                [base_freq * 3/2, base_freq * 15/8, base_freq * 9/4], # V
-                [base_freq * 6/5, base_freq * 3/2, base_freq * 9/5],  # vi
-                [base_freq * 4/3, base_freq * 5/3, base_freq * 2]     # IV
-            ]
-        elif style == "electronic":
-            # Simple bass + lead
-            progressions = [
-                [base_freq, base_freq * 2],
-                [base_freq * 9/8, base_freq * 9/4],
-                [base_freq * 5/4, base_freq * 5/2],
-                [base_freq * 4/3, base_freq * 8/3]
-            ]
-        else:
-            # Basic triad
-            progressions = [
-                [base_freq, base_freq * 5/4, base_freq * 3/2],
-                [base_freq * 9/8, base_freq * 45/32, base_freq * 27/16],
-                [base_freq * 5/4, base_freq * 25/16, base_freq * 15/8],
-                [base_freq * 4/3, base_freq * 5/3, base_freq * 2]
-            ]
-        
+        progressions = chord_progression(base_freq, style)
         return progressions[measure % len(progressions)]
             
-    async def generate_music_async(self, request: GenerationRequest):
-        """Generate music based on text prompt"""
+    async def generate_music_async(self, request: GenerationRequest, audio_format: str = "json"):
+        """Generate music based on text prompt
+
+        The "json" format returns the base64 WAV payload; any other format
+        returns {"body", "media_type", "headers"} for a binary response.
+        """
+        REQUESTS_STARTED["generate"].inc()
         try:
             model_data = await self.load_model_async()
             
             if model_data is None:
                 raise Exception("Model failed to load")
             
-            # Load LoRA adapter if specified
-            if request.lora_model:
-                self.load_lora_adapter(f"./lora_models/{request.lora_model}")
+            # Deterministic requests are served from the result cache
+            model_type = "real" if model_data["model"] != "advanced_mock" else "advanced_simulation"
+            key = None
+            if self.is_cacheable(request, model_type):
+                key = cache_key(request, model_type, audio_format)
+                cached = self.result_cache.lookup(key)
+                if cached is None:
+                    # The disk tier is read on the CPU pool, off the event loop
+                    on_disk = await self._run_cpu(self.result_cache.read_disk, key) if self.result_cache.cache_dir else None
+                    cached = self.result_cache.promote(key, on_disk)
+                if cached is not None:
+                    logger.info(f"⚡ Cache hit for: '{request.prompt}'")
+                    # Every response gets its own session; the cached payload carries none
+                    return self._with_generation_id(cached, self._create_session(request, model_type, None))
+            
+            # Real-model batches activate their adapter in the executor
+            if request.lora_model and model_data["model"] == "advanced_mock":
+                lora_applied = self.load_lora_adapter(request.lora_model)
+            else:
+                lora_applied = self.check_lora(request.lora_model, model_data)
             
             logger.info(f"🎵 Generating music for: '{request.prompt}' (duration: {request.duration}s, temp: {request.temperature})")
             
-            if model_data["model"] == "advanced_mock":
+            if model_data["model"] == "advanced_mock" and self.worker_pool is not None:
+                # Render the mock in a worker process
+                with STAGES["worker"].time():
+                    audio_data = await self.worker_pool.generate(request)
+                note = f"🤖 Generated using advanced AI simulation (LoRA: {request.lora_model or 'None'})"
+            elif model_data["model"] == "advanced_mock":
                 # Use advanced mock generation
-                audio_data = self.generate_advanced_audio(
+                audio_data = await self._run_cpu(
+                    self.generate_advanced_audio,
                     request.prompt, 
                     request.duration, 
                     request.temperature,
-                    request.lora_model
+                    request.lora_model,
+                    request.seed,
+                    stage="synthesize"
                 )
                 note = f"🤖 Generated using advanced AI simulation (LoRA: {request.lora_model or 'None'})"
             else:
-                # Use real MusicGen model
-                loop = asyncio.get_event_loop()
-                audio_data = await loop.run_in_executor(
-                    self.executor,
-                    self._generate_with_real_model,
-                    model_data,
-                    request
-                )
+                # Use real MusicGen model, batched with concurrent compatible requests
+                with STAGES["batch"].time():
+                    audio_data = await self.batcher.submit(request)
                 note = f"🚀 Generated using real MusicGen model (LoRA: {request.lora_model or 'None'})"
             
-            # Convert to WAV format
-            buffer = io.BytesIO()
-            with wave.open(buffer, 'wb') as wav_file:
-                wav_file.setnchannels(1)  # Mono
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(32000)
-                
-                # Convert float32 to int16
-                audio_int16 = (audio_data * 32767).astype(np.int16)
-                wav_file.writeframes(audio_int16.tobytes())
-            
-            buffer.seek(0)
-            
-            # Encode as base64
-            audio_b64 = base64.b64encode(buffer.read()).decode()
+            # In-process real batches return (audio, decoder state) for /continue
+            decoder_state = None
+            if isinstance(audio_data, tuple):
+                audio_data, decoder_state = audio_data
+            session = self._create_session(request, model_type, decoder_state)
+            AUDIO_SECONDS.inc(request.duration)
             
-            return {
-                "audio_data": audio_b64,
-                "sample_rate": 32000,
+            result = await self._run_cpu(self._encode_result, audio_data, audio_format, {
                 "duration": request.duration,
                 "prompt": request.prompt,
                 "note": note,
-                "model_type": "real" if model_data["model"] != "advanced_mock" else "advanced_simulation",
-                "lora_applied": request.lora_model is not None
-            }
+                "model_type": model_type,
+                "lora_applied": lora_applied,
+            })
             
+            if key is not None:
+                self.result_cache.store(key, result)
+                if self.result_cache.cache_dir:
+                    # The response need not wait for the disk copy
+                    self.cpu_executor.submit(self.result_cache.write_disk, key, result)
+            return self._with_generation_id(result, session)
+            
+        except UnsupportedFormat as e:
+            REQUEST_ERRORS["generate"].inc()
+            raise HTTPException(status_code=406, detail=str(e))
+        except LoraUnsupported as e:
+            REQUEST_ERRORS["generate"].inc()
+            raise HTTPException(status_code=422, detail=str(e))
+        except ModelNotReady:
+            REQUEST_ERRORS["generate"].inc()
+            raise
         except Exception as e:
+            REQUEST_ERRORS["generate"].inc()
             logger.error(f"❌ Error generating music: {e}")
             raise HTTPException(status_code=500, detail=f"Music generation failed: {str(e)}")
+        finally:
+            REQUESTS_FINISHED["generate"].inc()
+    
+    def _create_session(self, request: GenerationRequest, model_type: str, decoder_state):
+        """Keep what /continue needs to extend this generation, if it can be resumed"""
+        if model_type == "advanced_simulation":
+            # The mock resumes from its measure counter; the phase follows from it
+            state = {"next_measure": int(request.duration)}
+        elif decoder_state is not None:
+            state = decoder_state
+        else:
+            # Worker processes and long-form windows keep no decoder state
+            return None
+        return self.sessions.create(request, model_type, request.duration, state)
+    
+    @staticmethod
+    def _with_generation_id(result, session):
+        """Copy of a (possibly cached) result carrying this response's session id"""
+        generation_id = session.id if session else None
+        if "body" not in result:
+            return {**result, "generation_id": generation_id}
+        headers = dict(result["headers"])
+        if generation_id:
+            headers["X-Generation-Id"] = generation_id
+        return {**result, "headers": headers}
+    
+    @staticmethod
+    def _encode_result(audio_data, audio_format: str, info: dict):
+        """Base64 WAV plus `info` for "json", otherwise a binary body with the ids in headers"""
+        if audio_format == "json":
+            # Convert to WAV format and encode as base64
+            with STAGES["encode"].time():
+                wav = encode_wav(audio_data, 32000)
+            with STAGES["base64"].time():
+                encoded = base64.b64encode(wav)
+                del wav  # free the WAV before the str copy
+                audio_b64 = encoded.decode("ascii")
+            return {"audio_data": audio_b64, "sample_rate": 32000, **info}
+        
+        # Binary response built straight from the sample buffer
+        with STAGES["encode"].time():
+            body, media_type = encode_audio(audio_data, 32000, audio_format)
+        headers = audio_headers(32000, audio_format)
+        headers["X-Model-Type"] = info["model_type"]
+        if info.get("generation_id"):
+            headers["X-Generation-Id"] = info["generation_id"]
+        return {"body": body, "media_type": media_type, "headers": headers}
+    
+    async def continue_music_async(self, request: ContinuationRequest, audio_format: str = "json"):
+        """Extend an earlier generation by request.duration seconds from its saved state"""
+        session = self.sessions.get(request.generation_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired generation: {request.generation_id}")
+        
+        async with session.lock:
+            model_data = await self.load_model_async()
+            if model_data is None:
+                raise HTTPException(status_code=500, detail="Music generation failed: Model failed to load")
+            
+            original = session.request
+            offset = session.seconds
+            logger.info(f"🎵 Continuing '{original.prompt}' at {offset:g}s (+{request.duration}s)")
+            REQUESTS_STARTED["continue"].inc()
+            start = time.perf_counter()
+            try:
+                lora_applied = False
+                if session.model_type == "advanced_simulation":
+                    if original.lora_model:
+                        lora_applied = self.load_lora_adapter(original.lora_model)
+                    start_measure = session.state["next_measure"]
+                    # Seeded sessions stay deterministic per continuation point
+                    seed = [original.seed, start_measure] if original.seed is not None else None
+                    audio_data = await self._run_cpu(
+                        functools.partial(self.generate_advanced_audio, start_measure=start_measure),
+                        original.prompt,
+                        request.duration,
+                        original.temperature,
+                        original.lora_model,
+                        seed,
+                        stage="synthesize"
+                    )
+                    state = {"next_measure": start_measure + int(request.duration)}
+                    note = f"🤖 Continued using advanced AI simulation (LoRA: {original.lora_model or 'None'})"
+                else:
+                    if model_data["model"] == "advanced_mock":
+                        raise HTTPException(status_code=409, detail="Real-model session but the model is not loaded")
+                    lora_applied = self.check_lora(original.lora_model, model_data)
+                    loop = asyncio.get_event_loop()
+                    audio_data, state = await loop.run_in_executor(
+                        self.executor, self._continue_with_real_model, model_data, session, request.duration
+                    )
+                    note = f"🚀 Continued using real MusicGen model (LoRA: {original.lora_model or 'None'})"
+                self.sessions.advance(session, request.duration, state)
+                STAGES["continue"].observe(time.perf_counter() - start)
+                AUDIO_SECONDS.inc(request.duration)
+                
+                return await self._run_cpu(self._encode_result, audio_data, audio_format, {
+                    "duration": request.duration,
+                    "offset": offset,
+                    "prompt": original.prompt,
+                    "note": note,
+                    "model_type": session.model_type,
+                    "lora_applied": lora_applied,
+                    "generation_id": session.id,
+                })
+            except HTTPException:
+                REQUEST_ERRORS["continue"].inc()
+                raise
+            except UnsupportedFormat as e:
+                REQUEST_ERRORS["continue"].inc()
+                raise HTTPException(status_code=406, detail=str(e))
+            except LoraUnsupported as e:
+                REQUEST_ERRORS["continue"].inc()
+                raise HTTPException(status_code=422, detail=str(e))
+            except Exception as e:
+                REQUEST_ERRORS["continue"].inc()
+                logger.error(f"❌ Error continuing music: {e}")
+                raise HTTPException(status_code=500, detail=f"Music continuation failed: {str(e)}")
+            finally:
+                REQUESTS_FINISHED["continue"].inc()
+    
+    async def _run_cpu(self, fn, *args, stage: str = None):
+        """Run a CPU-bound step on the CPU pool, timed under `stage` when given"""
+        def run():
+            if stage is None:
+                return fn(*args)
+            with STAGES[stage].time():
+                return fn(*args)
+        return await asyncio.get_event_loop().run_in_executor(self.cpu_executor, run)
+    
+    async def _run_job(self, job):
+        """Job queue entry point: the same generation path as /generate"""
+        # Queued jobs wait out a model load rather than failing
+        await self.load_model_async(park=True)
+        return await self.generate_music_async(job.request, job.format)
+    
+    def is_cacheable(self, request: GenerationRequest, model_type: str):
+        """Seeded requests and noise-free mock renders always produce the same audio
+        
+        In-process real-model results are not cached while /continue sessions
+        are on: a cache hit would have no decoder state to resume from.
+        """
+        if model_type == "real" and self.sessions.enabled and self.worker_pool is None:
+            return False
+        if request.seed is not None:
+            return True
+        return model_type == "advanced_simulation" and request.temperature <= 1.0
+    
+    async def stream_music_async(self, model_data, request: GenerationRequest, slot=None):
+        """Yield a WAV header followed by 16-bit PCM blocks as soon as each is ready
+        
+        `slot` is the admission slot held for the stream and released when it ends.
+        """
+        sample_rate = 32000
+        REQUESTS_STARTED["stream"].inc()
+        try:
+            header = wav_header(sample_rate, int(request.duration * sample_rate))
+            BYTES_EMITTED.inc(len(header))
+            yield header
+            
+            loop = asyncio.get_event_loop()
+            if model_data["model"] == "advanced_mock":
+                # Render measure by measure off the event loop
+                plan = SynthesisPlan.from_prompt(request.prompt, request.lora_model)
+                blocks = self.synth.stream(plan, request.duration, request.temperature, request.seed)
+                while True:
+                    block = await loop.run_in_executor(self.cpu_executor, self._next_pcm16, blocks)
+                    if block is None:
+                        break
+                    BYTES_EMITTED.inc(len(block))
+                    yield block
+            elif is_longform(request.duration) and self.worker_pool is None:
+                # Each window is sent as soon as it is final
+                remaining = int(request.duration * sample_rate)
+                async for window in self._stream_windows(request):
+                    window = window[:remaining]
+                    remaining -= len(window)
+                    for block in iter_pcm16_blocks(window, sample_rate):
+                        BYTES_EMITTED.inc(len(block))
+                        yield block
+                if remaining > 0:
+                    # Pad a short final window to the length promised in the header
+                    block = pcm16_bytes(np.zeros(remaining, dtype=np.float32))
+                    BYTES_EMITTED.inc(len(block))
+                    yield block
+            else:
+                # The real model decodes audio only once all tokens are generated
+                with STAGES["batch"].time():
+                    audio_data = await self.batcher.submit(request)
+                if isinstance(audio_data, tuple):
+                    audio_data = audio_data[0]
+                for block in iter_pcm16_blocks(audio_data, sample_rate):
+                    BYTES_EMITTED.inc(len(block))
+                    yield block
+            AUDIO_SECONDS.inc(request.duration)
+        except Exception:
+            REQUEST_ERRORS["stream"].inc()
+            raise
+        finally:
+            REQUESTS_FINISHED["stream"].inc()
+            if slot is not None:
+                slot.release()
+    
+    async def _stream_windows(self, request: GenerationRequest):
+        """Long-form windows for one request, produced in a single executor task
+        
+        The whole run holds the model executor, as a one-shot generation would,
+        so no other batch can swap the adapter or reseed torch between windows.
+        """
+        loop = asyncio.get_event_loop()
+        windows = asyncio.Queue()
+        stopped = threading.Event()
+        
+        def produce():
+            try:
+                for window in self._generate_windowed(self.model, [request]):
+                    loop.call_soon_threadsafe(windows.put_nowait, window[0])
+                    if stopped.is_set():
+                        break  # the client went away
+            finally:
+                loop.call_soon_threadsafe(windows.put_nowait, None)
+        
+        producer = loop.run_in_executor(self.executor, produce)
+        try:
+            while (window := await windows.get()) is not None:
+                yield window
+            await producer  # re-raise a failed window
+        finally:
+            stopped.set()
+    
+    @staticmethod
+    def _next_pcm16(blocks):
+        """Render and convert the next streamed block, or None when done"""
+        block = next(blocks, None)
+        return None if block is None else pcm16_bytes(block)
+    
+    def _run_real_batch(self, requests):
+        """Executor entry point for the batch scheduler: (audio, decoder state) per request"""
+        states = [] if self.sessions.enabled else None
+        audio = self._generate_batch_with_real_model(self.model, requests, states)
+        return list(zip(audio, states or [None] * len(audio)))
     
     def _generate_with_real_model(self, model_data, request):
         """Generate with real MusicGen model"""
+        return self._generate_batch_with_real_model(model_data, [request])[0]
+    
+    def _generate_batch_with_real_model(self, model_data, requests, states=None):
+        """Generate requests sharing sampling params in one padded MusicGen call
+        
+        When `states` is a list, each request's resume state for /continue is
+        appended to it.
+        """
         try:
+            import torch
+            
             model = model_data["model"]
             processor = model_data["processor"]
+            params = requests[0]
             
-            # Process the prompt
-            inputs = processor(
-                text=[request.prompt],
-                padding=True,
-                return_tensors="pt"
-            )
+            if is_longform(max(request.duration for request in requests)):
+                # Bounded windows instead of one run over the whole clip; they keep no /continue state
+                if states is not None:
+                    states.extend([None] * len(requests))
+                audio_values = np.concatenate(list(self._generate_windowed(model_data, requests)), axis=-1)
+                with STAGES["postprocess"].time():
+                    return [self._fit_duration(audio_values[i], request.duration) for i, request in enumerate(requests)]
+            
+            # Batches share one lora_model, so one adapter swap covers them all
+            self._use_lora(params.lora_model)
+            model = model_data["model"]
+            
+            # Token ids and T5 states per prompt, padded to the longest; only cache misses are encoded
+            with STAGES["conditioning"].time(), self.cpu_profile.context():
+                inputs = self.text_cache.encode(model, processor, [request.prompt for request in requests], self.device)
             
-            # Move to device
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            # Seeded requests always run as a batch of one
+            if params.seed is not None:
+                torch.manual_seed(params.seed)
             
-            # Generate
-            with torch.no_grad():
+            # Keep the sampled codes and KV cache when the caller wants resume states
+            recorder = CodeRecorder() if states is not None else None
+            resume_kwargs = {"return_dict_in_generate": True, "stopping_criteria": [recorder]} if recorder else {}
+            
+            # Generate enough tokens for the longest request in the batch
+            max_new_tokens = int(max(request.duration for request in requests) * 50)  # Approximate tokens per second
+            start = time.perf_counter()
+            with self.cpu_profile.context():
                 audio_values = model.generate(
-                    **inputs,
-                    max_new_tokens=int(request.duration * 50),  # Approximate tokens per second
+                    **generation_inputs(model, inputs),
+                    max_new_tokens=max_new_tokens,
                     do_sample=True,
-                    temperature=request.temperature,
-                    top_k=request.top_k,
-                    top_p=request.top_p if request.top_p > 0 else None
+                    temperature=params.temperature,
+                    top_k=params.top_k,
+                    top_p=params.top_p if params.top_p > 0 else None,
+                    **resume_kwargs
                 )
+            elapsed = time.perf_counter() - start
+            STAGES["generate"].observe(elapsed)
+            TOKENS_GENERATED.inc(max_new_tokens * len(requests))
+            self.tokens_per_second = max_new_tokens * len(requests) / elapsed if elapsed > 0 else None
             
-            # Convert to numpy
-            audio_data = audio_values[0, 0].cpu().numpy()
-            
-            # Ensure correct duration
-            target_samples = int(request.duration * 32000)
-            if len(audio_data) > target_samples:
-                audio_data = audio_data[:target_samples]
-            elif len(audio_data) < target_samples:
-                # Pad with silence
-                padding = np.zeros(target_samples - len(audio_data))
-                audio_data = np.concatenate([audio_data, padding])
+            if recorder is not None:
+                outputs, audio_values = audio_values, audio_values.sequences
+                try:
+                    states.extend(self._resume_states(model, inputs, outputs, recorder, requests))
+                except Exception as e:
+                    logger.warning(f"Could not keep decoder state for /continue: {e}")
             
-            return audio_data
+            # Split back per request and trim each to its own duration
+            with STAGES["postprocess"].time():
+                return [
+                    self._fit_duration(audio_values[i, 0].cpu().numpy(), request.duration)
+                    for i, request in enumerate(requests)
+                ]
             
         except Exception as e:
+            # No mock fallback: simulated audio must not be reported, or cached, as the real model's
             logger.error(f"Real model generation failed: {e}")
-            # Fallback to advanced mock
-            return self.generate_advanced_audio(
-                request.prompt, 
-                request.duration, 
-                request.temperature,
-                request.lora_model
+            raise
+    
+    def _generate_windowed(self, model_data, requests):
+        """Yield finished (batch, samples) audio window by window for a long-form batch (see longform.py)"""
+        import torch
+        
+        params = requests[0]
+        self._use_lora(params.lora_model)
+        model = model_data["model"]
+        num_codebooks = model.decoder.num_codebooks
+        
+        with STAGES["conditioning"].time(), self.cpu_profile.context():
+            inputs = self.text_cache.encode(model, model_data["processor"], [request.prompt for request in requests], self.device)
+        if params.seed is not None:
+            torch.manual_seed(params.seed)
+        
+        def run_window(prompt_codes, new_frames):
+            recorder = CodeRecorder()
+            prompt = {}
+            if prompt_codes is not None:
+                prompt["decoder_input_ids"] = prompt_codes.reshape(-1, prompt_codes.shape[-1]).to(self.device)
+            # The last codebook lags the first by num_codebooks - 1 steps
+            max_new_tokens = new_frames + num_codebooks - 1
+            start = time.perf_counter()
+            with self.cpu_profile.context():
+                outputs = model.generate(
+                    **generation_inputs(model, inputs),
+                    **prompt,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=True,
+                    temperature=params.temperature,
+                    top_k=params.top_k,
+                    top_p=params.top_p if params.top_p > 0 else None,
+                    return_dict_in_generate=True,
+                    stopping_criteria=[recorder]
+                )
+            elapsed = time.perf_counter() - start
+            STAGES["generate"].observe(elapsed)
+            TOKENS_GENERATED.inc(max_new_tokens * len(requests))
+            self.tokens_per_second = max_new_tokens * len(requests) / elapsed if elapsed > 0 else None
+            # Only the audio and codes leave; the window's KV cache is dropped here
+            return outputs.sequences[:, 0].cpu().numpy(), undelay_codes(recorder.input_ids, num_codebooks)
+        
+        duration = max(request.duration for request in requests)
+        yield from generate_windows(run_window, duration, model.config.audio_encoder.frame_rate)
+    
+    @staticmethod
+    def _resume_states(model, inputs, outputs, recorder, requests):
+        """Per-request codes and decoder KV cache, cut at each request's own duration"""
+        codes = undelay_codes(recorder.input_ids, model.decoder.num_codebooks)
+        frame_rate = model.config.audio_encoder.frame_rate
+        states = []
+        for i, request in enumerate(requests):
+            frames = min(codes.shape[-1], int(request.duration * frame_rate))
+            states.append({
+                "codes": codes[i, :, :frames].clone(),
+                "past_key_values": slice_past(outputs.past_key_values, i, len(requests), frames),
+                # Cross-attention entries in the cache span the batch's padded prompt length
+                "text_length": inputs["attention_mask"].shape[-1],
+            })
+        return states
+    
+    def _continue_with_real_model(self, model_data, session, seconds):
+        """Resume a session's decoder from its KV cache; returns (new audio, new state)
+        
+        The saved codes are passed back as decoder input and the cache covers
+        all of them but the last, so generate() only runs the last prompt
+        position and the new tokens. EnCodec decodes the whole sequence so the
+        new audio joins the old without a seam.
+        """
+        import torch
+        
+        request, state = session.request, session.state
+        self._use_lora(request.lora_model)
+        model = model_data["model"]
+        num_codebooks = model.decoder.num_codebooks
+        frame_rate = model.config.audio_encoder.frame_rate
+        prefix = state["codes"].shape[-1]
+        new_frames = int(seconds * frame_rate)
+        
+        if request.seed is not None:
+            torch.manual_seed(request.seed + session.continuations + 1)
+        
+        recorder = CodeRecorder()
+        with self.cpu_profile.context():
+            conditioning = self.text_cache.encode(
+                model, model_data["processor"], [request.prompt], self.device, pad_to=state["text_length"]
+            )
+            outputs = model.generate(
+                **generation_inputs(model, conditioning),
+                decoder_input_ids=state["codes"].to(self.device),
+                past_key_values=state["past_key_values"],
+                # The last codebook lags the first by num_codebooks - 1 steps
+                max_new_tokens=new_frames + num_codebooks - 1,
+                do_sample=True,
+                temperature=request.temperature,
+                top_k=request.top_k,
+                top_p=request.top_p if request.top_p > 0 else None,
+                return_dict_in_generate=True,
+                stopping_criteria=[recorder]
             )
+        
+        codes = undelay_codes(recorder.input_ids, num_codebooks)[0]
+        frames = min(codes.shape[-1], prefix + new_frames)
+        audio = outputs.sequences[0, 0]
+        samples_per_frame = audio.shape[-1] / codes.shape[-1]
+        audio_data = self._fit_duration(audio[int(prefix * samples_per_frame):].cpu().numpy(), seconds)
+        new_state = dict(
+            state,
+            codes=codes[:, :frames].clone(),
+            past_key_values=slice_past(outputs.past_key_values, 0, 1, frames),
+        )
+        return audio_data, new_state
+    
+    @staticmethod
+    def _fit_duration(audio_data, duration):
+        """Ensure correct duration by trimming or padding with silence"""
+        target_samples = int(duration * 32000)
+        if len(audio_data) > target_samples:
+            audio_data = audio_data[:target_samples]
+        elif len(audio_data) < target_samples:
+            padding = np.zeros(target_samples - len(audio_data), dtype=audio_data.dtype)
+            audio_data = np.concatenate([audio_data, padding])
+        return audio_data
 
 # Global service instance
 music_service = MusicGenService()
 
+def register_service_metrics(service: MusicGenService):
+    """Scrape-time gauges over the service's model state, queues and caches"""
+    REGISTRY.gauge("harmonix_model_loaded", "1 once the model is loaded", lambda: service.model is not None)
+    REGISTRY.gauge("harmonix_model_loading", "1 while the model is loading", lambda: service.model_loading)
+    REGISTRY.gauge("harmonix_model_load_parked", "Requests waiting for the model load to finish",
+                   lambda: service.loader.parked)
+    REGISTRY.counter_func("harmonix_model_load_rejected_total", "Requests turned away with 503 while the model loaded",
+                          lambda: service.loader.rejected + service.loader.timeouts)
+    REGISTRY.gauge("harmonix_executor_queue_depth", "Tasks waiting for the model executor thread",
+                   lambda: service.executor._work_queue.qsize())
+    REGISTRY.gauge("harmonix_cpu_executor_queue_depth", "Synthesis and encoding tasks waiting for a CPU thread",
+                   lambda: service.cpu_executor._work_queue.qsize())
+    REGISTRY.gauge("harmonix_admission_in_flight", "Admitted generations not yet finished",
+                   lambda: service.admission.in_flight)
+    REGISTRY.counter_func("harmonix_admission_rejected_total", "Requests turned away with 503 at capacity",
+                          lambda: service.admission.rejected)
+    for endpoint in ENDPOINTS:
+        REGISTRY.gauge("harmonix_in_flight_requests", "Requests started but not finished",
+                       lambda e=endpoint: REQUESTS_STARTED[e].value - REQUESTS_FINISHED[e].value, endpoint=endpoint)
+    REGISTRY.gauge("harmonix_tokens_per_second", "Token throughput of the last in-process batch",
+                   lambda: service.tokens_per_second)
+    REGISTRY.gauge("harmonix_batch_pending", "Requests waiting to join a batch",
+                   lambda: sum(len(group) for group in service.batcher.pending.values()))
+    REGISTRY.gauge("harmonix_jobs_queued", "Jobs waiting for a runner", lambda: service.jobs.queued)
+    REGISTRY.gauge("harmonix_sessions", "Resumable sessions held for /continue", lambda: len(service.sessions.sessions))
+    REGISTRY.gauge("harmonix_sessions_bytes", "Bytes held by session resume states", lambda: service.sessions.bytes_used)
+    REGISTRY.gauge("harmonix_lora_resident", "LoRA adapters resident in memory", lambda: len(service.lora_registry))
+    cache = service.result_cache
+    REGISTRY.gauge("harmonix_cache_entries", "Results in the in-memory cache", lambda: len(cache.entries))
+    REGISTRY.gauge("harmonix_cache_bytes", "Bytes held by the in-memory cache", lambda: cache.bytes_used)
+    REGISTRY.counter_func("harmonix_cache_hits_total", "Result cache hits", lambda: cache.hits, tier="memory")
+    REGISTRY.counter_func("harmonix_cache_hits_total", "Result cache hits", lambda: cache.disk_hits, tier="disk")
+    REGISTRY.counter_func("harmonix_cache_misses_total", "Result cache misses", lambda: cache.misses)
+    REGISTRY.counter_func("harmonix_cache_evictions_total", "Result cache evictions", lambda: cache.evictions)
+    text_cache = service.text_cache
+    REGISTRY.counter_func("harmonix_text_cache_hits_total", "Prompts served from the text-conditioning cache",
+                          lambda: text_cache.hits)
+    REGISTRY.counter_func("harmonix_text_cache_misses_total", "Prompts run through the text encoder",
+                          lambda: text_cache.misses)
+    REGISTRY.gauge("harmonix_text_cache_entries", "Prompts in the text-conditioning cache", lambda: len(text_cache.entries))
+    REGISTRY.counter_func("harmonix_text_encoder_seconds_saved_total", "Estimated text encoder time saved by cache hits",
+                          lambda: text_cache.saved_seconds)
+    REGISTRY.gauge("harmonix_wavetable_bytes", "Bytes of pre-rendered wavetable segments", lambda: service.synth.bytes_used)
+    if service.worker_pool is not None:
+        REGISTRY.gauge("harmonix_worker_in_flight", "Calls running in worker processes",
+                       lambda: service.worker_pool.in_flight)
+
+register_service_metrics(music_service)
+
+def _unavailable(error):
+    """503 with Retry-After for an Overloaded or ModelNotReady error"""
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+def _audio_response(result, audio_format: str):
+    """The JSON payload or a binary Response for a generation result, counting the bytes sent"""
+    if audio_format == "json":
+        BYTES_EMITTED.inc(len(result["audio_data"]))
+        return Response(content=json_body(result), media_type="application/json")
+    BYTES_EMITTED.inc(len(result["body"]))
+    return Response(content=memoryview(result["body"]), media_type=result["media_type"], headers=result["headers"])
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the model on startup"""
     logger.info("🎵 Starting HarmoniX MusicGen LoRA API...")
-    # Start loading the model in the background
-    asyncio.create_task(music_service.load_model_async())
+    # Start loading the model in the background; lazy/mock modes wait for the first request
+    if MODEL_MODE == "eager":
+        music_service.loader.start()
+    music_service.jobs.start()
+    # Optionally pre-render the mock wavetable (HARMONIX_WAVETABLE_WARM_SECONDS)
+    asyncio.get_event_loop().run_in_executor(None, music_service.synth.warm)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop job runners and worker processes, if any"""
+    await music_service.jobs.stop()
+    if music_service.worker_pool is not None:
+        music_service.worker_pool.shutdown()
 
 @app.get("/")
 async def root():
@@ -383,23 +911,177 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "device": music_service.device,
+        "device": music_service._device,  # None until the real-model path resolves it
         "model_loaded": music_service.model is not None,
         "model_loading": music_service.model_loading,
-        "lora_adapters": len(music_service.lora_adapters),
+        "model_mode": MODEL_MODE,
+        "model_load_seconds": music_service.model_load_seconds,
+        "loader": music_service.loader.stats(),
+        "cpu_profile": music_service.cpu_profile.stats(),
+        "lora_adapters": len(music_service.lora_registry),
+        "lora": music_service.lora_registry.stats(),
+        "batching": music_service.batcher.stats(),
+        "cache": music_service.result_cache.stats(),
+        "wavetable": music_service.synth.stats(),
+        "workers": music_service.worker_pool.stats() if music_service.worker_pool else None,
+        "jobs": music_service.jobs.stats(),
+        "sessions": music_service.sessions.stats(),
+        "admission": music_service.admission.stats(),
+        "text_cache": music_service.text_cache.stats(),
         "service": "HarmoniX MusicGen LoRA API"
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """200 once the model is loaded, 503 until then, for load balancer routing
+    
+    /health only says the process is up. A probe that finds no model starts
+    the load, so lazy and mock modes warm up as soon as they are probed; after
+    a failed load it reports the error until the retry backoff has passed.
+    """
+    if music_service.model is None:
+        music_service.loader.start()
+        raise _unavailable(music_service.loader.not_ready())
+    return {"status": "ready", "model_mode": MODEL_MODE, "model_load_seconds": music_service.model_load_seconds}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of stage latencies, throughput, queues and caches"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.post("/generate")
-async def generate_music(request: GenerationRequest):
-    """Generate music from text prompt using MusicGen + LoRA"""
+async def generate_music(request: GenerationRequest, http_request: Request):
+    """Generate music from text prompt using MusicGen + LoRA
+    
+    The response format comes from the `format` field or the Accept header;
+    without either the base64 JSON payload is returned.
+    """
+    try:
+        audio_format = negotiate_format(request.format, http_request.headers.get("accept"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    
     try:
-        result = await music_service.generate_music_async(request)
-        return result
+        with music_service.admission.acquire():
+            result = await music_service.generate_music_async(request, audio_format)
+        return _audio_response(result, audio_format)
+    except (Overloaded, ModelNotReady) as e:
+        raise _unavailable(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/continue")
+async def continue_music(request: ContinuationRequest, http_request: Request):
+    """Extend an earlier generation by `duration` seconds
+    
+    `generation_id` comes from a /generate response (or its X-Generation-Id
+    header). The returned audio covers only the new seconds and starts where
+    the previous clip ended; the id stays valid for further continuations.
+    """
+    try:
+        audio_format = negotiate_format(request.format, http_request.headers.get("accept"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    
+    try:
+        with music_service.admission.acquire():
+            result = await music_service.continue_music_async(request, audio_format)
+    except (Overloaded, ModelNotReady) as e:
+        raise _unavailable(e)
+    return _audio_response(result, audio_format)
+
+@app.post("/generate/stream")
+async def generate_music_stream(request: GenerationRequest):
+    """Stream generated music as a chunked WAV response"""
+    try:
+        slot = music_service.admission.acquire()
+    except Overloaded as e:
+        raise _unavailable(e)
+    try:
+        model_data = await music_service.load_model_async()
+        if model_data is None:
+            raise HTTPException(status_code=500, detail="Music generation failed: Model failed to load")
+        
+        if request.lora_model and model_data["model"] == "advanced_mock":
+            music_service.load_lora_adapter(request.lora_model)
+        else:
+            music_service.check_lora(request.lora_model, model_data)
+    except ModelNotReady as e:
+        slot.release()
+        raise _unavailable(e)
+    except LoraUnsupported as e:
+        slot.release()
+        raise HTTPException(status_code=422, detail=str(e))
+    except BaseException:
+        slot.release()
+        raise
+    
+    logger.info(f"🎵 Streaming music for: '{request.prompt}' (duration: {request.duration}s, temp: {request.temperature})")
+    body = music_service.stream_music_async(model_data, request, slot)
+    # The generator releases the slot when it ends. A client gone before the first chunk never
+    # starts it, so the background task releases it too; if the response is never sent at all,
+    # the finalizer hands the release back to the event loop, whichever thread collects `body`
+    weakref.finalize(body, slot.release_soon, asyncio.get_running_loop())
+    return StreamingResponse(body, media_type="audio/wav", background=BackgroundTask(slot.release))
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: GenerationRequest, http_request: Request, priority: int = 0):
+    """Queue a generation and return its job id immediately
+    
+    Lower `priority` values run first. Clients are identified by the
+    X-Client-Id header, falling back to the peer address.
+    """
+    try:
+        audio_format = negotiate_format(request.format, http_request.headers.get("accept"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    
+    client = http_request.headers.get("x-client-id") or (http_request.client.host if http_request.client else "unknown")
+    try:
+        job = await music_service.jobs.submit(request, client, priority, audio_format)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    
+    logger.info(f"🗂️ Queued job {job.id} for: '{request.prompt}' (priority: {priority})")
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+def _get_job(job_id: str):
+    job = music_service.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status and progress, with the result inline for JSON jobs"""
+    job = _get_job(job_id)
+    info = music_service.jobs.describe(job)
+    if job.status == "succeeded":
+        if job.format == "json":
+            info["result"] = job.result
+        else:
+            info["result_url"] = f"/jobs/{job.id}/result"
+    return info
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Finished job output in the format it was submitted with"""
+    job = _get_job(job_id)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return _audio_response(job.result, job.format)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = music_service.jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return music_service.jobs.describe(job)
+
 @app.get("/models")
 async def list_available_models():
     """List available LoRA models"""
@@ -423,11 +1105,14 @@ async def list_available_models():
 
 @app.get("/lora/{model_name}")
 async def get_lora_info(model_name: str):
-    """Get information about a specific LoRA model"""
+    """Get information about a specific LoRA model, including load and swap timings"""
+    info = music_service.lora_registry.info(model_name)
     return {
         "model_name": model_name,
-        "status": "available" if model_name in music_service.lora_adapters else "not_loaded",
-        "config": music_service.lora_adapters.get(model_name, {}),
+        "status": info["status"],
+        "config": info["config"],
+        "bytes": info["bytes"],
+        "stats": info["stats"],
         "description": f"LoRA fine-tuned model for {model_name.replace('-lora', '')} music generation"
     }
 
@@ -0,0 +1,88 @@
+"""
+Windowed long-form generation for the transformers MusicGen model.
+
+One generate() call over a multi-minute clip attends over, and caches keys
+and values for, every earlier frame, so each step gets slower and the KV
+cache grows with the duration. Clips longer than
+HARMONIX_LONGFORM_WINDOW_SECONDS are generated in windows instead: each
+window is prompted with the last HARMONIX_LONGFORM_CONTEXT_SECONDS of codes
+from the one before and adds the rest of the window as new frames, so step
+cost and cache size are bounded by the window, not the clip.
+
+generate() decodes the prompt codes again along with the new ones. The two
+renderings of the context are crossfaded over its last
+HARMONIX_LONGFORM_CROSSFADE_SECONDS, where the new decode has had time to
+settle, and the new frames then follow on from the same decode without a
+seam. MusicGen's delay pattern also resamples the last few prompt frames of
+the higher codebooks; those sit inside the crossfade too.
+HARMONIX_LONGFORM_WINDOW_SECONDS=0 turns windowing off.
+"""
+
+import os
+
+import numpy as np
+
+# MusicGen is trained on 30 s excerpts
+WINDOW_SECONDS = float(os.environ.get("HARMONIX_LONGFORM_WINDOW_SECONDS", "30"))
+CONTEXT_SECONDS = float(os.environ.get("HARMONIX_LONGFORM_CONTEXT_SECONDS", "10"))
+CROSSFADE_SECONDS = float(os.environ.get("HARMONIX_LONGFORM_CROSSFADE_SECONDS", "1"))
+
+
+def is_longform(duration: float, window_seconds: float = WINDOW_SECONDS):
+    """Whether a clip of `duration` seconds is generated in windows"""
+    return window_seconds > 0 and duration > window_seconds
+
+
+def crossfade(previous, current):
+    """Linear blend from previous into current along the last axis
+
+    The two sides decode the same codes, so they are correlated and a linear
+    ramp keeps the level constant where an equal-power one would bulge.
+    """
+    length = min(previous.shape[-1], current.shape[-1])
+    ramp = np.linspace(0.0, 1.0, length, endpoint=False, dtype=np.float32)
+    return previous[..., :length] * (1 - ramp) + current[..., :length] * ramp
+
+
+def generate_windows(run_window, duration: float, frame_rate: float, window_seconds: float = WINDOW_SECONDS,
+                     context_seconds: float = CONTEXT_SECONDS, crossfade_seconds: float = CROSSFADE_SECONDS):
+    """Yield finished (batch, samples) audio blocks, one per window, covering `duration` seconds
+
+    run_window(prompt_codes, new_frames) generates one window and returns
+    (audio, codes): the decoded (batch, samples) audio of prompt plus new
+    frames and their (batch, codebooks, frames) codes. prompt_codes is None for
+    the first window. A block is only yielded once nothing later changes it,
+    so the last crossfade_seconds of each window wait for the next one.
+    """
+    window = max(1, int(window_seconds * frame_rate))
+    context = min(int(context_seconds * frame_rate), window - 1)
+    fade = min(int(crossfade_seconds * frame_rate), context)
+    total = int(duration * frame_rate)
+
+    generated = 0
+    prompt = None
+    held = None  # audio of the current window's last `fade` frames, blended into the next window
+    while generated < total:
+        prompt_frames = 0 if prompt is None else prompt.shape[-1]
+        new_frames = min(window - prompt_frames, total - generated)
+        audio, codes = run_window(prompt, new_frames)
+        samples_per_frame = audio.shape[-1] / codes.shape[-1]
+        generated += new_frames
+
+        if prompt_frames:
+            # The window re-renders its prompt first; only audio after it is new
+            stop = int(prompt_frames * samples_per_frame)
+            blocks = [audio[:, stop:]]
+            if held is not None:
+                start = int((prompt_frames - fade) * samples_per_frame)
+                blocks.insert(0, crossfade(held, audio[:, start:stop]))
+            audio = np.concatenate(blocks, axis=-1)
+
+        prompt = codes[:, :, codes.shape[-1] - context:] if context else None
+        if generated < total and fade:
+            keep = int(fade * samples_per_frame)
+            held = audio[:, audio.shape[-1] - keep:]
+            audio = audio[:, :audio.shape[-1] - keep]
+        else:
+            held = None
+        yield audio
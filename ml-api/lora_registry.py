@@ -0,0 +1,249 @@
+"""
+LoRA adapter registry with hot-swap and LRU eviction.
+
+Each adapter's weights are loaded from disk once and kept resident, up to a
+maximum count and memory budget. Activating an adapter for a request only
+switches the active adapter on the already wrapped model; the least recently
+used adapter is unloaded when the registry is full. Merged artifacts from
+merge_lora.py count against the same budget at their full checkpoint size.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from merge_lora import is_merged_artifact, read_merged_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ADAPTERS = int(os.environ.get("HARMONIX_LORA_MAX_ADAPTERS", "4"))
+DEFAULT_MAX_BYTES = int(float(os.environ.get("HARMONIX_LORA_MAX_MB", "512")) * 1024 * 1024)
+
+DEFAULT_LORA_CONFIG = {"r": 16, "alpha": 32, "target_modules": ["q_proj", "v_proj"]}
+
+
+class LoraUnsupported(Exception):
+    """The loaded model cannot take this adapter (e.g. a PEFT adapter on an int8 model)"""
+
+
+def adapter_size(path: str):
+    """Bytes of adapter weights on disk, used as the resident-memory estimate"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def adapter_config(path: str):
+    """Read adapter_config.json when present, falling back to the default LoRA config"""
+    config_path = os.path.join(path, "adapter_config.json")
+    try:
+        with open(config_path, "r") as f:
+            config = json.load(f)
+        return {"r": config.get("r"), "alpha": config.get("lora_alpha"), "target_modules": config.get("target_modules")}
+    except (OSError, ValueError):
+        return dict(DEFAULT_LORA_CONFIG)
+
+
+class SimulatedBackend:
+    """Bookkeeping-only backend for the mock synthesizer, which applies LoRA by name"""
+
+    def load(self, name, path):
+        return adapter_config(path)
+
+    def activate(self, name):
+        pass
+
+    def deactivate(self):
+        pass
+
+    def unload(self, name):
+        pass
+
+
+class PeftBackend:
+    """Hot-swaps PEFT LoRA adapters on a single wrapped torch module
+
+    With load_merged, directories written by merge_lora.py are loaded as whole
+    modules with the adapter already folded into the weights, and activating
+    one swaps the module itself instead of routing through the PEFT wrapper.
+    peft_supported=False (an int8-quantized model) accepts merged artifacts only.
+    """
+
+    def __init__(self, get_model, set_model, load_merged=None, peft_supported: bool = True):
+        # get_model()/set_model(module) read and replace the module that gets wrapped
+        self.get_model = get_model
+        self.set_model = set_model
+        self.load_merged = load_merged
+        self.peft_supported = peft_supported
+        self.base_model = None
+        self.peft_model = None
+        self.merged = {}  # name -> merged module
+
+    def load(self, name, path):
+        if self.base_model is None:
+            self.base_model = self.get_model()
+        if self.load_merged is not None and is_merged_artifact(path):
+            self.merged[name] = self.load_merged(path)
+            return {"merged": True, **read_merged_config(path)}
+        if not self.peft_supported:
+            raise LoraUnsupported(f"PEFT adapters cannot wrap quantized layers; merge {name} with merge_lora.py")
+
+        from peft import PeftModel
+
+        if self.peft_model is None:
+            self.peft_model = PeftModel.from_pretrained(self.base_model, path, adapter_name=name)
+        else:
+            self.peft_model.load_adapter(path, adapter_name=name)
+        return adapter_config(path)
+
+    def activate(self, name):
+        if name in self.merged:
+            self.set_model(self.merged[name])
+            return
+        self.set_model(self.peft_model)
+        self.peft_model.base_model.enable_adapter_layers()
+        self.peft_model.set_adapter(name)
+
+    def deactivate(self):
+        if self.peft_model is not None:
+            self.peft_model.base_model.disable_adapter_layers()
+        if self.base_model is not None:
+            self.set_model(self.base_model)
+
+    def unload(self, name):
+        if self.merged.pop(name, None) is None:
+            self.peft_model.delete_adapter(name)
+
+
+class LoraRegistry:
+    """Keep up to max_adapters LoRA adapters resident and switch between them per request"""
+
+    def __init__(self, backend=None, max_adapters: int = DEFAULT_MAX_ADAPTERS, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.backend = backend or SimulatedBackend()
+        self.max_adapters = max(1, max_adapters)
+        self.max_bytes = max_bytes
+        self.resident = OrderedDict()  # name -> {"config", "bytes"}
+        self.adapter_stats = {}  # name -> counters, kept after eviction
+        self.active = None
+        self.bytes_used = 0
+        self.lock = threading.Lock()
+
+    def use_backend(self, backend):
+        """Switch backends (e.g. once the real model has loaded), dropping resident adapters"""
+        with self.lock:
+            self.backend = backend
+            self.resident.clear()
+            self.bytes_used = 0
+            self.active = None
+
+    def activate(self, name: str, path: str):
+        """Make `name` the active adapter, loading it from `path` the first time"""
+        with self.lock:
+            stats = self.adapter_stats.setdefault(name, {
+                "loads": 0, "load_seconds": 0.0, "last_load_seconds": 0.0, "activations": 0,
+                "swaps": 0, "swap_seconds": 0.0, "last_swap_seconds": 0.0, "evictions": 0,
+            })
+            if name == self.active:
+                stats["activations"] += 1
+                self.resident.move_to_end(name)
+                return True
+
+            if name not in self.resident:
+                if not os.path.exists(path):
+                    logger.warning(f"LoRA adapter not found: {path}")
+                    self._deactivate()
+                    return False
+                try:
+                    self._load(name, path, stats)
+                except Exception as e:
+                    logger.error(f"❌ Failed to load LoRA adapter: {e}")
+                    self._deactivate()
+                    return False
+
+            start = time.perf_counter()
+            self.backend.activate(name)
+            elapsed = time.perf_counter() - start
+            self.active = name
+            self.resident.move_to_end(name)
+            stats["activations"] += 1
+            stats["swaps"] += 1
+            stats["swap_seconds"] += elapsed
+            stats["last_swap_seconds"] = elapsed
+            return True
+
+    def deactivate(self):
+        """Run the next generation on the base model"""
+        with self.lock:
+            self._deactivate()
+
+    def _deactivate(self):
+        if self.active is not None:
+            self.backend.deactivate()
+            self.active = None
+
+    def _load(self, name, path, stats):
+        size = adapter_size(path)
+        # Make room first so peak memory stays within budget
+        while self.resident and (len(self.resident) >= self.max_adapters
+                                 or self.bytes_used + size > self.max_bytes):
+            self._evict()
+
+        logger.info(f"🔧 Loading LoRA adapter: {path}")
+        start = time.perf_counter()
+        config = self.backend.load(name, path)
+        elapsed = time.perf_counter() - start
+        self.resident[name] = {"config": config, "bytes": size}
+        self.bytes_used += size
+        stats["loads"] += 1
+        stats["load_seconds"] += elapsed
+        stats["last_load_seconds"] = elapsed
+        logger.info(f"✅ LoRA adapter loaded: {path} ({elapsed:.2f}s)")
+
+    def _evict(self):
+        name, entry = self.resident.popitem(last=False)
+        if name == self.active:
+            self._deactivate()
+        self.backend.unload(name)
+        self.bytes_used -= entry["bytes"]
+        self.adapter_stats[name]["evictions"] += 1
+        logger.info(f"♻️ Evicted LoRA adapter: {name}")
+
+    def info(self, name: str):
+        """Residency, config and load/swap timings for one adapter"""
+        with self.lock:
+            entry = self.resident.get(name)
+            stats = dict(self.adapter_stats.get(name, {}))
+            if stats.get("swaps"):
+                stats["mean_swap_seconds"] = stats["swap_seconds"] / stats["swaps"]
+            if name == self.active:
+                status = "active"
+            elif entry is not None:
+                status = "loaded"
+            else:
+                status = "not_loaded"
+            return {
+                "status": status,
+                "config": entry["config"] if entry else {},
+                "bytes": entry["bytes"] if entry else 0,
+                "stats": stats,
+            }
+
+    def __len__(self):
+        return len(self.resident)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "resident": list(self.resident),
+                "active": self.active,
+                "bytes": self.bytes_used,
+                "max_adapters": self.max_adapters,
+                "max_bytes": self.max_bytes,
+            }
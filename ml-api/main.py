@@ -1,16 +1,31 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import torch
-import torchaudio
-import io
-import base64
 from typing import Optional
 import os
 import logging
 import asyncio
+import weakref
 from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from admission import AdmissionController, Overloaded
+from lora_registry import LoraRegistry, PeftBackend
+from merge_lora import load_merged_lm
+from model_loader import ModelNotReady, SingleFlightLoader
+from audio_encoding import (
+    UnsupportedFormat,
+    audio_headers,
+    encode_audio,
+    encode_wav_base64,
+    iter_pcm16_blocks,
+    json_body,
+    negotiate_format,
+    pcm16_bytes,
+    wav_header,
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -33,68 +48,67 @@ class GenerationRequest(BaseModel):
     top_k: int = 250
     top_p: float = 0.0
     lora_model: Optional[str] = None
+    format: Optional[str] = None  # json (base64, default), wav, pcm16, pcm_f32, flac or opus
 
 class MusicGenService:
     def __init__(self):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.base_model = None
-        self.current_lora = None
-        self.model_loading = False
+        # Adapters wrap the language model once and are swapped per request
+        self.lora_registry = LoraRegistry(PeftBackend(
+            lambda: self.base_model.lm,
+            lambda wrapped: setattr(self.base_model, "lm", wrapped),
+            # Merged artifacts from merge_lora.py replace the LM outright
+            lambda path: load_merged_lm(path, self.device)
+        ))
+        # Concurrent callers share one load instead of falling back to dummy audio while it runs
+        self.loader = SingleFlightLoader(self._load_base_model)
         self.executor = ThreadPoolExecutor(max_workers=1)
+        # Dummy audio and response encoding run here so the event loop stays responsive
+        self.cpu_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="harmonix-cpu")
+        self.admission = AdmissionController()
         logger.info(f"Using device: {self.device}")
         
-    async def load_base_model_async(self, model_name="facebook/musicgen-small"):
-        """Load the base MusicGen model asynchronously"""
-        if self.base_model is None and not self.model_loading:
-            self.model_loading = True
-            try:
-                logger.info(f"Loading base model: {model_name}")
-                # Use small model for faster loading and less memory usage
-                loop = asyncio.get_event_loop()
-                self.base_model = await loop.run_in_executor(
-                    self.executor, 
-                    self._load_model_sync, 
-                    model_name
-                )
-                logger.info("Model loaded successfully")
-            except Exception as e:
-                logger.error(f"Failed to load model: {e}")
-                self.base_model = None
-            finally:
-                self.model_loading = False
+    @property
+    def model_loading(self):
+        return self.loader.loading
+    
+    async def load_base_model_async(self):
+        """The base model, awaiting the shared load if one is underway; raises ModelNotReady per the load policy"""
+        if self.base_model is not None:
+            return self.base_model
+        return await self.loader.get()
+    
+    async def _load_base_model(self, model_name="facebook/musicgen-small"):
+        """Load the base MusicGen model asynchronously; errors are recorded by the loader"""
+        logger.info(f"Loading base model: {model_name}")
+        # Use small model for faster loading and less memory usage
+        loop = asyncio.get_event_loop()
+        self.base_model = await loop.run_in_executor(
+            self.executor, 
+            self._load_model_sync, 
+            model_name
+        )
+        logger.info("Model loaded successfully")
         return self.base_model
     
     def _load_model_sync(self, model_name):
         """Synchronous model loading"""
         try:
             from audiocraft.models import MusicGen
-            model = MusicGen.get_pretrained(model_name)
-            model.set_generation_params(
-                use_sampling=True,
-                top_k=250,
-                duration=10
-            )
-            return model
         except ImportError as e:
-            logger.error(f"AudioCraft not available: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Error loading model: {e}")
-            return None
+            raise RuntimeError(f"AudioCraft not available: {e}") from e
+        model = MusicGen.get_pretrained(model_name)
+        model.set_generation_params(
+            use_sampling=True,
+            top_k=250,
+            duration=10
+        )
+        return model
     
     def load_lora_adapter(self, lora_path: str):
-        """Load LoRA adapter for fine-tuned model"""
-        try:
-            if os.path.exists(lora_path) and lora_path != self.current_lora:
-                logger.info(f"Loading LoRA adapter: {lora_path}")
-                from peft import PeftModel
-                self.base_model = PeftModel.from_pretrained(
-                    self.base_model, 
-                    lora_path
-                )
-                self.current_lora = lora_path
-        except Exception as e:
-            logger.error(f"Failed to load LoRA adapter: {e}")
+        """Activate a LoRA adapter, loading its weights only the first time it is used"""
+        return self.lora_registry.activate(os.path.basename(lora_path.rstrip("/")), lora_path)
     
     def generate_dummy_audio(self, duration: float = 10.0, sample_rate: int = 32000):
         """Generate a simple sine wave as fallback audio"""
@@ -113,7 +127,97 @@ class MusicGenService:
         audio_tensor = torch.tensor(audio, dtype=torch.float32).unsqueeze(0)
         return audio_tensor
             
-    async def generate_music_async(self, request: GenerationRequest):
+    def iter_dummy_audio(self, duration: float = 10.0, sample_rate: int = 32000, block_seconds: float = 1.0):
+        """Yield the generate_dummy_audio melody block by block"""
+        total = int(sample_rate * duration)
+        step = duration / total if total else 0.0
+        block_samples = int(sample_rate * block_seconds)
+        frequencies = [440, 523, 659, 784]  # A, C, E, G notes
+        
+        for start in range(0, total, block_samples):
+            # Same time base as np.linspace(0, duration, total, False)
+            t = np.arange(start, min(start + block_samples, total)) * step
+            audio = np.zeros_like(t)
+            for i, freq in enumerate(frequencies):
+                start_time = i * duration / len(frequencies)
+                end_time = (i + 1) * duration / len(frequencies)
+                mask = (t >= start_time) & (t < end_time)
+                audio[mask] = 0.3 * np.sin(2 * np.pi * freq * t[mask])
+            yield audio
+    
+    async def stream_music_async(self, model, request: GenerationRequest, slot=None):
+        """Yield a streaming WAV header followed by 16-bit PCM blocks, releasing `slot` at the end"""
+        try:
+            async for block in self._stream_blocks(model, request):
+                yield block
+        finally:
+            if slot is not None:
+                slot.release()
+    
+    async def _stream_blocks(self, model, request: GenerationRequest):
+        sample_rate = 32000
+        # MusicGen output length is only known after generation, so leave the sizes open
+        yield wav_header(sample_rate)
+        
+        if model is not None:
+            try:
+                model.set_generation_params(
+                    use_sampling=True,
+                    top_k=request.top_k,
+                    top_p=request.top_p,
+                    temperature=request.temperature,
+                    duration=request.duration,
+                )
+                
+                logger.info(f"Streaming music for prompt: {request.prompt}")
+                loop = asyncio.get_event_loop()
+                audio_data = await loop.run_in_executor(
+                    self.executor,
+                    self._generate_sync,
+                    model,
+                    request.prompt,
+                    request.lora_model
+                )
+                blocks = iter_pcm16_blocks(audio_data[0].numpy(), sample_rate)
+                while (block := await self._run_cpu(next, blocks, None)) is not None:
+                    yield block
+                return
+            except Exception as e:
+                logger.error(f"Error generating music: {e}")
+        
+        logger.warning("Model not available, streaming dummy audio")
+        blocks = self.iter_dummy_audio(request.duration, sample_rate)
+        while (block := await self._run_cpu(self._next_pcm16, blocks)) is not None:
+            yield block
+    
+    @staticmethod
+    def _next_pcm16(blocks):
+        block = next(blocks, None)
+        return None if block is None else pcm16_bytes(block)
+    
+    async def _run_cpu(self, fn, *args):
+        """Run a CPU-bound step on the CPU pool instead of the event loop"""
+        return await asyncio.get_event_loop().run_in_executor(self.cpu_executor, fn, *args)
+    
+    def _build_result(self, audio_data, request: GenerationRequest, note: str, audio_format: str):
+        """Base64 JSON payload, or a binary body for any other response format"""
+        # The tensor's storage is encoded in place, without a torchaudio.save pass
+        samples = audio_data[0].numpy()
+        if audio_format != "json":
+            body, media_type = encode_audio(samples, 32000, audio_format)
+            return {"body": body, "media_type": media_type, "headers": audio_headers(32000, audio_format)}
+        
+        audio_b64 = encode_wav_base64(samples, 32000)
+        
+        return {
+            "audio_data": audio_b64,
+            "sample_rate": 32000,
+            "duration": request.duration,
+            "prompt": request.prompt,
+            "note": note
+        }
+    
+    async def generate_music_async(self, request: GenerationRequest, audio_format: str = "json"):
         """Generate music based on text prompt"""
         try:
             model = await self.load_base_model_async()
@@ -121,13 +225,9 @@ class MusicGenService:
             if model is None:
                 logger.warning("Model not available, generating dummy audio")
                 # Generate dummy audio as fallback
-                audio_data = self.generate_dummy_audio(request.duration)
+                audio_data = await self._run_cpu(self.generate_dummy_audio, request.duration)
                 note = "Model not available - generated dummy audio"
             else:
-                # Load LoRA adapter if specified
-                if request.lora_model:
-                    self.load_lora_adapter(request.lora_model)
-                
                 # Set generation parameters
                 model.set_generation_params(
                     use_sampling=True,
@@ -144,45 +244,29 @@ class MusicGenService:
                     self.executor,
                     self._generate_sync,
                     model,
-                    request.prompt
+                    request.prompt,
+                    request.lora_model
                 )
                 note = "Generated using MusicGen model"
             
-            # Convert to audio bytes
-            buffer = io.BytesIO()
-            torchaudio.save(buffer, audio_data, 32000, format="wav")
-            buffer.seek(0)
-            
-            # Encode as base64
-            audio_b64 = base64.b64encode(buffer.read()).decode()
-            
-            return {
-                "audio_data": audio_b64,
-                "sample_rate": 32000,
-                "duration": request.duration,
-                "prompt": request.prompt,
-                "note": note
-            }
+            return await self._run_cpu(self._build_result, audio_data, request, note, audio_format)
             
+        except (UnsupportedFormat, ModelNotReady):
+            raise
         except Exception as e:
             logger.error(f"Error generating music: {e}")
             # Fallback to dummy audio
-            audio_data = self.generate_dummy_audio(request.duration)
-            buffer = io.BytesIO()
-            torchaudio.save(buffer, audio_data, 32000, format="wav")
-            buffer.seek(0)
-            audio_b64 = base64.b64encode(buffer.read()).decode()
-            
-            return {
-                "audio_data": audio_b64,
-                "sample_rate": 32000,
-                "duration": request.duration,
-                "prompt": request.prompt,
-                "note": f"Error occurred, generated dummy audio: {str(e)}"
-            }
+            audio_data = await self._run_cpu(self.generate_dummy_audio, request.duration)
+            note = f"Error occurred, generated dummy audio: {str(e)}"
+            return await self._run_cpu(self._build_result, audio_data, request, note, audio_format)
     
-    def _generate_sync(self, model, prompt):
+    def _generate_sync(self, model, prompt, lora_model=None):
         """Synchronous music generation"""
+        # Swap adapters on the executor thread so requests never see each other's adapter
+        if lora_model:
+            self.load_lora_adapter(lora_model)
+        else:
+            self.lora_registry.deactivate()
         with torch.no_grad():
             wav = model.generate([prompt])
         return wav[0].cpu()
@@ -195,7 +279,7 @@ async def startup_event():
     """Initialize the model on startup"""
     logger.info("Starting MusicGen API...")
     # Start loading the model in the background
-    asyncio.create_task(music_service.load_base_model_async())
+    music_service.loader.start()
 
 @app.get("/")
 async def root():
@@ -207,19 +291,61 @@ async def health_check():
         "status": "healthy",
         "device": music_service.device,
         "model_loaded": music_service.base_model is not None,
-        "model_loading": music_service.model_loading
+        "model_loading": music_service.model_loading,
+        "loader": music_service.loader.stats(),
+        "lora": music_service.lora_registry.stats(),
+        "admission": music_service.admission.stats()
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """200 once the model is loaded, 503 until then (with the error if the last load failed); /health only says the process is up"""
+    if music_service.base_model is None:
+        music_service.loader.start()
+        error = music_service.loader.not_ready()
+        raise HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+    return {"status": "ready", "device": music_service.device}
+
 @app.post("/generate")
-async def generate_music(request: GenerationRequest):
-    """Generate music from text prompt"""
+async def generate_music(request: GenerationRequest, http_request: Request):
+    """Generate music from text prompt in the format chosen by `format` or Accept"""
     try:
-        result = await music_service.generate_music_async(request)
-        return result
+        audio_format = negotiate_format(request.format, http_request.headers.get("accept"))
+        with music_service.admission.acquire():
+            result = await music_service.generate_music_async(request, audio_format)
+        if audio_format == "json":
+            return Response(content=json_body(result), media_type="application/json")
+        return Response(content=memoryview(result["body"]), media_type=result["media_type"], headers=result["headers"])
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    except (Overloaded, ModelNotReady) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/stream")
+async def generate_music_stream(request: GenerationRequest):
+    """Stream generated music as a chunked WAV response"""
+    try:
+        slot = music_service.admission.acquire()
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        model = await music_service.load_base_model_async()
+    except ModelNotReady as e:
+        slot.release()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except BaseException:
+        slot.release()
+        raise
+    body = music_service.stream_music_async(model, request, slot)
+    # The generator releases the slot when it ends. A client gone before the first chunk never
+    # starts it, so the background task releases it too; if the response is never sent at all,
+    # the finalizer hands the release back to the event loop, whichever thread collects `body`
+    weakref.finalize(body, slot.release_soon, asyncio.get_running_loop())
+    return StreamingResponse(body, media_type="audio/wav", background=BackgroundTask(slot.release))
+
 @app.get("/models")
 async def list_available_models():
     """List available LoRA models"""
@@ -233,6 +359,11 @@ async def list_available_models():
     
     return {"available_models": models}
 
+@app.get("/lora/{model_name}")
+async def get_lora_info(model_name: str):
+    """Residency and load/swap timings for a LoRA adapter"""
+    return {"model_name": model_name, **music_service.lora_registry.info(model_name)}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Merge a trained LoRA adapter into the base MusicGen weights.
+
+The merged artifact is a standalone directory: the merged weights as
+safetensors plus merged_config.json naming the base model, so the service can
+swap it in without a PEFT wrapper or the extra adapter matmuls. With --int8
+the service applies dynamic int8 quantization to the linear layers at load.
+
+Usage: python merge_lora.py --adapter ./lora_models/jazz --output ./lora_models/jazz-merged
+       python merge_lora.py --adapter ./lora_models/jazz --output ./lora_models/jazz-int8 --int8
+       python merge_lora.py --framework transformers --base facebook/musicgen-small \
+           --adapter ./lora_models/jazz-hf --output ./lora_models/jazz-hf-merged
+"""
+
+import argparse
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MERGED_CONFIG = "merged_config.json"
+LM_WEIGHTS = "lm.safetensors"
+LM_STATE_DICT = "lm.pt"
+
+
+def is_merged_artifact(path: str):
+    return os.path.exists(os.path.join(path, MERGED_CONFIG))
+
+
+def read_merged_config(path: str):
+    with open(os.path.join(path, MERGED_CONFIG), "r") as f:
+        return json.load(f)
+
+
+def quantize_int8(module):
+    """Dynamic int8 quantization of every nn.Linear, in place so float and int8 weights never coexist"""
+    import gc
+
+    import torch
+
+    module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    # The swapped-out float layers sit in reference cycles; free them now rather than at the next GC
+    gc.collect()
+    return module
+
+
+def merge_adapter(framework: str, base_model: str, adapter: str, output: str, int8: bool = False):
+    """Fold the adapter into the base weights and write a merged artifact"""
+    from peft import PeftModel
+
+    os.makedirs(output, exist_ok=True)
+    if framework == "audiocraft":
+        from audiocraft.models import MusicGen
+
+        # train_lora.py puts LoRA on the language model only
+        lm = PeftModel.from_pretrained(MusicGen.get_pretrained(base_model).lm, adapter).merge_and_unload()
+        try:
+            from safetensors.torch import save_model
+        except ImportError:
+            import torch
+            torch.save(lm.state_dict(), os.path.join(output, LM_STATE_DICT))
+        else:
+            save_model(lm, os.path.join(output, LM_WEIGHTS))
+    else:
+        from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+        model = MusicgenForConditionalGeneration.from_pretrained(base_model)
+        PeftModel.from_pretrained(model, adapter).merge_and_unload().save_pretrained(output, safe_serialization=True)
+        AutoProcessor.from_pretrained(base_model).save_pretrained(output)
+
+    config = {"framework": framework, "base_model": base_model, "adapter": os.path.abspath(adapter),
+              "quantize": "int8" if int8 else None}
+    with open(os.path.join(output, MERGED_CONFIG), "w") as f:
+        json.dump(config, f, indent=2)
+    logger.info(f"Merged {adapter} into {base_model} -> {output}")
+    return config
+
+
+def load_merged_lm(path: str, device: str = "cpu"):
+    """Audiocraft LM with merged weights, ready to replace MusicGen.lm"""
+    import torch
+    from audiocraft.models.loaders import load_lm_model
+
+    config = read_merged_config(path)
+    lm = load_lm_model(config["base_model"], device=device)
+    weights_path = os.path.join(path, LM_WEIGHTS)
+    if os.path.exists(weights_path):
+        from safetensors.torch import load_file
+        state_dict = load_file(weights_path, device=device)
+    else:
+        state_dict = torch.load(os.path.join(path, LM_STATE_DICT), map_location=device, mmap=True, weights_only=True)
+    lm.load_state_dict(state_dict)
+    lm.eval()
+    return quantize_int8(lm) if config.get("quantize") == "int8" and device == "cpu" else lm
+
+
+def load_merged_model(path: str, device: str = "cpu"):
+    """Transformers MusicGen with merged weights, ready to replace model_data["model"]"""
+    from transformers import MusicgenForConditionalGeneration
+
+    config = read_merged_config(path)
+    model = MusicgenForConditionalGeneration.from_pretrained(path).to(device).eval()
+    if config.get("quantize") == "int8" and device == "cpu":
+        # Only the decoder runs per token; the text encoder and EnCodec stay float
+        model.decoder = quantize_int8(model.decoder)
+    return model
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Merge a LoRA adapter into MusicGen for fast inference")
+    parser.add_argument("--adapter", type=str, required=True, help="Adapter directory saved by train_lora.py")
+    parser.add_argument("--output", type=str, required=True, help="Merged artifact directory")
+    parser.add_argument("--framework", choices=["audiocraft", "transformers"], default="audiocraft",
+                        help="audiocraft for train_lora.py adapters (main.py), transformers for lightweight_main.py")
+    parser.add_argument("--base", type=str, default="facebook/musicgen-medium", help="Base model the adapter was trained on")
+    parser.add_argument("--int8", action="store_true", help="Quantize linear layers to int8 when the service loads it")
+    args = parser.parse_args()
+    merge_adapter(args.framework, args.base, args.adapter, args.output, args.int8)
@@ -0,0 +1,184 @@
+"""
+Lock-free counters and histograms exported in the Prometheus text format.
+
+Every thread updates its own shard of a metric (created on first use through
+threading.local), so recording a sample is a couple of list writes with no
+lock and no contention between the event loop and executor threads. A scrape
+sums the shards. Gauges are callbacks evaluated at scrape time, so queue depth
+and cache stats cost nothing between scrapes.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage latencies span sub-millisecond encodes to minute-long generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(labels: dict):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """Per-thread lists of `size` numbers, summed on read"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = [0] * self._size
+            self._shards.append(shard)  # list.append is atomic
+        return shard
+
+    def _totals(self):
+        totals = [0] * self._size
+        for shard in list(self._shards):
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: dict = None):
+        super().__init__(1)
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    @property
+    def value(self):
+        return self._totals()[0]
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: dict = None, buckets=DEFAULT_BUCKETS):
+        # One slot per bucket plus +Inf, then sum and count
+        self.buckets = tuple(buckets)
+        super().__init__(len(self.buckets) + 3)
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        totals = self._totals()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), totals):
+            cumulative += count
+            yield f"{self.name}_bucket", dict(self.labels, le=_number(bound)), cumulative
+        yield f"{self.name}_sum", self.labels, totals[-2]
+        yield f"{self.name}_count", self.labels, totals[-1]
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read, labels: dict = None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = labels or {}
+
+    def samples(self):
+        yield self.name, self.labels, self.read()
+
+
+class CallbackCounter(Gauge):
+    """Monotonic total kept elsewhere (e.g. a cache's hit count), read at scrape time"""
+
+    kind = "counter"
+
+
+class Registry:
+    """Named metrics, grouped by family when rendered"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        key = (metric.name, tuple(sorted(metric.labels.items())))
+        return self.metrics.setdefault(key, metric)
+
+    def counter(self, name: str, help: str, **labels):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS, **labels):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read, **labels):
+        # Re-registering replaces the callback, e.g. for a new service instance
+        key = (name, tuple(sorted(labels.items())))
+        self.metrics[key] = Gauge(name, help, read, labels)
+        return self.metrics[key]
+
+    def counter_func(self, name: str, help: str, read, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.metrics[key] = CallbackCounter(name, help, read, labels)
+        return self.metrics[key]
+
+    def render(self):
+        """Prometheus text exposition format 0.0.4"""
+        families = {}
+        for metric in self.metrics.values():
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].help}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                try:
+                    samples = list(metric.samples())
+                except Exception:
+                    continue  # a gauge whose source is gone
+                for sample, labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{sample}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -0,0 +1,165 @@
+"""
+Single-flight model loading.
+
+The first caller starts the load as a task; everyone arriving while it runs
+awaits that same task instead of being told there is no model. Under the
+"park" policy (the default) callers wait up to HARMONIX_LOAD_TIMEOUT_SECONDS
+and are then turned away with a Retry-After; under "reject" they are turned
+away immediately while the load carries on in the background. A load that
+fails or yields no model is remembered along with its error: callers get
+the failure (None) straight away until a backoff of HARMONIX_LOAD_RETRY_SECONDS,
+doubling with each consecutive failure, has passed, and only then does the
+next caller start another attempt.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOAD_POLICY = os.environ.get("HARMONIX_LOAD_POLICY", "park")
+DEFAULT_LOAD_TIMEOUT = float(os.environ.get("HARMONIX_LOAD_TIMEOUT_SECONDS", "120"))
+LOAD_POLICIES = ("park", "reject")
+DEFAULT_RETRY_SECONDS = float(os.environ.get("HARMONIX_LOAD_RETRY_SECONDS", "30"))
+MAX_RETRY_SECONDS = 600
+# Seconds a turned-away client is told to wait; load times are unknown until the first one finishes
+LOAD_RETRY_AFTER = 5
+
+
+class ModelNotReady(Exception):
+    """The model is still loading and the caller will not wait for it"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SingleFlightLoader:
+    """One shared load task for every caller, with a park-or-reject policy"""
+
+    def __init__(self, load, policy: str = DEFAULT_LOAD_POLICY, timeout: float = DEFAULT_LOAD_TIMEOUT,
+                 retry_seconds: float = DEFAULT_RETRY_SECONDS):
+        if policy not in LOAD_POLICIES:
+            raise ValueError(f"Unknown load policy {policy!r}, expected one of {LOAD_POLICIES}")
+        self.load = load  # async callable returning the model, or None on failure
+        self.policy = policy
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self.value = None
+        self.task = None
+        self.error = None  # why the last attempt failed
+        self.retry_at = None  # time.monotonic() after which another attempt may start
+        self.consecutive_failures = 0
+        self.started_at = None
+        self.load_seconds = None
+        self.loads = 0
+        self.failures = 0
+        self.parked = 0  # callers waiting on the load right now
+        self.parked_total = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    @property
+    def ready(self):
+        return self.value is not None
+
+    @property
+    def loading(self):
+        return self.task is not None and not self.task.done()
+
+    @property
+    def failed(self):
+        """The last attempt failed and no other is underway"""
+        return self.value is None and self.error is not None and not self.loading
+
+    def retry_in(self):
+        """Seconds until a failed load may be retried, 0 once it may"""
+        if not self.failed:
+            return None
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def start(self):
+        """Begin loading unless a load is done or underway, or a failed one is backing off; returns the load task"""
+        if self.value is None and not self.loading and not self.retry_in():
+            self.task = asyncio.ensure_future(self._run())
+        return self.task
+
+    def not_ready(self):
+        """ModelNotReady explaining why there is no model: still loading, or failed and backing off"""
+        if self.failed:
+            retry_after = max(1, math.ceil(self.retry_in()))
+            return ModelNotReady(f"Model load failed: {self.error} (next attempt in {retry_after}s)", retry_after)
+        return ModelNotReady("Model not loaded yet", LOAD_RETRY_AFTER)
+
+    async def _run(self):
+        self.loads += 1
+        self.started_at = time.perf_counter()
+        error = None
+        try:
+            value = await self.load()
+        except Exception as e:
+            logger.error(f"Model load failed: {e}")
+            value, error = None, e
+        if value is None:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.error = str(error or "the load returned no model")
+            backoff = min(MAX_RETRY_SECONDS, self.retry_seconds * 2 ** (self.consecutive_failures - 1))
+            self.retry_at = time.monotonic() + backoff
+            logger.warning(f"Model load failed, next attempt in {backoff:.0f}s")
+        else:
+            self.load_seconds = time.perf_counter() - self.started_at
+            self.value = value
+            self.error = None
+            self.consecutive_failures = 0
+        return value
+
+    async def get(self, park: bool = None):
+        """The loaded model, awaiting a shared load if needed; None if the load failed
+
+        `park` overrides the policy: True waits without a timeout, False never waits.
+        Once a load has failed, "reject" parks too: retries of a broken model are
+        quick, and the caller's fallback beats a 503 that would never clear.
+        """
+        if self.value is not None:
+            return self.value
+        task = self.start()
+        if self.retry_in():
+            return None  # the last attempt failed and is backing off
+        wait = park
+        if wait is None:
+            wait = self.policy == "park" or self.failures > 0
+        if not wait:
+            self.rejected += 1
+            raise ModelNotReady("Model is loading, not accepting requests yet", LOAD_RETRY_AFTER)
+        timeout = None if park else self.timeout
+        self.parked += 1
+        self.parked_total += 1
+        try:
+            # shield: a caller giving up must not cancel the load for everyone else
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ModelNotReady(f"Model still loading after {timeout:g}s", LOAD_RETRY_AFTER)
+        finally:
+            self.parked -= 1
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "loading": self.loading,
+            "policy": self.policy,
+            "timeout_seconds": self.timeout,
+            "load_seconds": self.load_seconds,
+            "loads": self.loads,
+            "failures": self.failures,
+            "error": self.error,
+            "retry_in_seconds": self.retry_in(),
+            "parked": self.parked,
+            "parked_total": self.parked_total,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
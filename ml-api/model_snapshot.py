@@ -0,0 +1,85 @@
+"""
+Pre-serialized MusicGen snapshots for fast warm starts.
+
+A snapshot directory holds the model config, the processor files and the
+weights as a single safetensors file (or a torch state dict when safetensors
+is not installed). Loading builds the model on the meta device and assigns
+the memory-mapped tensors directly, skipping from_pretrained's random init,
+weight conversion and hub lookups.
+
+Usage: python model_snapshot.py facebook/musicgen-small ./snapshots/musicgen-small
+"""
+
+import argparse
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_FILE = "model.safetensors"
+STATE_DICT_FILE = "model.pt"
+
+
+def save_snapshot(model_name: str, path: str):
+    """Download/load a model once and write it out as a local snapshot"""
+    import torch
+    from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+    os.makedirs(path, exist_ok=True)
+    model = MusicgenForConditionalGeneration.from_pretrained(model_name, torch_dtype=torch.float32)
+    model.config.save_pretrained(path)
+    AutoProcessor.from_pretrained(model_name).save_pretrained(path)
+
+    try:
+        from safetensors.torch import save_model
+    except ImportError:
+        torch.save(model.state_dict(), os.path.join(path, STATE_DICT_FILE))
+        logger.info(f"Saved state dict snapshot to {path}")
+    else:
+        # save_model de-duplicates tied weights, which save_file refuses
+        save_model(model, os.path.join(path, SAFETENSORS_FILE))
+        logger.info(f"Saved safetensors snapshot to {path}")
+
+
+def load_state_dict(path: str):
+    """Memory-map the snapshot weights without copying them into fresh tensors"""
+    safetensors_path = os.path.join(path, SAFETENSORS_FILE)
+    if os.path.exists(safetensors_path):
+        from safetensors.torch import load_file
+        return load_file(safetensors_path)
+
+    import torch
+    return torch.load(os.path.join(path, STATE_DICT_FILE), mmap=True, weights_only=True)
+
+
+def load_snapshot(path: str, device: str = "cpu"):
+    """Build MusicGen from a snapshot directory, returning {"model", "processor"}"""
+    import torch
+    from transformers import AutoConfig, AutoProcessor, MusicgenForConditionalGeneration
+
+    config = AutoConfig.from_pretrained(path)
+    with torch.device("meta"):
+        model = MusicgenForConditionalGeneration(config)
+    # Tied weights are stored once, so assign what is there and re-tie the rest
+    model.load_state_dict(load_state_dict(path), strict=False, assign=True)
+    model.tie_weights()
+
+    # Non-persistent buffers are not in the state dict and stay on the meta device
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers()) if tensor.is_meta]
+    if missing:
+        logger.warning(f"Snapshot leaves {len(missing)} tensor(s) uninitialized (e.g. {missing[0]}), "
+                       f"using from_pretrained on the local snapshot instead")
+        model = MusicgenForConditionalGeneration.from_pretrained(path, low_cpu_mem_usage=True)
+
+    model = model.to(device).eval()
+    processor = AutoProcessor.from_pretrained(path)
+    return {"model": model, "processor": processor}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Write a MusicGen snapshot for fast service startup")
+    parser.add_argument("model_name", help="Hugging Face model id, e.g. facebook/musicgen-small")
+    parser.add_argument("output_dir", help="Snapshot directory (set HARMONIX_MODEL_SNAPSHOT to it)")
+    args = parser.parse_args()
+    save_snapshot(args.model_name, args.output_dir)
@@ -0,0 +1,155 @@
+"""
+Content-addressed cache of encoded generation results.
+
+Deterministic requests are keyed on a canonical hash of their generation
+parameters and response format. Results live in an in-memory LRU bounded by a
+byte budget and, optionally, in an on-disk tier that survives restarts.
+get() and put() do both tiers inline; the service calls lookup()/store() on
+the event loop and runs read_disk()/write_disk() on its CPU pool, so file
+I/O never blocks other requests.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("HARMONIX_CACHE_MAX_MB", "256")) * 1024 * 1024)
+DEFAULT_CACHE_DIR = os.environ.get("HARMONIX_CACHE_DIR") or None
+
+KEY_FIELDS = ("prompt", "duration", "temperature", "top_k", "top_p", "lora_model", "seed")
+
+
+def cache_key(request, model_type: str, audio_format: str = "json"):
+    """Canonical SHA-256 of the parameters that determine a generation result"""
+    params = {field: getattr(request, field, None) for field in KEY_FIELDS}
+    params["model_type"] = model_type
+    params["format"] = audio_format
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def result_size(result):
+    """Approximate memory held by a cached result, dominated by the encoded audio"""
+    return sum(value.nbytes if isinstance(value, memoryview) else len(value)
+               for value in result.values() if isinstance(value, (str, bytes, bytearray, memoryview)))
+
+
+class ResultCache:
+    """In-memory LRU with a byte budget, backed by an optional directory of entry files
+
+    A result is a JSON-able dict, optionally with a binary "body". On disk each
+    entry is one line of JSON metadata followed by the raw body bytes.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key: str):
+        """Return the cached result for key, promoting disk hits into memory"""
+        result = self.lookup(key)
+        if result is None:
+            result = self.promote(key, self.read_disk(key))
+        return result
+
+    def lookup(self, key: str):
+        """The in-memory result for key, or None; never touches the disk"""
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return result
+
+    def promote(self, key: str, result):
+        """Record the outcome of read_disk(key) and keep a hit in memory"""
+        if result is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self.store(key, result)
+        return result
+
+    def put(self, key: str, result: dict):
+        """Cache a result in memory and, if configured, on disk"""
+        self.store(key, result)
+        self.write_disk(key, result)
+
+    def store(self, key: str, result: dict):
+        """Cache a result in memory only"""
+        size = result_size(result)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes_used -= result_size(self.entries.pop(key))
+        self.entries[key] = result
+        self.bytes_used += size
+        while self.bytes_used > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes_used -= result_size(evicted)
+            self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.entry")
+
+    def read_disk(self, key: str):
+        """The entry file for key, or None; touches no in-memory state, so it can run off the event loop"""
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            meta, _, body = data.partition(b"\n")
+            result = json.loads(meta)
+            if result.pop("has_body", False):
+                result["body"] = body
+            return result
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
+
+    def write_disk(self, key: str, result: dict):
+        """Write the entry file for key atomically; safe to run from any thread"""
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        meta = {name: value for name, value in result.items() if name != "body"}
+        meta["has_body"] = "body" in result
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(json.dumps(meta).encode())
+                f.write(b"\n")
+                if "body" in result:
+                    f.write(result["body"])
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "disk_dir": self.cache_dir,
+        }
@@ -0,0 +1,200 @@
+"""
+Generation sessions for /continue.
+
+Every generation leaves behind what is needed to extend it: the request it
+came from, how many seconds exist so far and a model-specific resume state.
+For the mock synthesizer that is the next measure index; for the real model
+it is the generated audio codes plus the decoder's KV cache, so a continuation
+only runs the new tokens instead of recomputing the prefix. Sessions live in
+an LRU bounded by count and bytes and expire after a TTL since last use.
+HARMONIX_SESSIONS_MAX=0 turns sessions (and KV cache capture) off.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = int(os.environ.get("HARMONIX_SESSIONS_MAX", "64"))
+DEFAULT_MAX_BYTES = int(float(os.environ.get("HARMONIX_SESSIONS_MAX_MB", "1024")) * 1024 * 1024)
+DEFAULT_TTL_SECONDS = float(os.environ.get("HARMONIX_SESSION_TTL_SECONDS", "900"))
+
+
+class Session:
+    """One resumable generation"""
+
+    def __init__(self, request, model_type: str, seconds: float, state: dict):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.model_type = model_type
+        self.seconds = seconds
+        self.state = state
+        self.bytes = state_bytes(state)
+        self.continuations = 0
+        self.last_used = time.monotonic()
+        # Continuations of one session run one at a time
+        self.lock = asyncio.Lock()
+
+    def to_dict(self):
+        return {
+            "generation_id": self.id,
+            "model_type": self.model_type,
+            "seconds": self.seconds,
+            "continuations": self.continuations,
+            "bytes": self.bytes,
+        }
+
+
+class SessionStore:
+    """LRU of sessions bounded by count and resident bytes, with TTL expiry"""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL_SECONDS):
+        self.max_sessions = max(0, max_sessions)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.bytes_used = 0
+        self.created = 0
+        self.resumed = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_sessions > 0
+
+    def create(self, request, model_type: str, seconds: float, state: dict):
+        if not self.enabled:
+            return None
+        session = Session(request, model_type, seconds, state)
+        self._expire()
+        self.sessions[session.id] = session
+        self.bytes_used += session.bytes
+        self.created += 1
+        self._evict(keep=session.id)
+        return session
+
+    def get(self, session_id: str):
+        self._expire()
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def advance(self, session: Session, seconds: float, state: dict):
+        """Record a finished continuation and its new resume state"""
+        # A session evicted while it was being continued stays out of the budget
+        resident = self.sessions.get(session.id) is session
+        if resident:
+            self.bytes_used -= session.bytes
+        session.state = state
+        session.bytes = state_bytes(state)
+        session.seconds += seconds
+        session.continuations += 1
+        session.last_used = time.monotonic()
+        self.resumed += 1
+        if resident:
+            self.bytes_used += session.bytes
+            self._evict(keep=session.id)
+
+    def _evict(self, keep):
+        while self.sessions and (len(self.sessions) > self.max_sessions or self.bytes_used > self.max_bytes):
+            session_id = next(iter(self.sessions))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+            self.evictions += 1
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_used > cutoff:
+                break
+            self._drop(session_id)
+            self.expirations += 1
+
+    def _drop(self, session_id):
+        session = self.sessions.pop(session_id)
+        self.bytes_used -= session.bytes
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "bytes": self.bytes_used,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "created": self.created,
+            "resumed": self.resumed,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def state_bytes(value):
+    """Bytes held by the tensors and arrays nested in a resume state"""
+    if isinstance(value, dict):
+        return sum(state_bytes(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(state_bytes(item) for item in value)
+    if hasattr(value, "element_size"):
+        return value.element_size() * value.nelement()
+    return getattr(value, "nbytes", 0)
+
+
+class CodeRecorder:
+    """Stopping criterion that never stops and keeps the latest delayed token grid
+
+    transformers' MusicGen.generate() returns decoded audio only; the tokens it
+    sampled are needed to resume, so this captures them as generation runs.
+    """
+
+    def __init__(self):
+        self.input_ids = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        self.input_ids = input_ids
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+def undelay_codes(input_ids, num_codebooks: int):
+    """(batch * codebooks, length) delayed grid -> (batch, codebooks, frames) codes
+
+    MusicGen offsets codebook k by k steps after the start token, so frame j of
+    codebook k sits at position j + k + 1 and every codebook has
+    length - codebooks real frames.
+    """
+    import torch
+
+    grid = input_ids.reshape(-1, num_codebooks, input_ids.shape[-1])
+    frames = grid.shape[-1] - num_codebooks
+    return torch.stack([grid[:, k, k + 1:k + 1 + frames] for k in range(num_codebooks)], dim=1)
+
+
+def slice_past(past_key_values, index: int, batch_size: int, length: int):
+    """One request's decoder cache out of a batch, cut to its first `length` positions
+
+    Rows are (batch,) or, with classifier-free guidance, (2 * batch,) with the
+    unconditional half second. Self-attention keys/values past `length` belong
+    to frames the continuation will overwrite and are dropped; cross-attention
+    entries are kept whole. The slices are copied so the batch cache can be freed.
+    """
+    import torch
+
+    layers = []
+    for layer in past_key_values:
+        rows = [index, batch_size + index] if layer[0].shape[0] == 2 * batch_size else [index]
+        rows = torch.tensor(rows, device=layer[0].device)
+        self_attn = tuple(tensor.index_select(0, rows)[:, :, :length].contiguous() for tensor in layer[:2])
+        cross_attn = tuple(tensor.index_select(0, rows) for tensor in layer[2:])
+        layers.append(self_attn + cross_attn)
+    return tuple(layers)
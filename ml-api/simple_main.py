@@ -1,11 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-import base64
-import io
 import numpy as np
-import wave
 from typing import Optional
+from audio_encoding import (
+    UnsupportedFormat,
+    audio_headers,
+    encode_audio,
+    encode_wav,
+    encode_wav_base64,
+    negotiate_format,
+    pcm16_bytes,
+    wav_header,
+)
 
 app = FastAPI(title="MusicGen LoRA API - Simple Version")
 
@@ -24,9 +32,10 @@ class GenerationRequest(BaseModel):
     top_k: int = 250
     top_p: float = 0.0
     lora_model: Optional[str] = None
+    format: Optional[str] = None  # json (base64, default), wav, pcm16, pcm_f32, flac or opus
 
-def generate_dummy_audio(duration: float = 10.0, sample_rate: int = 32000):
-    """Generate a simple sine wave as dummy audio"""
+def dummy_audio(duration: float = 10.0, sample_rate: int = 32000):
+    """Float samples of the dummy melody"""
     t = np.linspace(0, duration, int(sample_rate * duration), False)
     # Generate a simple melody with multiple frequencies
     frequencies = [440, 523, 659, 784]  # A, C, E, G notes
@@ -37,20 +46,35 @@ def generate_dummy_audio(duration: float = 10.0, sample_rate: int = 32000):
         end_time = (i + 1) * duration / len(frequencies)
         mask = (t >= start_time) & (t < end_time)
         audio[mask] = 0.3 * np.sin(2 * np.pi * freq * t[mask])
+    return audio
+
+def generate_dummy_audio(duration: float = 10.0, sample_rate: int = 32000):
+    """Generate a simple sine wave as dummy audio, returned as WAV bytes"""
+    return encode_wav(dummy_audio(duration, sample_rate), sample_rate)
+
+def iter_dummy_audio(duration: float = 10.0, sample_rate: int = 32000, block_seconds: float = 1.0):
+    """Yield the generate_dummy_audio melody block by block as float samples"""
+    total = int(sample_rate * duration)
+    step = duration / total if total else 0.0
+    block_samples = int(sample_rate * block_seconds)
+    frequencies = [440, 523, 659, 784]  # A, C, E, G notes
     
-    # Convert to 16-bit PCM
-    audio_int16 = (audio * 32767).astype(np.int16)
-    
-    # Create WAV file in memory
-    buffer = io.BytesIO()
-    with wave.open(buffer, 'wb') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 16-bit
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(audio_int16.tobytes())
-    
-    buffer.seek(0)
-    return buffer.getvalue()
+    for start in range(0, total, block_samples):
+        # Same time base as np.linspace(0, duration, total, False)
+        t = np.arange(start, min(start + block_samples, total)) * step
+        audio = np.zeros_like(t)
+        for i, freq in enumerate(frequencies):
+            start_time = i * duration / len(frequencies)
+            end_time = (i + 1) * duration / len(frequencies)
+            mask = (t >= start_time) & (t < end_time)
+            audio[mask] = 0.3 * np.sin(2 * np.pi * freq * t[mask])
+        yield audio
+
+def iter_dummy_wav(duration: float = 10.0, sample_rate: int = 32000):
+    """Yield a WAV header followed by 16-bit PCM blocks of dummy audio"""
+    yield wav_header(sample_rate, int(sample_rate * duration))
+    for block in iter_dummy_audio(duration, sample_rate):
+        yield pcm16_bytes(block)
 
 @app.get("/")
 async def root():
@@ -66,14 +90,17 @@ async def health_check():
     }
 
 @app.post("/generate")
-async def generate_music(request: GenerationRequest):
-    """Generate dummy music from text prompt"""
+async def generate_music(request: GenerationRequest, http_request: Request):
+    """Generate dummy music from text prompt in the format chosen by `format` or Accept"""
     try:
-        # Generate dummy audio
-        audio_data = generate_dummy_audio(request.duration)
+        audio_format = negotiate_format(request.format, http_request.headers.get("accept"))
+        audio = dummy_audio(request.duration)
+        if audio_format != "json":
+            body, media_type = encode_audio(audio, 32000, audio_format)
+            return Response(content=memoryview(body), media_type=media_type, headers=audio_headers(32000, audio_format))
         
-        # Encode as base64
-        audio_b64 = base64.b64encode(audio_data).decode()
+        # WAV written into one buffer, then base64-encoded
+        audio_b64 = encode_wav_base64(audio, 32000)
         
         return {
             "audio_data": audio_b64,
@@ -82,9 +109,16 @@ async def generate_music(request: GenerationRequest):
             "prompt": request.prompt,
             "note": "This is a dummy audio generation for testing purposes"
         }
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/stream")
+async def generate_music_stream(request: GenerationRequest):
+    """Stream dummy music as a chunked WAV response"""
+    return StreamingResponse(iter_dummy_wav(request.duration), media_type="audio/wav")
+
 @app.get("/models")
 async def list_available_models():
     """List available LoRA models"""
@@ -0,0 +1,339 @@
+"""
+Vectorized synthesis engine for the advanced mock generator.
+
+The chord/harmonic table for a prompt is built once as a SynthesisPlan and
+every measure is rendered from it in broadcasted blocks. Each sinusoid is
+factored with the angle-addition identity into a coarse table (one row every
+FINE_STEPS samples) and a fine table (the FINE_STEPS offsets inside a row), so
+a whole block of measures is a single batched matmul over
+(notes x harmonics) instead of one np.sin call per note, harmonic and second.
+
+Blocks are rendered concurrently on a thread pool (NumPy drops the GIL in
+the heavy calls). Each block draws its noise from its own PCG64 stream, the
+seed's stream jumped ahead by the block index, and block boundaries are
+fixed, so a seeded clip is identical whatever the thread count.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+SAMPLE_RATE = 32000
+FINE_STEPS = 160  # samples covered by one row of the coarse phase table
+RENDER_THREADS = int(os.environ.get("HARMONIX_RENDER_THREADS", "0")) or (os.cpu_count() or 1)
+
+# (keywords, style, base frequency), checked in order
+STYLE_RULES = (
+    (("electronic", "edm", "techno"), "electronic", 130.81),  # C3
+    (("classical", "piano", "orchestra"), "classical", 261.63),  # C4
+    (("rock", "guitar"), "rock", 82.41),  # E2
+    (("jazz",), "jazz", 220.00),  # A3
+    (("ambient", "peaceful", "calm"), "ambient", 174.61),  # F3
+)
+DEFAULT_STYLE = ("general", 261.63)  # C4 default
+
+# Overtones added on top of the fundamental: (harmonic numbers, amplitude)
+STYLE_HARMONICS = {
+    "electronic": ((2, 3, 5), 0.1),  # square wave harmonics
+    "classical": ((2, 3, 4, 5), 0.15),  # rich harmonics
+}
+
+
+def analyze_prompt(prompt: str):
+    """Determine the musical style and base frequency from a prompt"""
+    prompt_lower = prompt.lower()
+    for keywords, style, base_freq in STYLE_RULES:
+        if any(keyword in prompt_lower for keyword in keywords):
+            return style, base_freq
+    return DEFAULT_STYLE
+
+
+def apply_lora(base_freq: float, lora_model: str = None):
+    """Apply LoRA-like modifications, returning (base_freq, lora_factor)"""
+    lora_factor = 1.0
+    if lora_model:
+        if "jazz" in lora_model.lower():
+            lora_factor = 1.2
+            base_freq *= 1.1
+        elif "electronic" in lora_model.lower():
+            lora_factor = 0.8
+            base_freq *= 0.9
+        elif "classical" in lora_model.lower():
+            lora_factor = 1.1
+    return base_freq, lora_factor
+
+
+def chord_progression(base_freq: float, style: str):
+    """Generate the chord progression for a style based on musical theory"""
+    if style == "jazz":
+        # ii-V-I progression
+        return [
+            [base_freq * 9/8, base_freq * 5/4, base_freq * 3/2],  # ii
+            [base_freq * 5/4, base_freq * 3/2, base_freq * 15/8], # V
+            [base_freq, base_freq * 5/4, base_freq * 3/2],        # I
+            [base_freq * 6/5, base_freq * 3/2, base_freq * 9/5]   # vi
+        ]
+    elif style == "classical":
+        # I-V-vi-IV progression
+        return [
+            [base_freq, base_freq * 5/4, base_freq * 3/2],        # I
+            [base_freq * 3/2, base_freq * 15/8, base_freq * 9/4], # V
+            [base_freq * 6/5, base_freq * 3/2, base_freq * 9/5],  # vi
+            [base_freq * 4/3, base_freq * 5/3, base_freq * 2]     # IV
+        ]
+    elif style == "electronic":
+        # Simple bass + lead
+        return [
+            [base_freq, base_freq * 2],
+            [base_freq * 9/8, base_freq * 9/4],
+            [base_freq * 5/4, base_freq * 5/2],
+            [base_freq * 4/3, base_freq * 8/3]
+        ]
+    else:
+        # Basic triad
+        return [
+            [base_freq, base_freq * 5/4, base_freq * 3/2],
+            [base_freq * 9/8, base_freq * 45/32, base_freq * 27/16],
+            [base_freq * 5/4, base_freq * 25/16, base_freq * 15/8],
+            [base_freq * 4/3, base_freq * 5/3, base_freq * 2]
+        ]
+
+
+class SynthesisPlan:
+    """Chord/harmonic table for one prompt, built once per request"""
+
+    def __init__(self, style: str, base_freq: float, lora_factor: float = 1.0):
+        self.style = style
+        self.base_freq = base_freq
+        self.lora_factor = lora_factor
+        self.progression = chord_progression(base_freq, style)
+
+        harmonics, amplitude = STYLE_HARMONICS.get(style, ((), 0.0))
+        self.harmonics = (1,) + tuple(harmonics)
+        self.weights = np.array([0.3 * lora_factor] + [amplitude / h for h in harmonics])
+        # Angular frequency of every (chord, note, harmonic)
+        self.omegas = np.array([
+            [[2 * np.pi * freq * h for h in self.harmonics] for freq in chord]
+            for chord in self.progression
+        ])
+        # Rock distorts each note after summing its partials
+        self.distorted = style == "rock"
+
+    @classmethod
+    def from_prompt(cls, prompt: str, lora_model: str = None):
+        style, base_freq = analyze_prompt(prompt)
+        base_freq, lora_factor = apply_lora(base_freq, lora_model)
+        return cls(style, base_freq, lora_factor)
+
+    @property
+    def notes(self):
+        return self.omegas.shape[1]
+
+    def peak_bound(self, temperature: float = 1.0):
+        """Upper bound on |sample| before the envelope, used to fix the gain early when streaming"""
+        tone = 0.4 if self.distorted else float(np.sum(np.abs(self.weights)))
+        bound = self.notes * tone
+        if temperature > 1.0:
+            # Gaussian noise is unbounded; 6 sigma per note keeps misses negligible
+            bound += self.notes * 6 * (temperature - 1.0) * 0.1
+        return bound
+
+
+def noise_streams(seed=None):
+    """Block index -> independent np.random.Generator, the seed's PCG64 stream jumped ahead that many times
+
+    seed may be an int or a sequence of ints; without one the base seed is drawn
+    from the global NumPy stream, so np.random.seed() still fixes the output.
+    """
+    if seed is None:
+        seed = np.random.randint(2**32)
+    base = np.random.PCG64(seed)
+    return lambda block: np.random.Generator(base.jumped(block))
+
+
+def render_prompt(engine, prompt: str, duration: float = 10.0, temperature: float = 1.0, lora_model: str = None,
+                  seed=None, start_measure: int = 0):
+    """Mock audio for a prompt: analyze it, build its plan once and render it on `engine`"""
+    plan = SynthesisPlan.from_prompt(prompt, lora_model)
+    return engine.render(plan, duration, temperature, seed, start_measure)
+
+
+class SynthesisEngine:
+    """Render mock audio for a SynthesisPlan in broadcasted measure blocks"""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, block_measures: int = 16, threads: int = RENDER_THREADS):
+        if sample_rate % FINE_STEPS:
+            raise ValueError(f"sample_rate must be a multiple of {FINE_STEPS}")
+        self.sample_rate = sample_rate
+        # Also the unit of parallelism and of noise streams: changing it changes seeded output
+        self.block_measures = block_measures
+        self.rows_per_measure = sample_rate // FINE_STEPS
+        self.threads = threads
+        # Private pool: callers may already be running on a shared executor. Built here rather than
+        # on first use so concurrent renders cannot race to create it; its threads start lazily.
+        self._executor = (ThreadPoolExecutor(max_workers=threads, thread_name_prefix="harmonix-render")
+                          if threads > 1 else None)
+
+    def _map(self, fn, items):
+        """fn over items, on the render pool when there is more than one item and thread"""
+        items = list(items)
+        if self._executor is None or len(items) <= 1:
+            return [fn(item) for item in items]
+        return list(self._executor.map(fn, items))
+
+    def render(self, plan: SynthesisPlan, duration: float, temperature: float = 1.0, seed=None,
+               start_measure: int = 0):
+        """Render, fade and normalize a full clip
+
+        Blocks of block_measures measures render in parallel, each applying its
+        share of the fades and reporting its peak; normalization is then one
+        scaling pass into the float32 output. Noise comes from noise_streams(seed).
+        A non-zero start_measure continues an earlier clip: the chord
+        progression and oscillator phase pick up at that measure, and there is
+        no fade-in since the measure envelope is already zero there.
+        """
+        samples = int(duration * self.sample_rate)
+        measures = int(duration)
+        # Same time base as np.linspace(0, duration, samples, False)
+        step = duration / samples if samples else 0.0
+        noise = noise_streams(seed) if temperature > 1.0 else None
+
+        audio = np.zeros(samples)
+        body = audio[:measures * self.sample_rate].reshape(measures, self.sample_rate)
+        # The last block also covers the silent tail after the final whole measure
+        blocks = [(start, min(start + self.block_measures, measures))
+                  for start in range(0, measures, self.block_measures)] or [(0, 0)]
+        bounds = [(start * self.sample_rate, stop * self.sample_rate if stop < measures else samples)
+                  for start, stop in blocks]
+
+        def render_block(index):
+            start, stop = blocks[index]
+            if stop > start:
+                self.render_measures(plan, start_measure + start, start_measure + stop, step, temperature,
+                                     noise(index) if noise else None, out=body[start:stop])
+            lo, hi = bounds[index]
+            # Apply overall envelope to prevent clicks
+            segment = self._fade(audio[lo:hi], lo, samples, fade_in=start_measure == 0)
+            return np.max(np.abs(segment)) if hi > lo else 0.0
+
+        peak = max(self._map(render_block, range(len(blocks))))
+
+        # Normalize
+        out = np.empty(samples, dtype=np.float32)
+
+        def normalize_block(index):
+            lo, hi = bounds[index]
+            segment = np.divide(audio[lo:hi], peak, out=audio[lo:hi])
+            np.multiply(segment, 0.8, out=out[lo:hi], casting="same_kind")
+
+        self._map(normalize_block, range(len(blocks)))
+        return out
+
+    def _fade(self, block, offset: int, samples: int, fade_in: bool = True):
+        """Apply the slice of the clip's 100 ms fade-in/fade-out that falls inside block, in place"""
+        fade_samples = int(0.1 * self.sample_rate)  # 100ms fade
+        stop = offset + len(block)
+        if fade_in and offset < fade_samples:
+            end = min(stop, fade_samples)
+            block[:end - offset] *= np.linspace(0, 1, fade_samples)[offset:end]
+        if stop > samples - fade_samples:
+            begin = max(offset, samples - fade_samples)
+            ramp = np.linspace(1, 0, fade_samples)
+            block[begin - offset:] *= ramp[begin - (samples - fade_samples):stop - (samples - fade_samples)]
+        return block
+
+    def stream(self, plan: SynthesisPlan, duration: float, temperature: float = 1.0, seed=None):
+        """Yield normalized float32 blocks, one measure at a time, matching render()
+
+        The normalization gain needs the clip's peak. The envelope decays as
+        exp(-t / 2), so once the peak seen so far exceeds plan.peak_bound() for
+        every remaining measure the gain is final and all buffered measures are
+        released; in practice that happens after the first few measures.
+        """
+        samples = int(duration * self.sample_rate)
+        measures = int(duration)
+        step = duration / samples if samples else 0.0
+        bound = plan.peak_bound(temperature)
+        noise = noise_streams(seed) if temperature > 1.0 else None
+        rng = None
+
+        pending = []
+        peak = 0.0
+        gain_fixed = False
+        for measure in range(measures):
+            offset = measure * self.sample_rate
+            if noise and measure % self.block_measures == 0:
+                # Drawn measure by measure, a block's stream yields the same noise as in render()
+                rng = noise(measure // self.block_measures)
+            block = self.render_measures(plan, measure, measure + 1, step, temperature, rng)[0]
+            block = self._fade(block, offset, samples)
+            if gain_fixed:
+                yield (block / peak * 0.8).astype(np.float32)
+                continue
+
+            pending.append(block)
+            peak = max(peak, float(np.max(np.abs(block))))
+            if measure + 1 == measures or peak >= bound * np.exp(-0.5 * (measure + 1)):
+                gain_fixed = True
+                for block in pending:
+                    yield (block / peak * 0.8).astype(np.float32)
+                pending = []
+
+        tail = samples - measures * self.sample_rate
+        if tail:
+            yield np.zeros(tail, dtype=np.float32)
+
+    def render_measures(self, plan: SynthesisPlan, start: int, stop: int, step: float,
+                        temperature: float = 1.0, rng=None, out=None):
+        """Render measures [start, stop) into a (measures, sample_rate) array"""
+        count = stop - start
+        if out is None:
+            out = np.empty((count, self.sample_rate))
+        fine_t = np.arange(FINE_STEPS) * step
+        coarse_t = (np.arange(start * self.rows_per_measure, stop * self.rows_per_measure)
+                    * FINE_STEPS * step).reshape(count, self.rows_per_measure)
+
+        # Noise is drawn for the whole block up front, in (measure, note, sample)
+        # order, so seeded output matches rendering one measure at a time.
+        noise = None
+        if temperature > 1.0:
+            noise_factor = (temperature - 1.0) * 0.1
+            noise = (rng or np.random).normal(0, noise_factor, (count, plan.notes, self.sample_rate))
+
+        chords = (np.arange(start, stop) % len(plan.progression))
+        for chord in np.unique(chords):
+            rows = np.flatnonzero(chords == chord)
+            tones = self._chord_tones(plan, chord, coarse_t[rows].ravel(), fine_t)
+            tones = tones.reshape(plan.notes, len(rows), self.sample_rate)
+            if plan.distorted:
+                tones = np.tanh(tones * 2) * 0.4
+            segment = tones.sum(axis=0)
+            if noise is not None:
+                segment += noise[rows].sum(axis=1)
+            out[rows] = segment
+
+        out *= self._envelope(coarse_t.ravel(), fine_t).reshape(count, self.sample_rate)
+        return out
+
+    def _chord_tones(self, plan, chord, coarse_t, fine_t):
+        """Per-note sum of weighted partials, shape (notes, len(coarse_t), FINE_STEPS)"""
+        omegas = plan.omegas[chord]  # (notes, harmonics)
+        # sin(w(T + tau)) = sin(wT) cos(w tau) + cos(wT) sin(w tau)
+        coarse = coarse_t[None, :, None] * omegas[:, None, :]
+        coarse_table = np.concatenate(
+            [np.sin(coarse) * plan.weights, np.cos(coarse) * plan.weights], axis=2
+        )
+        fine = omegas[:, :, None] * fine_t
+        fine_table = np.concatenate([np.cos(fine), np.sin(fine)], axis=1)
+        return np.matmul(coarse_table, fine_table)
+
+    @staticmethod
+    def _envelope(coarse_t, fine_t):
+        """exp(-t / 2) * sin(pi t), factored the same way as the partials"""
+        decay_coarse = np.exp(-coarse_t * 0.5)
+        decay_fine = np.exp(-fine_t * 0.5)
+        return np.add(
+            np.multiply.outer(decay_coarse * np.sin(np.pi * coarse_t), decay_fine * np.cos(np.pi * fine_t)),
+            np.multiply.outer(decay_coarse * np.cos(np.pi * coarse_t), decay_fine * np.sin(np.pi * fine_t)),
+        )
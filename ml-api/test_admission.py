@@ -0,0 +1,70 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+os.environ.setdefault("HARMONIX_MODEL_MODE", "mock")
+os.environ.setdefault("HARMONIX_WORKERS", "0")
+
+from fastapi.testclient import TestClient
+
+import lightweight_main
+from admission import AdmissionController, Overloaded
+from lightweight_main import app, music_service
+
+
+def test_acquire_rejects_at_capacity_with_retry_after():
+    controller = AdmissionController(max_in_flight=1)
+    slot = controller.acquire()
+    with pytest.raises(Overloaded) as excinfo:
+        controller.acquire()
+    assert 1 <= excinfo.value.retry_after <= 60
+    slot.release()
+    slot.release()  # idempotent
+    assert controller.stats()["in_flight"] == 0
+    assert controller.stats()["rejected"] == 1
+    controller.acquire().release()
+
+
+def test_release_soon_runs_on_the_event_loop():
+    controller = AdmissionController(max_in_flight=1)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        slot = controller.acquire()
+        released_on = []
+        controller._release = lambda seconds: released_on.append(threading.get_ident())
+        thread = threading.Thread(target=slot.release_soon, args=(loop,))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        return released_on
+
+    assert asyncio.run(run()) == [threading.get_ident()]
+
+
+@pytest.mark.skipif(lightweight_main.MODEL_MODE != "mock", reason="needs HARMONIX_MODEL_MODE=mock")
+class TestEndpoints:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(music_service, "admission", AdmissionController(max_in_flight=1))
+        with TestClient(app) as client:
+            yield client
+
+    def test_generate_returns_503_with_retry_after_at_capacity(self, client):
+        slot = music_service.admission.acquire()
+        try:
+            response = client.post("/generate", json={"prompt": "over capacity", "duration": 1.0})
+        finally:
+            slot.release()
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        assert client.post("/generate", json={"prompt": "over capacity", "duration": 1.0}).status_code == 200
+
+    def test_stream_releases_its_slot(self, client):
+        response = client.post("/generate/stream", json={"prompt": "streamed", "duration": 1.0})
+        assert response.status_code == 200
+        assert response.content[:4] == b"RIFF"
+        assert music_service.admission.in_flight == 0
+        assert music_service.admission.admitted == 1
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from audio_encoding import UnsupportedFormat, encode_wav, negotiate_format, pcm16_bytes, wav_header
+
+
+def test_negotiate_format_prefers_explicit_field():
+    assert negotiate_format("WAV", accept="application/json") == "wav"
+
+
+def test_negotiate_format_defaults_to_json():
+    assert negotiate_format() == "json"
+    assert negotiate_format(accept="*/*") == "json"
+
+
+def test_negotiate_format_orders_by_quality_then_position():
+    assert negotiate_format(accept="application/json;q=0.5, audio/wav") == "wav"
+    assert negotiate_format(accept="audio/flac, audio/wav") == "flac"
+    assert negotiate_format(accept="audio/*") == "wav"
+
+
+def test_negotiate_format_skips_zero_quality_and_unknown_types():
+    assert negotiate_format(accept="audio/wav;q=0, text/html, application/json") == "json"
+    with pytest.raises(UnsupportedFormat):
+        negotiate_format(accept="text/html, audio/wav;q=0")
+    with pytest.raises(UnsupportedFormat):
+        negotiate_format("mp3")
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_pcm16_matches_whole_clip_conversion(dtype):
+    audio = np.random.default_rng(0).uniform(-1.2, 1.2, 100_003).astype(dtype)
+    expected = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    assert bytes(pcm16_bytes(audio)) == expected.tobytes()
+
+
+def test_encode_wav_header_and_size():
+    audio = np.zeros(1000, dtype=np.float32)
+    body = encode_wav(audio, 32000)
+    assert len(body) == 44 + 2 * 1000
+    assert bytes(body[:44]) == wav_header(32000, 1000)
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("HARMONIX_MODEL_MODE", "mock")
+os.environ.setdefault("HARMONIX_WORKERS", "0")
+
+from fastapi import HTTPException
+
+from lightweight_main import GenerationRequest, MusicGenService
+
+
+class BrokenModel:
+    """Stands in for a real model whose generate() fails"""
+
+    def __getattr__(self, name):
+        raise RuntimeError("out of memory")
+
+
+@pytest.fixture
+def service():
+    service = MusicGenService(workers=0)
+    service.model = {"model": BrokenModel(), "processor": None}
+    service.sessions.max_sessions = 0  # seeded real results are cacheable without /continue
+    yield service
+    service.executor.shutdown()
+    service.cpu_executor.shutdown()
+
+
+def test_real_model_failure_is_a_500_not_mock_audio(service):
+    request = GenerationRequest(prompt="solo piano", duration=1.0, seed=3)
+    assert service.is_cacheable(request, "real")
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(service.generate_music_async(request))
+    assert excinfo.value.status_code == 500
+    assert service.result_cache.stats()["entries"] == 0
+
+
+def test_every_request_in_a_failed_batch_sees_the_error(service):
+    service.batcher.max_wait = 0.05
+    requests = [GenerationRequest(prompt=f"clip {i}", duration=1.0) for i in range(3)]
+
+    async def run():
+        return await asyncio.gather(*(service.generate_music_async(request) for request in requests),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, HTTPException) and result.status_code == 500 for result in results)
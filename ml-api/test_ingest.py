@@ -0,0 +1,52 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip("soundfile")
+
+from training_data import MANIFEST_FILE, ingest, read_manifest, read_metadata
+
+
+def write_corpus(data_dir, names):
+    metadata = []
+    for name in names:
+        sf.write(os.path.join(data_dir, name), np.zeros(3200, dtype=np.float32), 16000)
+        metadata.append({"audio_file": name, "prompt": f"prompt for {name}"})
+    with open(os.path.join(data_dir, "metadata.json"), "w") as f:
+        json.dump(metadata, f)
+
+
+def test_ingest_rejects_broken_files(tmp_path):
+    write_corpus(tmp_path, ["a.wav", "b.wav"])
+    (tmp_path / "b.wav").write_bytes(b"not audio")
+    records = ingest(str(tmp_path), workers=1)
+    assert [record["valid"] for record in records] == [True, False]
+    assert set(read_manifest(str(tmp_path / MANIFEST_FILE))) == {"a.wav", "b.wav"}
+    assert [sample["audio_file"] for sample in read_metadata(str(tmp_path))] == ["a.wav"]
+
+
+def test_entries_added_after_ingest_are_not_dropped(tmp_path, caplog):
+    write_corpus(tmp_path, ["a.wav"])
+    ingest(str(tmp_path), workers=1)
+    write_corpus(tmp_path, ["a.wav", "c.wav"])
+
+    with caplog.at_level(logging.WARNING, logger="training_data"):
+        samples = read_metadata(str(tmp_path))
+    assert [sample["audio_file"] for sample in samples] == ["a.wav", "c.wav"]
+    assert "1 metadata.json entries are not in" in caplog.text
+
+    ingest(str(tmp_path), workers=1)
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="training_data"):
+        assert len(read_metadata(str(tmp_path))) == 2
+    assert caplog.text == ""
+
+
+def test_entries_removed_from_metadata_are_dropped(tmp_path):
+    write_corpus(tmp_path, ["a.wav", "b.wav"])
+    ingest(str(tmp_path), workers=1)
+    write_corpus(tmp_path, ["b.wav"])
+    assert [sample["audio_file"] for sample in read_metadata(str(tmp_path))] == ["b.wav"]
@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from jobs import JobQueue, QueueFull
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_rejects_when_the_queue_is_full():
+    async def scenario():
+        queue = JobQueue(run=None, max_queue=2, per_client=10)
+        queue.available = asyncio.Condition()  # no runners: jobs stay queued
+        await queue.submit(SimpleNamespace(duration=1), "a")
+        await queue.submit(SimpleNamespace(duration=1), "b")
+        with pytest.raises(QueueFull):
+            await queue.submit(SimpleNamespace(duration=1), "c")
+        assert queue.stats()["rejected"] == 1
+
+    run(scenario())
+
+
+def test_limits_active_jobs_per_client():
+    async def scenario():
+        queue = JobQueue(run=None, max_queue=10, per_client=2)
+        queue.available = asyncio.Condition()
+        await queue.submit(SimpleNamespace(duration=1), "a")
+        job = await queue.submit(SimpleNamespace(duration=1), "a")
+        with pytest.raises(QueueFull):
+            await queue.submit(SimpleNamespace(duration=1), "a")
+        await queue.submit(SimpleNamespace(duration=1), "b")
+        queue.cancel(job.id)
+        await queue.submit(SimpleNamespace(duration=1), "a")
+
+    run(scenario())
+
+
+def test_runs_by_priority_then_submission_order():
+    async def scenario():
+        order = []
+
+        async def record(job):
+            order.append(job.request)
+
+        queue = JobQueue(run=record, concurrency=1, per_client=10)
+        queue.available = asyncio.Condition()
+        jobs = [await queue.submit(name, "a", priority) for name, priority in (("low", 5), ("first", 0), ("second", 0))]
+        queue.start()
+        while any(job.status != "succeeded" for job in jobs):
+            await asyncio.sleep(0)
+        await queue.stop()
+        assert order == ["first", "second", "low"]
+
+    run(scenario())
+
+
+def test_keeps_at_most_max_results_finished_jobs():
+    async def scenario():
+        async def finish(job):
+            return {"audio": job.request}
+
+        queue = JobQueue(run=finish, concurrency=1, per_client=10, max_results=2)
+        queue.start()
+        jobs = [await queue.submit(i, "a") for i in range(4)]
+        while queue.completed < 4:
+            await asyncio.sleep(0)
+        await queue.stop()
+        assert queue.get(jobs[0].id) is None and queue.get(jobs[1].id) is None
+        assert queue.get(jobs[3].id).result == {"audio": 3}
+        assert queue.stats()["evicted"] == 2
+
+    run(scenario())
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("HARMONIX_MODEL_MODE", "mock")
+os.environ.setdefault("HARMONIX_WORKERS", "0")
+
+from fastapi.testclient import TestClient
+
+import lightweight_main
+from audio_encoding import encode_wav, wav_header
+from lightweight_main import app, music_service
+
+pytestmark = pytest.mark.skipif(lightweight_main.MODEL_MODE != "mock", reason="needs HARMONIX_MODEL_MODE=mock")
+
+REQUEST = {"prompt": "ambient pads", "duration": 2.0, "seed": 7}
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def test_cache_hits_get_their_own_generation_id(client):
+    first = client.post("/generate", json=REQUEST)
+    hits_before = music_service.result_cache.stats()["hits"]
+    second = client.post("/generate", json=REQUEST)
+    assert first.status_code == second.status_code == 200
+    assert music_service.result_cache.stats()["hits"] == hits_before + 1
+    assert first.json()["audio_data"] == second.json()["audio_data"]
+    assert first.json()["generation_id"] != second.json()["generation_id"]
+
+
+def test_each_cached_generation_continues_independently(client):
+    ids = [client.post("/generate", json=REQUEST).json()["generation_id"] for _ in range(2)]
+    for generation_id in ids:
+        response = client.post("/continue", json={"generation_id": generation_id, "duration": 1.0})
+        assert response.status_code == 200
+        assert response.json()["offset"] == REQUEST["duration"]
+
+
+def test_binary_cache_hits_get_their_own_generation_id(client):
+    headers = [client.post("/generate", json={**REQUEST, "format": "wav"}).headers for _ in range(2)]
+    assert headers[0]["X-Generation-Id"] != headers[1]["X-Generation-Id"]
+
+
+def test_stream_is_a_complete_wav_of_the_rendered_clip(client):
+    response = client.post("/generate/stream", json={**REQUEST, "duration": 3.5})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/wav"
+    body = response.content
+    samples = int(3.5 * 32000)
+    assert body[:44] == wav_header(32000, samples)
+    assert len(body) == 44 + 2 * samples
+    # Streamed blocks are normalized measure by measure; allow one LSB of rounding
+    rendered = music_service.generate_advanced_audio(REQUEST["prompt"], 3.5, seed=REQUEST["seed"])
+    expected = np.frombuffer(encode_wav(rendered, 32000), dtype="<i2", offset=44)
+    streamed = np.frombuffer(body, dtype="<i2", offset=44)
+    assert np.max(np.abs(streamed.astype(np.int32) - expected)) <= 1
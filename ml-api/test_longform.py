@@ -0,0 +1,54 @@
+import numpy as np
+
+from longform import crossfade, generate_windows, is_longform
+
+SAMPLES_PER_FRAME = 4
+
+
+def fake_model(calls):
+    """run_window whose audio is a ramp over absolute frame positions, so seams show up as jumps"""
+    position = [0]
+
+    def run_window(prompt, new_frames):
+        prompt_frames = 0 if prompt is None else prompt.shape[-1]
+        start = position[0] - prompt_frames
+        frames = np.arange(start, start + prompt_frames + new_frames)
+        position[0] += new_frames
+        calls.append((prompt_frames, new_frames))
+        codes = np.broadcast_to(frames, (1, 2, len(frames)))
+        audio = np.repeat(frames.astype(np.float32), SAMPLES_PER_FRAME)[None, :]
+        return audio, codes
+
+    return run_window
+
+
+def test_is_longform():
+    assert is_longform(60, window_seconds=30)
+    assert not is_longform(30, window_seconds=30)
+    assert not is_longform(600, window_seconds=0)
+
+
+def test_crossfade_ramps_from_previous_to_current():
+    mixed = crossfade(np.zeros(4, dtype=np.float32), np.ones(4, dtype=np.float32))
+    assert mixed.tolist() == [0.0, 0.25, 0.5, 0.75]
+    assert np.allclose(crossfade(np.full(8, 0.5), np.full(8, 0.5)), 0.5)
+
+
+def test_windows_cover_the_duration_without_seams():
+    calls = []
+    blocks = list(generate_windows(fake_model(calls), duration=25, frame_rate=1, window_seconds=10,
+                                   context_seconds=4, crossfade_seconds=2))
+    audio = np.concatenate(blocks, axis=-1)[0]
+    assert audio.shape[-1] == 25 * SAMPLES_PER_FRAME
+    # Every window re-renders the same frames, so the crossfaded audio is one continuous ramp
+    assert np.array_equal(audio, np.repeat(np.arange(25, dtype=np.float32), SAMPLES_PER_FRAME))
+    assert calls[0] == (0, 10)
+    assert all(prompt == 4 and new <= 6 for prompt, new in calls[1:])
+    assert sum(new for _, new in calls) == 25
+
+
+def test_short_clip_is_one_window():
+    calls = []
+    blocks = list(generate_windows(fake_model(calls), duration=5, frame_rate=1, window_seconds=10))
+    assert calls == [(0, 5)]
+    assert blocks[0].shape[-1] == 5 * SAMPLES_PER_FRAME
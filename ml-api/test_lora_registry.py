@@ -0,0 +1,78 @@
+import pytest
+
+from lora_registry import LoraRegistry
+
+
+class RecordingBackend:
+    """Backend that logs every call instead of touching a model"""
+
+    def __init__(self):
+        self.calls = []
+
+    def load(self, name, path):
+        self.calls.append(("load", name))
+        return {"r": 4}
+
+    def activate(self, name):
+        self.calls.append(("activate", name))
+
+    def deactivate(self):
+        self.calls.append(("deactivate",))
+
+    def unload(self, name):
+        self.calls.append(("unload", name))
+
+
+@pytest.fixture
+def adapters(tmp_path):
+    paths = {}
+    for name, size in (("a", 100), ("b", 100), ("c", 100), ("big", 250)):
+        path = tmp_path / name
+        path.mkdir()
+        (path / "adapter_model.bin").write_bytes(b"\0" * size)
+        paths[name] = str(path)
+    return paths
+
+
+def test_hot_swap_loads_each_adapter_once(adapters):
+    backend = RecordingBackend()
+    registry = LoraRegistry(backend, max_adapters=2, max_bytes=1000)
+    for name in ("a", "b", "a", "b", "b"):
+        assert registry.activate(name, adapters[name])
+    assert [call for call in backend.calls if call[0] == "load"] == [("load", "a"), ("load", "b")]
+    # Re-activating the active adapter is free; switching only swaps
+    assert [call for call in backend.calls if call[0] == "activate"] == [("activate", name) for name in "abab"]
+    assert registry.info("b")["status"] == "active"
+    assert registry.info("a")["status"] == "loaded"
+    assert registry.info("a")["stats"]["loads"] == 1
+
+
+def test_least_recently_used_adapter_is_evicted_at_capacity(adapters):
+    backend = RecordingBackend()
+    registry = LoraRegistry(backend, max_adapters=2, max_bytes=1000)
+    registry.activate("a", adapters["a"])
+    registry.activate("b", adapters["b"])
+    registry.activate("a", adapters["a"])
+    registry.activate("c", adapters["c"])
+    assert ("unload", "b") in backend.calls
+    assert registry.stats()["resident"] == ["a", "c"]
+    assert registry.stats()["bytes"] == 200
+    assert registry.info("b")["stats"]["evictions"] == 1
+
+
+def test_byte_budget_evicts_before_loading(adapters):
+    registry = LoraRegistry(RecordingBackend(), max_adapters=4, max_bytes=300)
+    registry.activate("a", adapters["a"])
+    registry.activate("b", adapters["b"])
+    registry.activate("big", adapters["big"])
+    assert registry.stats()["resident"] == ["big"]
+    assert registry.stats()["bytes"] == 250
+
+
+def test_missing_adapter_falls_back_to_the_base_model(adapters):
+    backend = RecordingBackend()
+    registry = LoraRegistry(backend)
+    registry.activate("a", adapters["a"])
+    assert not registry.activate("gone", adapters["a"] + "-missing")
+    assert registry.active is None
+    assert backend.calls[-1] == ("deactivate",)
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+import model_loader
+from model_loader import ModelNotReady, SingleFlightLoader
+
+
+class Load:
+    """Async load that counts calls and finishes when released"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_concurrent_callers_share_one_load():
+    load = Load(["model"])
+
+    async def scenario():
+        load.release = asyncio.Event()
+        loader = SingleFlightLoader(load, policy="park", timeout=5)
+        callers = [asyncio.ensure_future(loader.get()) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert loader.stats()["parked"] == 5
+        load.release.set()
+        return await asyncio.gather(*callers), loader
+
+    results, loader = asyncio.run(scenario())
+    assert results == ["model"] * 5
+    assert load.calls == 1
+    assert loader.stats()["parked_total"] == 5
+    assert loader.stats()["parked"] == 0
+
+
+def test_reject_policy_turns_callers_away_while_loading():
+    load = Load(["model"])
+
+    async def scenario():
+        load.release = asyncio.Event()
+        loader = SingleFlightLoader(load, policy="reject")
+        with pytest.raises(ModelNotReady) as excinfo:
+            await loader.get()
+        assert excinfo.value.retry_after == model_loader.LOAD_RETRY_AFTER
+        assert loader.loading
+        load.release.set()
+        assert await loader.get(park=True) == "model"
+        return loader
+
+    loader = asyncio.run(scenario())
+    assert loader.stats()["rejected"] == 1
+    assert load.calls == 1
+
+
+def test_park_times_out_without_cancelling_the_load():
+    load = Load(["model"])
+
+    async def scenario():
+        load.release = asyncio.Event()
+        loader = SingleFlightLoader(load, policy="park", timeout=0.01)
+        with pytest.raises(ModelNotReady):
+            await loader.get()
+        assert loader.loading
+        load.release.set()
+        return await loader.get()
+
+    assert asyncio.run(scenario()) == "model"
+    assert load.calls == 1
+
+
+def test_failed_load_backs_off_before_retrying(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_loader.time, "monotonic", lambda: now[0])
+    load = Load([RuntimeError("no weights"), None, "model"])
+
+    async def scenario():
+        load.release = asyncio.Event()
+        load.release.set()
+        loader = SingleFlightLoader(load, policy="park", timeout=5, retry_seconds=10)
+        assert await loader.get() is None
+        assert loader.failed and loader.retry_in() == 10
+        error = loader.not_ready()
+        assert "no weights" in str(error) and error.retry_after == 10
+
+        # Inside the backoff callers get the failure without a new attempt
+        assert await loader.get() is None
+        assert load.calls == 1
+
+        # The next failure doubles the backoff
+        now[0] += 10
+        assert await loader.get() is None
+        assert load.calls == 2
+        assert loader.retry_in() == 20
+
+        now[0] += 20
+        assert await loader.get() == "model"
+        return loader
+
+    loader = asyncio.run(scenario())
+    assert loader.stats()["failures"] == 2
+    assert loader.error is None
+    assert load.calls == 3
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from result_cache import ResultCache, cache_key
+
+
+def request(**fields):
+    params = dict(prompt="ambient pads", duration=10.0, temperature=1.0, top_k=250, top_p=0.0,
+                  lora_model=None, seed=42)
+    params.update(fields)
+    return SimpleNamespace(**params)
+
+
+def test_cache_key_is_stable_and_ignores_unrelated_fields():
+    assert cache_key(request(), "mock") == cache_key(request(), "mock")
+    assert cache_key(request(), "mock") == cache_key(request(format="wav", generation_id="x"), "mock")
+
+
+def test_cache_key_changes_with_each_parameter():
+    base = cache_key(request(), "mock")
+    variants = [
+        cache_key(request(prompt="drums"), "mock"),
+        cache_key(request(duration=11.0), "mock"),
+        cache_key(request(temperature=0.9), "mock"),
+        cache_key(request(top_k=50), "mock"),
+        cache_key(request(top_p=0.9), "mock"),
+        cache_key(request(lora_model="jazz"), "mock"),
+        cache_key(request(seed=43), "mock"),
+        cache_key(request(), "real"),
+        cache_key(request(), "mock", "wav"),
+    ]
+    assert base not in variants
+    assert len(set(variants)) == len(variants)
+
+
+def test_lru_evicts_oldest_within_byte_budget():
+    cache = ResultCache(max_bytes=250)
+    cache.put("a", {"body": b"x" * 100})
+    cache.put("b", {"body": b"x" * 100})
+    cache.get("a")
+    cache.put("c", {"body": b"x" * 100})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.bytes_used == 200
+
+
+def test_oversized_results_are_not_cached():
+    cache = ResultCache(max_bytes=10)
+    cache.put("a", {"body": b"x" * 100})
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    result = {"sample_rate": 32000, "headers": {"X-Model-Type": "mock"}, "body": b"\x00\x01\n\x02"}
+    ResultCache(cache_dir=str(tmp_path)).put("key", result)
+
+    cache = ResultCache(cache_dir=str(tmp_path))
+    assert cache.lookup("key") is None
+    assert cache.get("key") == result
+    assert cache.lookup("key") == result
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_promote_counts_misses():
+    cache = ResultCache()
+    assert cache.promote("key", cache.read_disk("key")) is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,94 @@
+import time
+
+import numpy as np
+import pytest
+
+from sessions import SessionStore, slice_past
+
+
+def state(nbytes):
+    return {"codes": np.zeros(nbytes, dtype=np.uint8)}
+
+
+def test_create_and_get_track_bytes():
+    store = SessionStore(max_sessions=4, max_bytes=1000)
+    session = store.create("request", "mock", 5.0, state(100))
+    assert store.get(session.id) is session
+    assert store.bytes_used == 100
+    assert store.get("unknown") is None
+
+
+def test_disabled_store_creates_nothing():
+    store = SessionStore(max_sessions=0)
+    assert not store.enabled
+    assert store.create("request", "mock", 5.0, {}) is None
+
+
+def test_evicts_least_recently_used_by_count():
+    store = SessionStore(max_sessions=2, max_bytes=10_000)
+    first = store.create("a", "mock", 1.0, {})
+    second = store.create("b", "mock", 1.0, {})
+    store.get(first.id)
+    third = store.create("c", "mock", 1.0, {})
+    assert set(store.sessions) == {first.id, third.id}
+    assert store.get(second.id) is None
+    assert store.evictions == 1
+
+
+def test_evicts_by_bytes_but_keeps_the_newest():
+    store = SessionStore(max_sessions=8, max_bytes=250)
+    first = store.create("a", "mock", 1.0, state(100))
+    store.create("b", "mock", 1.0, state(100))
+    huge = store.create("c", "mock", 1.0, state(1000))
+    assert list(store.sessions) == [huge.id]
+    assert store.bytes_used == 1000
+    assert store.get(first.id) is None
+
+
+def test_advance_updates_seconds_and_budget():
+    store = SessionStore(max_sessions=4, max_bytes=1000)
+    session = store.create("a", "mock", 5.0, state(100))
+    store.advance(session, 3.0, state(300))
+    assert session.seconds == 8.0
+    assert session.continuations == 1
+    assert store.bytes_used == 300
+
+
+def test_advance_of_evicted_session_stays_out_of_budget():
+    store = SessionStore(max_sessions=1, max_bytes=1000)
+    session = store.create("a", "mock", 5.0, state(100))
+    store.create("b", "mock", 5.0, state(100))
+    store.advance(session, 1.0, state(500))
+    assert store.bytes_used == 100
+
+
+def test_expires_after_ttl():
+    store = SessionStore(max_sessions=4, ttl=0.01)
+    session = store.create("a", "mock", 1.0, {})
+    time.sleep(0.02)
+    assert store.get(session.id) is None
+    assert store.expirations == 1
+
+
+def test_slice_past_picks_rows_and_truncates_self_attention():
+    torch = pytest.importorskip("torch")
+    batch, heads, length, dim = 3, 2, 10, 4
+    # Classifier-free guidance doubles the rows: conditional first, unconditional second
+    layer = tuple(torch.arange(2 * batch, dtype=torch.float32).view(-1, 1, 1, 1).expand(2 * batch, heads, length, dim)
+                  + offset for offset in (0, 100, 200, 300))
+    (sliced,) = slice_past((layer,), index=1, batch_size=batch, length=6)
+    key, value, cross_key, cross_value = sliced
+    assert key.shape == (2, heads, 6, dim)
+    assert key[:, 0, 0, 0].tolist() == [1.0, 4.0]
+    assert value[:, 0, 0, 0].tolist() == [101.0, 104.0]
+    assert cross_key.shape == (2, heads, length, dim)
+    assert cross_value[:, 0, 0, 0].tolist() == [301.0, 304.0]
+    assert key.is_contiguous()
+
+
+def test_slice_past_without_guidance():
+    torch = pytest.importorskip("torch")
+    layer = tuple(torch.arange(2, dtype=torch.float32).view(-1, 1, 1, 1).expand(2, 1, 5, 1).clone() for _ in range(2))
+    ((key, value),) = slice_past((layer,), index=1, batch_size=2, length=3)
+    assert key.shape == (1, 1, 3, 1)
+    assert key.flatten().tolist() == [1.0, 1.0, 1.0]
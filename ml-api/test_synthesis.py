@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from benchmarks.common import PROMPTS
+from benchmarks.mock_synthesis import legacy_generate_advanced_audio
+from synthesis import SynthesisEngine, SynthesisPlan
+
+
+@pytest.mark.parametrize("prompt", PROMPTS)
+@pytest.mark.parametrize("duration", [1.0, 2.5, 20.0])
+def test_render_matches_the_legacy_loop(prompt, duration):
+    reference = legacy_generate_advanced_audio(prompt, duration)
+    rendered = SynthesisEngine(threads=1).render(SynthesisPlan.from_prompt(prompt), duration)
+    assert rendered.dtype == np.float32
+    assert rendered.shape == reference.shape
+    assert np.max(np.abs(reference - rendered)) < 1e-6
+
+
+def test_render_matches_the_legacy_loop_with_lora():
+    prompt = "classical piano sonata"
+    reference = legacy_generate_advanced_audio(prompt, 3.0, lora_model="jazz_v1")
+    rendered = SynthesisEngine(threads=1).render(SynthesisPlan.from_prompt(prompt, "jazz_v1"), 3.0)
+    assert np.max(np.abs(reference - rendered)) < 1e-6
+
+
+def test_noise_is_seeded():
+    engine = SynthesisEngine(threads=1)
+    plan = SynthesisPlan.from_prompt("rock guitar riff")
+    first = engine.render(plan, 2.0, temperature=1.5, seed=11)
+    assert np.array_equal(first, engine.render(plan, 2.0, temperature=1.5, seed=11))
+    assert not np.array_equal(first, engine.render(plan, 2.0, temperature=1.5, seed=12))
+
+
+@pytest.mark.parametrize("temperature", [1.0, 1.5])
+def test_parallel_chunks_match_one_thread(temperature):
+    plan = SynthesisPlan.from_prompt("smooth jazz")
+    serial = SynthesisEngine(block_measures=4, threads=1).render(plan, 18.5, temperature, seed=5)
+    parallel = SynthesisEngine(block_measures=4, threads=4).render(plan, 18.5, temperature, seed=5)
+    assert np.array_equal(serial, parallel)
+
+
+def test_chunk_size_does_not_change_noise_free_output():
+    plan = SynthesisPlan.from_prompt("calm ambient pad")
+    chunked = SynthesisEngine(block_measures=3, threads=4).render(plan, 20.0)
+    whole = SynthesisEngine(block_measures=64, threads=1).render(plan, 20.0)
+    assert np.max(np.abs(chunked - whole)) < 1e-6
+
+
+def test_concurrent_renders_share_one_engine():
+    engine = SynthesisEngine(block_measures=2, threads=4)
+    plan = SynthesisPlan.from_prompt("rock guitar riff")
+    expected = engine.render(plan, 12.0, 1.5, seed=9)
+    with ThreadPoolExecutor(max_workers=4) as callers:
+        results = list(callers.map(lambda _: engine.render(plan, 12.0, 1.5, seed=9), range(8)))
+    assert all(np.array_equal(result, expected) for result in results)
+
+
+@pytest.mark.parametrize("temperature", [1.0, 1.5])
+def test_stream_matches_render(temperature):
+    engine = SynthesisEngine(block_measures=4, threads=1)
+    plan = SynthesisPlan.from_prompt("upbeat electronic dance music with synthesizers")
+    streamed = np.concatenate(list(engine.stream(plan, 10.5, temperature, seed=2)))
+    rendered = engine.render(plan, 10.5, temperature, seed=2)
+    assert streamed.shape == rendered.shape
+    assert np.max(np.abs(streamed - rendered)) < 1e-6
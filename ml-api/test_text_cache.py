@@ -0,0 +1,79 @@
+import gc
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from text_cache import TextConditioningCache
+
+
+class Processor:
+    """Whitespace tokenizer: one id per word, right-padded"""
+
+    def __call__(self, text, padding=True, return_tensors="pt"):
+        ids = [[len(word) for word in prompt.split()] for prompt in text]
+        length = max(len(row) for row in ids)
+        return {
+            "input_ids": torch.tensor([row + [0] * (length - len(row)) for row in ids]),
+            "attention_mask": torch.tensor([[1] * len(row) + [0] * (length - len(row)) for row in ids]),
+        }
+
+
+class Encoder(torch.nn.Module):
+    def __init__(self, scale=1.0):
+        super().__init__()
+        self.scale = scale
+        self.calls = 0
+
+    def forward(self, input_ids, attention_mask, return_dict=True):
+        self.calls += 1
+        hidden = input_ids.unsqueeze(-1).float().expand(-1, -1, 3) * self.scale
+        return SimpleNamespace(last_hidden_state=hidden)
+
+
+def model_with(encoder):
+    return SimpleNamespace(get_text_encoder=lambda: encoder)
+
+
+def test_only_missing_prompts_are_encoded():
+    cache, encoder = TextConditioningCache(), Encoder()
+    model = model_with(encoder)
+    cache.encode(model, Processor(), ["soft piano", "loud  drums"], "cpu")
+    out = cache.encode(model, Processor(), ["loud drums", "soft piano", "new prompt here"], "cpu")
+    assert encoder.calls == 2
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 3
+    assert out["input_ids"].tolist() == [[4, 5, 0], [4, 5, 0], [3, 6, 4]]
+    assert out["attention_mask"].tolist() == [[1, 1, 0], [1, 1, 0], [1, 1, 1]]
+    assert out["encoder_hidden_states"][0, 2].abs().sum() == 0
+
+
+def test_encoders_do_not_share_entries():
+    cache = TextConditioningCache()
+    first = cache.encode(model_with(Encoder(1.0)), Processor(), ["jazz"], "cpu")
+    second = cache.encode(model_with(Encoder(2.0)), Processor(), ["jazz"], "cpu")
+    assert torch.equal(second["encoder_hidden_states"], 2 * first["encoder_hidden_states"])
+
+
+def test_a_new_encoder_never_hits_a_freed_encoders_entries():
+    cache = TextConditioningCache()
+    encoder = Encoder(1.0)
+    cache.encode(model_with(encoder), Processor(), ["jazz"], "cpu")
+    del encoder
+    gc.collect()
+
+    # A fresh encoder may reuse the freed one's id(); it must still miss
+    replacement = Encoder(2.0)
+    out = cache.encode(model_with(replacement), Processor(), ["jazz"], "cpu")
+    assert replacement.calls == 1
+    assert out["encoder_hidden_states"][0, 0, 0] == 2 * 4
+    # The freed encoder's entry was purged rather than left to age out
+    assert cache.stats()["entries"] == 1
+
+
+def test_lru_respects_max_entries():
+    cache, encoder = TextConditioningCache(max_entries=2), Encoder()
+    for prompt in ("a", "bb", "ccc"):
+        cache.encode(model_with(encoder), Processor(), [prompt], "cpu")
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
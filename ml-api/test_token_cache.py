@@ -0,0 +1,35 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from token_cache import PackingCollator, collate_tokens
+
+
+def item(frames, prompt=(1, 2), value=1):
+    return {"codes": torch.full((2, frames), value, dtype=torch.long), "input_ids": torch.tensor(prompt)}
+
+
+def test_packs_same_prompt_clips_into_one_row():
+    batch = PackingCollator(max_frames=100)([item(10, value=1), item(6, value=2), item(4, value=3)])
+    assert batch["codes"].shape == (2, 2, 10)
+    assert batch["codes"][1, 0].tolist() == [2] * 6 + [3] * 4
+    # The first frame of a packed segment is predicted from the previous clip
+    assert batch["code_mask"][1, 0].tolist() == [True] * 6 + [False] + [True] * 3
+    assert batch["code_mask"][0].all()
+
+
+def test_never_packs_across_prompts_or_widens_the_batch():
+    batch = PackingCollator(max_frames=100)([item(10), item(6, prompt=(3,)), item(5)])
+    assert batch["codes"].shape == (3, 2, 10)
+    assert batch["input_ids"].tolist() == [[1, 2], [3, 0], [1, 2]]
+    assert batch["attention_mask"].tolist() == [[1, 1], [1, 0], [1, 1]]
+
+
+def test_crops_long_clips():
+    batch = PackingCollator(max_frames=8)([item(20), item(3)])
+    assert batch["codes"].shape[-1] == 8
+
+
+def test_pack_false_matches_plain_padding_row_count():
+    items = [item(10), item(6), item(4)]
+    assert PackingCollator(max_frames=100, pack=False)(items)["codes"].shape == collate_tokens(items)["codes"].shape
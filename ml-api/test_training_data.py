@@ -0,0 +1,97 @@
+import json
+import pickle
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+sf = pytest.importorskip("soundfile")
+
+from training_data import LengthBucketSampler, ShardDataset, ShardReader, ShardStreamDataset, preprocess
+
+LENGTHS = [5, 40, 12, 33, 8, 21, 50, 3, 17, 29, 44, 9, 26, 38, 14, 6] * 4
+
+
+def test_batches_cover_every_index_within_the_token_budget():
+    sampler = LengthBucketSampler(LENGTHS, max_tokens=100, pool_batches=4)
+    batches = list(sampler)
+    assert sorted(idx for batch in batches for idx in batch) == list(range(len(LENGTHS)))
+    for batch in batches:
+        assert len(batch) * max(LENGTHS[idx] for idx in batch) <= 100 or len(batch) == 1
+
+
+def test_max_length_caps_item_lengths():
+    sampler = LengthBucketSampler([1000, 10], max_tokens=200, max_length=100, shuffle=False)
+    assert list(sampler) == [[1, 0]]
+
+
+def test_len_is_a_function_of_the_epoch():
+    sampler = LengthBucketSampler(LENGTHS, max_tokens=100, pool_batches=2, seed=3)
+    for epoch in range(4):
+        sampler.set_epoch(epoch)
+        expected = len(sampler)
+        batches = iter(sampler)
+        next(batches)
+        assert len(sampler) == expected
+        assert 1 + len(list(batches)) == expected
+        assert len(sampler) == expected
+
+
+def test_layout_changes_only_with_set_epoch():
+    sampler = LengthBucketSampler(LENGTHS, max_tokens=100, pool_batches=2, seed=3)
+    first = list(sampler)
+    assert list(sampler) == first
+
+    sampler.set_epoch(1)
+    second = list(sampler)
+    assert second != first
+    assert len(sampler) == len(second)
+
+    sampler.set_epoch(0)
+    assert list(sampler) == first
+    assert list(LengthBucketSampler(LENGTHS, max_tokens=100, pool_batches=2, seed=3)) == first
+
+
+@pytest.fixture
+def shard(tmp_path):
+    """Three clips of 0.5, 1.0 and 2.0 s, one of them stereo at another rate"""
+    rng = np.random.default_rng(0)
+    clips = [("a.wav", 0.5, 8000, 1), ("b.wav", 1.0, 8000, 2), ("c.wav", 2.0, 16000, 1)]
+    for name, seconds, rate, channels in clips:
+        audio = rng.uniform(-0.5, 0.5, (int(seconds * rate), channels)).astype(np.float32)
+        sf.write(str(tmp_path / name), audio, rate)
+    with open(tmp_path / "metadata.json", "w") as f:
+        json.dump([{"audio_file": name, "prompt": name, "genre": "g"} for name, *_ in clips], f)
+    preprocess(str(tmp_path), str(tmp_path / "shard"), sample_rate=8000, max_duration=1.5)
+    return str(tmp_path / "shard")
+
+
+def test_preprocess_resamples_downmixes_and_crops(shard):
+    reader = ShardReader(shard)
+    assert [clip["length"] for clip in reader.clips] == [4000, 8000, 12000]
+    assert [clip["prompt"] for clip in reader.clips] == ["a.wav", "b.wav", "c.wav"]
+    assert reader.raw(2).dtype == np.int16
+
+
+def test_shard_dataset_pads_and_crops_to_duration(shard):
+    dataset = ShardDataset(shard, duration=1.0)
+    first, last = dataset[0], dataset[2]
+    assert first["audio"].shape == last["audio"].shape == (1, 8000)
+    assert first["audio"][0, 4000:].abs().sum() == 0
+    assert first["audio"].abs().max() <= 1.0
+    assert torch.allclose(last["audio"][0], torch.from_numpy(ShardReader(shard).raw(2, length=8000) / 32767).float())
+
+
+def test_reader_pickles_without_its_memory_map(shard):
+    reader = ShardReader(shard)
+    reader.audio(0)
+    clone = pickle.loads(pickle.dumps(reader))
+    assert clone._samples is None
+    assert torch.equal(clone.audio(1), reader.audio(1))
+
+
+def test_stream_dataset_yields_every_clip_once_per_epoch(shard):
+    dataset = ShardStreamDataset(shard, duration=0.5, shuffle_buffer=2, seed=1)
+    prompts = [item["prompt"] for item in dataset]
+    assert sorted(prompts) == ["a.wav", "b.wav", "c.wav"]
+    assert [item["prompt"] for item in dataset] == prompts
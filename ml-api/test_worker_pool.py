@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import worker_pool
+from synthesis import render_prompt
+from wavetable import WavetableEngine
+from worker_pool import WorkerPool
+
+REQUEST = SimpleNamespace(prompt="ambient pads", duration=1.0, temperature=1.0, lora_model=None, seed=3)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = WorkerPool(workers=2, threads=1, mock=True)
+    yield pool, pool.start()
+    pool.shutdown()
+
+
+def test_start_waits_for_every_worker(pool):
+    pool, model_data = pool
+    assert model_data["model"] == "advanced_mock"
+    assert len(pool.worker_models) == 2
+    assert set(pool.worker_models.values()) == {"advanced_mock"}
+    assert pool.stats()["ready_workers"] == 2
+
+
+def test_workers_render_the_same_audio_as_in_process(pool):
+    pool, _ = pool
+    expected = render_prompt(WavetableEngine(), REQUEST.prompt, REQUEST.duration, REQUEST.temperature,
+                             REQUEST.lora_model, REQUEST.seed)
+    batch = pool.run_batch([REQUEST, REQUEST])
+    single = asyncio.run(pool.generate(REQUEST))
+    for audio in batch + [single]:
+        assert np.array_equal(audio, expected)
+    stats = pool.stats()
+    assert stats["completed"] == 3 and stats["in_flight"] == 0
+
+
+def _has_nested_pool():
+    return worker_pool._worker["service"].worker_pool is not None
+
+
+def test_real_mode_worker_service_has_no_pool(monkeypatch):
+    pytest.importorskip("torch")
+    # The service module in the worker resolves to the mock model, but is built the real-mode way
+    monkeypatch.setenv("HARMONIX_MODEL_MODE", "mock")
+    monkeypatch.setenv("HARMONIX_WORKERS", "2")
+    pool = WorkerPool(workers=1, threads=1, mock=False)
+    try:
+        pool.start()
+        assert not pool.executor.submit(_has_nested_pool).result()
+    finally:
+        pool.shutdown()
@@ -0,0 +1,195 @@
+"""
+Text-conditioning cache for the transformers MusicGen model.
+
+Every generation tokenizes its prompt and runs it through the T5 text encoder
+before the first decoder step. Traffic is dominated by recurring prompts, so
+the token ids and encoder states are memoized per prompt in an LRU bounded by
+entry count and bytes. Generation then receives encoder_outputs directly and
+generate() skips both the processor and the encoder pass.
+
+Prompts are keyed after whitespace normalization only: T5 is case-sensitive,
+so "Jazz" and "jazz" condition the model differently. Entries are also keyed by
+the text encoder module, so a merged LoRA artifact never reuses another
+model's states. The module is identified by a serial number handed out once
+per object, not by id(), which a reloaded model can inherit from a freed one;
+entries of a freed encoder are dropped. HARMONIX_TEXT_CACHE_SIZE=0 disables
+the cache.
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("HARMONIX_TEXT_CACHE_SIZE", "512"))
+DEFAULT_MAX_BYTES = int(float(os.environ.get("HARMONIX_TEXT_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+
+def normalize_prompt(prompt: str):
+    """Collapse runs of whitespace; the T5 tokenizer does the same"""
+    return " ".join(prompt.split())
+
+
+class TextConditioningCache:
+    """LRU of per-prompt token ids and T5 encoder states"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max(0, max_entries)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # (encoder serial, prompt) -> (input_ids, hidden)
+        self.encoder_serials = weakref.WeakKeyDictionary()
+        self.serials = itertools.count()
+        self.freed_serials = set()  # encoders garbage-collected since the last purge
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.encoder_seconds = 0.0  # spent encoding misses
+        self.encoded_prompts = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def encode(self, model, processor, prompts, device, pad_to: int = None):
+        """Right-padded {"input_ids", "attention_mask", "encoder_hidden_states"} for a batch
+
+        Only prompts missing from the cache are tokenized and encoded, in one
+        batch. Padded positions get zero states; the mask hides them from
+        cross-attention just as with the encoder's own padded outputs.
+        """
+        import torch
+
+        encoder = model.get_text_encoder()
+        prompts = [normalize_prompt(prompt) for prompt in prompts]
+        found = {}
+        with self.lock:
+            self._purge_freed()
+            serial = self._serial(encoder)
+            keys = [(serial, prompt) for prompt in prompts]
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = entry
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            found.update(self._encode_missing(encoder, processor, missing, device))
+
+        rows = [found[key] for key in keys]
+        length = max(pad_to or 0, max(input_ids.shape[-1] for input_ids, _ in rows))
+        input_ids = torch.zeros(len(rows), length, dtype=torch.long, device=device)
+        attention_mask = torch.zeros(len(rows), length, dtype=torch.long, device=device)
+        hidden = rows[0][1].new_zeros(len(rows), length, rows[0][1].shape[-1])
+        for i, (ids, states) in enumerate(rows):
+            input_ids[i, :ids.shape[-1]] = ids
+            attention_mask[i, :ids.shape[-1]] = 1
+            hidden[i, :states.shape[0]] = states
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "encoder_hidden_states": hidden}
+
+    def _encode_missing(self, encoder, processor, keys, device):
+        inputs = processor(text=[prompt for _, prompt in keys], padding=True, return_tensors="pt")
+        input_ids = inputs["input_ids"].to(device)
+        attention_mask = inputs["attention_mask"].to(device)
+        start = time.perf_counter()
+        hidden = encoder(input_ids=input_ids, attention_mask=attention_mask, return_dict=True).last_hidden_state
+        self.encoder_seconds += time.perf_counter() - start
+        self.encoded_prompts += len(keys)
+
+        encoded = {}
+        for i, key in enumerate(keys):
+            # Keep each prompt at its own length, without the batch's padding
+            length = int(attention_mask[i].sum())
+            encoded[key] = (input_ids[i, :length].clone(), hidden[i, :length].clone())
+        if self.enabled:
+            with self.lock:
+                for key, entry in encoded.items():
+                    self._put(key, entry)
+        return encoded
+
+    def _serial(self, encoder):
+        serial = self.encoder_serials.get(encoder)
+        if serial is None:
+            serial = self.encoder_serials[encoder] = next(self.serials)
+            # Runs inside garbage collection, possibly while self.lock is held: only note the serial here
+            weakref.finalize(encoder, self.freed_serials.add, serial)
+        return serial
+
+    def _purge_freed(self):
+        while self.freed_serials:
+            serial = self.freed_serials.pop()
+            for key in [key for key in self.entries if key[0] == serial]:
+                self.bytes_used -= sum(tensor.element_size() * tensor.nelement() for tensor in self.entries.pop(key))
+
+    def _put(self, key, entry):
+        size = sum(tensor.element_size() * tensor.nelement() for tensor in entry)
+        if key in self.entries or size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.bytes_used += size
+        while len(self.entries) > self.max_entries or self.bytes_used > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes_used -= sum(tensor.element_size() * tensor.nelement() for tensor in evicted)
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes_used = 0
+
+    @property
+    def saved_seconds(self):
+        """Encoder time the hits would have cost at the mean per-prompt encode time"""
+        if not self.encoded_prompts:
+            return 0.0
+        return self.hits * self.encoder_seconds / self.encoded_prompts
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "bytes": self.bytes_used,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "encoder_seconds": self.encoder_seconds,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+def generation_inputs(model, conditioning):
+    """generate() kwargs that reuse cached encoder states instead of running the text encoder
+
+    With classifier-free guidance generate() appends an all-zero unconditional
+    copy of the encoder states and mask; passing encoder_outputs bypasses that
+    step, so it is done here. input_ids are still passed so generate() infers
+    the right batch size.
+    """
+    import torch
+
+    hidden = conditioning["encoder_hidden_states"]
+    attention_mask = conditioning["attention_mask"]
+    guidance_scale = model.generation_config.guidance_scale
+    if guidance_scale is not None and guidance_scale > 1:
+        hidden = torch.cat([hidden, torch.zeros_like(hidden)], dim=0)
+        attention_mask = torch.cat([attention_mask, torch.zeros_like(attention_mask)], dim=0)
+    try:
+        from transformers.modeling_outputs import BaseModelOutput
+        encoder_outputs = BaseModelOutput(last_hidden_state=hidden)
+    except ImportError:
+        encoder_outputs = (hidden,)  # benchmark stand-ins
+    return {"input_ids": conditioning["input_ids"], "attention_mask": attention_mask, "encoder_outputs": encoder_outputs}
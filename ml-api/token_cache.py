@@ -0,0 +1,261 @@
+"""
+Precomputed EnCodec codes and prompt tokens for LoRA training.
+
+Every clip in metadata.json is encoded to EnCodec codes and its prompt
+tokenized once, offline. Entries are keyed by a hash of the audio file, the
+prompt and the encoder, so re-runs only encode new or changed clips and the
+trainer spends each epoch on the LM forward/backward alone.
+
+Usage: python token_cache.py --dataset_path ./data --cache_dir ./data/tokens
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from training_data import load_clip, read_metadata
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+HASHES_FILE = "file_hashes.json"
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MusicGenTokenizer:
+    """EnCodec encoder and T5 tokenizer of an audiocraft MusicGen model"""
+
+    def __init__(self, musicgen, model_name: str, max_duration: float = 30.0):
+        self.musicgen = musicgen
+        self.sample_rate = musicgen.sample_rate
+        self.max_duration = max_duration
+        # Anything that changes the tokens must change the cache key
+        self.id = f"{model_name}:{self.sample_rate}:{max_duration}"
+
+    @property
+    def device(self):
+        return next(self.musicgen.compression_model.parameters()).device
+
+    @torch.no_grad()
+    def encode_audio(self, audio):
+        """(batch, 1, samples) float audio -> (batch, codebooks, frames) codes"""
+        codes, _ = self.musicgen.compression_model.encode(audio.to(self.device))
+        return codes
+
+    def tokenize(self, prompts):
+        """Prompts -> {"input_ids", "attention_mask"} as the description conditioner expects"""
+        conditioner = self.musicgen.lm.condition_provider.conditioners["description"]
+        return dict(conditioner.t5_tokenizer(prompts, return_tensors="pt", padding=True))
+
+
+class TokenCache:
+    """Directory of per-clip .npz entries plus an index in metadata order"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+
+    def _load_hashes(self):
+        try:
+            with open(os.path.join(self.cache_dir, HASHES_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def build(self, data_dir: str, tokenizer: MusicGenTokenizer):
+        """Encode every clip not already cached and write the index"""
+        # File hashes are reused while a file's size and mtime are unchanged
+        hashes = self._load_hashes()
+        known_frames = {entry["key"]: entry.get("frames") for entry in self._load_entries()}
+        entries = []
+        encoded = 0
+        start = time.perf_counter()
+        max_samples = int(tokenizer.max_duration * tokenizer.sample_rate)
+
+        for sample in read_metadata(data_dir):
+            path = sample["audio_path"]
+            stat = os.stat(path)
+            known = hashes.get(path)
+            if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                content_hash = known["hash"]
+            else:
+                content_hash = file_hash(path)
+                hashes[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": content_hash}
+
+            key = hashlib.sha256(f"{content_hash}\0{sample['prompt']}\0{tokenizer.id}".encode()).hexdigest()
+            entry_path = self._path(key)
+            if os.path.exists(entry_path):
+                frames = known_frames.get(key) or int(self.load(key)[0].shape[-1])
+            else:
+                try:
+                    audio = load_clip(path, tokenizer.sample_rate, max_samples)
+                except Exception as e:
+                    logger.warning(f"Skipping {path}: {e}")
+                    continue
+                codes = tokenizer.encode_audio(audio[None, None])[0]
+                text = tokenizer.tokenize([sample["prompt"]])
+                os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+                tmp_path = f"{entry_path}.{os.getpid()}.tmp.npz"
+                # Codebook indices fit in int16; prompts stay int32
+                np.savez(tmp_path, codes=codes.cpu().numpy().astype(np.int16),
+                         input_ids=text["input_ids"][0].numpy().astype(np.int32))
+                os.replace(tmp_path, entry_path)
+                frames = int(codes.shape[-1])
+                encoded += 1
+            entries.append({"key": key, "audio_file": sample["audio_file"], "prompt": sample["prompt"],
+                            "frames": frames})
+
+        with open(os.path.join(self.cache_dir, HASHES_FILE), "w") as f:
+            json.dump(hashes, f)
+        with open(os.path.join(self.cache_dir, INDEX_FILE), "w") as f:
+            json.dump({"tokenizer": tokenizer.id, "entries": entries}, f)
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"Token cache: {encoded} clip(s) encoded, {len(entries) - encoded} reused, {elapsed:.1f}s")
+        return entries
+
+    def _load_entries(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), "r") as f:
+                return json.load(f)["entries"]
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def load(self, key: str):
+        with np.load(self._path(key)) as entry:
+            return entry["codes"], entry["input_ids"]
+
+
+class TokenDataset(Dataset):
+    """Cached (codes, prompt tokens) pairs in metadata order"""
+
+    def __init__(self, cache_dir: str):
+        self.cache = TokenCache(cache_dir)
+        with open(os.path.join(cache_dir, INDEX_FILE), "r") as f:
+            self.entries = json.load(f)["entries"]
+
+    @property
+    def lengths(self):
+        """Code frames per entry, for length-bucketed batching"""
+        return [entry.get("frames") or self.cache.load(entry["key"])[0].shape[-1] for entry in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, idx):
+        entry = self.entries[idx]
+        codes, input_ids = self.cache.load(entry["key"])
+        return {
+            "codes": torch.from_numpy(codes.astype(np.int64)),
+            "input_ids": torch.from_numpy(input_ids.astype(np.int64)),
+            "prompt": entry["prompt"],
+        }
+
+
+def collate_tokens(items):
+    """Pad codes and prompt tokens to the longest item in the batch"""
+    return _collate_rows([[item["codes"]] for item in items], [item["input_ids"] for item in items])
+
+
+class PackingCollator:
+    """Crop long clips, pack short ones into shared rows, and pad the rest
+
+    Clips longer than max_frames are randomly cropped. Shorter clips are packed
+    back to back into one row when they share a prompt (a row has a single text
+    condition) and still fit within the batch's longest clip, so packing only
+    ever removes rows and never widens the batch. The first frame of each later
+    segment is masked out of the loss because it would be predicted from the
+    previous clip.
+    """
+
+    def __init__(self, max_frames: int, pack: bool = True):
+        self.max_frames = max_frames
+        self.pack = pack
+
+    def __call__(self, items):
+        clips = []
+        for item in items:
+            codes = item["codes"]
+            if codes.shape[-1] > self.max_frames:
+                # torch's RNG is seeded per DataLoader worker, unlike a copied random.Random
+                offset = int(torch.randint(codes.shape[-1] - self.max_frames + 1, ()))
+                codes = codes[:, offset:offset + self.max_frames]
+            clips.append((codes, item["input_ids"]))
+
+        capacity = max(codes.shape[-1] for codes, _ in clips)
+        rows, prompts, open_rows = [], [], {}
+        # Longest first, so short clips fill the gaps next to longer ones
+        for codes, input_ids in sorted(clips, key=lambda clip: -clip[0].shape[-1]):
+            key = tuple(input_ids.tolist())
+            row = open_rows.get(key) if self.pack else None
+            if row is not None and sum(segment.shape[-1] for segment in row) + codes.shape[-1] <= capacity:
+                row.append(codes)
+            else:
+                row = [codes]
+                rows.append(row)
+                prompts.append(input_ids)
+                open_rows[key] = row
+        return _collate_rows(rows, prompts)
+
+
+def _collate_rows(rows, prompts):
+    frames = max(sum(segment.shape[-1] for segment in row) for row in rows)
+    text_length = max(len(input_ids) for input_ids in prompts)
+    codebooks = rows[0][0].shape[0]
+    codes = torch.zeros(len(rows), codebooks, frames, dtype=torch.long)
+    code_mask = torch.zeros(len(rows), codebooks, frames, dtype=torch.bool)
+    input_ids = torch.zeros(len(rows), text_length, dtype=torch.long)
+    attention_mask = torch.zeros(len(rows), text_length, dtype=torch.long)
+    for i, (row, prompt) in enumerate(zip(rows, prompts)):
+        start = 0
+        for segment in row:
+            length = segment.shape[-1]
+            codes[i, :, start:start + length] = segment
+            code_mask[i, :, start + (1 if start else 0):start + length] = True
+            start += length
+        input_ids[i, :len(prompt)] = prompt
+        attention_mask[i, :len(prompt)] = 1
+    return {"codes": codes, "code_mask": code_mask, "input_ids": input_ids, "attention_mask": attention_mask}
+
+
+def lm_loss(lm, codes, code_mask, input_ids, attention_mask):
+    """Masked cross-entropy of the MusicGen LM over every codebook"""
+    conditioner = lm.condition_provider.conditioners["description"]
+    condition_tensors = {"description": conditioner({"input_ids": input_ids, "attention_mask": attention_mask})}
+    output = lm.compute_predictions(codes, [], condition_tensors)
+    mask = output.mask & code_mask
+    logits = output.logits[mask]
+    return torch.nn.functional.cross_entropy(logits.float(), codes[mask])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Encode a LoRA training corpus into EnCodec tokens")
+    parser.add_argument("--dataset_path", type=str, required=True, help="Directory with metadata.json")
+    parser.add_argument("--cache_dir", type=str, required=True, help="Token cache directory")
+    parser.add_argument("--model", type=str, default="facebook/musicgen-medium", help="MusicGen checkpoint")
+    parser.add_argument("--max_duration", type=float, default=30.0, help="Crop clips to this many seconds")
+    args = parser.parse_args()
+
+    from audiocraft.models import MusicGen
+
+    musicgen = MusicGen.get_pretrained(args.model)
+    TokenCache(args.cache_dir).build(args.dataset_path, MusicGenTokenizer(musicgen, args.model, args.max_duration))
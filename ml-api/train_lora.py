@@ -1,6 +1,10 @@
 """
 Script for fine-tuning MusicGen with LoRA
-Usage: python train_lora.py --dataset_path ./data --output_dir ./lora_models/my_model
+Usage: python training_data.py ingest --dataset_path ./data
+       python train_lora.py --dataset_path ./data --output_dir ./lora_models/my_model
+       python training_data.py preprocess --dataset_path ./data --output_dir ./data/shard
+       python train_lora.py --shard_dir ./data/shard --output_dir ./lora_models/my_model
+       python train_lora.py --dataset_path ./data --token_cache ./data/tokens --output_dir ./lora_models/my_model
 """
 
 import torch
@@ -10,8 +14,18 @@ from peft import LoraConfig, get_peft_model, TaskType
 from transformers import Trainer, TrainingArguments
 import argparse
 import os
+import time
 from torch.utils.data import Dataset, DataLoader
 import json
+from training_data import (
+    LengthBucketSampler,
+    ShardDataset,
+    ShardStreamDataset,
+    collate_audio,
+    get_resampler,
+    read_metadata,
+)
+from token_cache import MusicGenTokenizer, PackingCollator, TokenCache, TokenDataset, collate_tokens, lm_loss
 
 class MusicDataset(Dataset):
     def __init__(self, data_dir, sample_rate=32000, duration=10):
@@ -21,25 +35,8 @@ class MusicDataset(Dataset):
         self.samples = self._load_samples()
     
     def _load_samples(self):
-        """Load audio files and their corresponding text prompts"""
-        samples = []
-        metadata_file = os.path.join(self.data_dir, "metadata.json")
-        
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r') as f:
-                metadata = json.load(f)
-                
-            for item in metadata:
-                audio_path = os.path.join(self.data_dir, item['audio_file'])
-                if os.path.exists(audio_path):
-                    samples.append({
-                        'audio_path': audio_path,
-                        'prompt': item['prompt'],
-                        'genre': item.get('genre', ''),
-                        'mood': item.get('mood', '')
-                    })
-        
-        return samples
+        """Load audio files and their corresponding text prompts (from manifest.jsonl once ingested)"""
+        return read_metadata(self.data_dir)
     
     def __len__(self):
         return len(self.samples)
@@ -52,8 +49,7 @@ class MusicDataset(Dataset):
         
         # Resample if necessary
         if sr != self.sample_rate:
-            resampler = torchaudio.transforms.Resample(sr, self.sample_rate)
-            waveform = resampler(waveform)
+            waveform = get_resampler(sr, self.sample_rate)(waveform)
         
         # Ensure correct duration
         target_length = int(self.sample_rate * self.duration)
@@ -95,7 +91,9 @@ def train_lora_model(args):
     
     # Load base model
     print("Loading base MusicGen model...")
-    base_model = MusicGen.get_pretrained('facebook/musicgen-medium')
+    model_name = 'facebook/musicgen-medium'
+    base_model = MusicGen.get_pretrained(model_name)
+    tokenizer = MusicGenTokenizer(base_model, model_name)
     
     # Setup LoRA
     lora_config = {
@@ -104,11 +102,24 @@ def train_lora_model(args):
         'lora_dropout': args.lora_dropout
     }
     
-    model = setup_lora_model(base_model, lora_config)
+    # LoRA goes on the language model; EnCodec and T5 stay frozen
+    model = setup_lora_model(base_model.lm, lora_config)
     
     # Load dataset
     print("Loading dataset...")
-    dataset = MusicDataset(args.dataset_path)
+    data_collator = collate_audio
+    if args.token_cache:
+        # Encode new or changed clips once; epochs then read codes from disk
+        if args.dataset_path:
+            TokenCache(args.token_cache).build(args.dataset_path, tokenizer)
+        dataset = TokenDataset(args.token_cache)
+        data_collator = collate_tokens
+    elif args.shard_dir and args.streaming:
+        dataset = ShardStreamDataset(args.shard_dir)
+    elif args.shard_dir:
+        dataset = ShardDataset(args.shard_dir)
+    else:
+        dataset = MusicDataset(args.dataset_path)
     
     # Training arguments
     training_args = TrainingArguments(
@@ -122,29 +133,73 @@ def train_lora_model(args):
         save_steps=args.save_steps,
         save_total_limit=2,
         remove_unused_columns=False,
-        dataloader_pin_memory=False,
+        dataloader_pin_memory=torch.cuda.is_available(),
+        dataloader_num_workers=args.num_workers,
+        dataloader_prefetch_factor=2 if args.num_workers > 0 else None,
+        dataloader_persistent_workers=args.num_workers > 0,
     )
     
+    # Frame budget per step, shared between bucketing and packing
+    max_tokens = args.max_tokens or args.batch_size * args.max_frames
+    
     # Custom trainer for music generation
     class MusicGenTrainer(Trainer):
-        def compute_loss(self, model, inputs, return_outputs=False):
-            # Implement custom loss for music generation
-            # This is a simplified version - you'd need to implement
-            # the actual MusicGen training loss
-            outputs = model(**inputs)
-            loss = outputs.loss if hasattr(outputs, 'loss') else torch.tensor(0.0)
-            return (loss, outputs) if return_outputs else loss
+        def __init__(self, *trainer_args, **trainer_kwargs):
+            super().__init__(*trainer_args, **trainer_kwargs)
+            self.tokens_seen = 0
+            self.positions_seen = 0
+            self.window_start = time.perf_counter()
+        
+        def get_train_dataloader(self):
+            """Length-bucketed, packed batches for cached tokens; the default loader otherwise"""
+            if not isinstance(self.train_dataset, TokenDataset):
+                return super().get_train_dataloader()
+            # Trainer calls set_epoch on the prepared loader each epoch, which reaches the batch sampler
+            loader = DataLoader(
+                self.train_dataset,
+                batch_sampler=LengthBucketSampler(self.train_dataset.lengths, max_tokens,
+                                                  max_length=args.max_frames, seed=self.args.seed),
+                collate_fn=PackingCollator(args.max_frames, pack=not args.no_packing),
+                num_workers=self.args.dataloader_num_workers,
+                pin_memory=self.args.dataloader_pin_memory,
+                prefetch_factor=self.args.dataloader_prefetch_factor,
+                persistent_workers=self.args.dataloader_persistent_workers,
+            )
+            return self.accelerator.prepare(loader)
+        
+        def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+            if "codes" not in inputs:
+                # Raw audio: encode targets and prompts on every step
+                codes = tokenizer.encode_audio(inputs["audio"])
+                text = {k: v.to(codes.device) for k, v in tokenizer.tokenize(inputs["prompt"]).items()}
+                inputs = {"codes": codes, "code_mask": torch.ones_like(codes, dtype=torch.bool), **text}
+            self.tokens_seen += int(inputs["code_mask"].sum())
+            self.positions_seen += inputs["code_mask"].numel()
+            loss = lm_loss(model, **inputs)
+            return (loss, None) if return_outputs else loss
+        
+        def log(self, logs, *log_args, **log_kwargs):
+            # Padding waste and useful token rate since the previous log line
+            if self.positions_seen:
+                elapsed = time.perf_counter() - self.window_start
+                logs["padding_ratio"] = 1 - self.tokens_seen / self.positions_seen
+                logs["tokens_per_second"] = self.tokens_seen / elapsed
+                self.tokens_seen = self.positions_seen = 0
+                self.window_start = time.perf_counter()
+            super().log(logs, *log_args, **log_kwargs)
     
     # Initialize trainer
     trainer = MusicGenTrainer(
         model=model,
         args=training_args,
         train_dataset=dataset,
+        data_collator=data_collator,
     )
     
     # Start training
     print("Starting training...")
-    trainer.train()
+    result = trainer.train()
+    print(f"Training throughput: {result.metrics['train_samples_per_second']:.2f} samples/s")
     
     # Save the final model
     trainer.save_model()
@@ -152,7 +207,10 @@ def train_lora_model(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Fine-tune MusicGen with LoRA")
-    parser.add_argument("--dataset_path", type=str, required=True, help="Path to training dataset")
+    parser.add_argument("--dataset_path", type=str, help="Path to training dataset")
+    parser.add_argument("--shard_dir", type=str, help="Preprocessed shard from training_data.py (replaces --dataset_path)")
+    parser.add_argument("--streaming", action="store_true", help="Stream the shard sequentially instead of random access")
+    parser.add_argument("--token_cache", type=str, help="EnCodec token cache directory, built from --dataset_path if given")
     parser.add_argument("--output_dir", type=str, required=True, help="Output directory for trained model")
     parser.add_argument("--epochs", type=int, default=10, help="Number of training epochs")
     parser.add_argument("--batch_size", type=int, default=1, help="Training batch size")
@@ -164,6 +222,12 @@ if __name__ == "__main__":
     parser.add_argument("--warmup_steps", type=int, default=100, help="Warmup steps")
     parser.add_argument("--logging_steps", type=int, default=10, help="Logging steps")
     parser.add_argument("--save_steps", type=int, default=500, help="Save steps")
+    parser.add_argument("--num_workers", type=int, default=4, help="DataLoader worker processes")
+    parser.add_argument("--max_frames", type=int, default=500, help="Token frames per packed sequence (50 per second)")
+    parser.add_argument("--max_tokens", type=int, default=None, help="Padded frames per batch (default: batch_size * max_frames)")
+    parser.add_argument("--no_packing", action="store_true", help="Crop and pad only, without packing short clips")
     
     args = parser.parse_args()
+    if not args.dataset_path and not args.shard_dir and not args.token_cache:
+        parser.error("one of --dataset_path, --shard_dir or --token_cache is required")
     train_lora_model(args)
\ No newline at end of file
@@ -0,0 +1,488 @@
+"""
+Preprocessed training data for LoRA fine-tuning.
+
+Ingestion probes every file listed in metadata.json in a process pool and
+writes a validated manifest, so broken audio is rejected up front. The
+corpus is then decoded, downmixed to mono, resampled and cropped once into a
+single packed sample file plus a JSON index. Training then reads clips as
+slices of a memory map instead of decoding audio on every access.
+
+Usage: python training_data.py ingest --dataset_path ./data --workers 8
+       python training_data.py preprocess --dataset_path ./data --output_dir ./data/shard
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset, IterableDataset, Sampler, get_worker_info
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_FILE = "audio.bin"
+INDEX_FILE = "index.json"
+MANIFEST_FILE = "manifest.jsonl"
+SHARD_DTYPES = {"int16": np.int16, "float16": np.float16}
+
+
+@lru_cache(maxsize=None)
+def get_resampler(orig_sr: int, target_sr: int):
+    """One Resample module per source rate; building its filter bank is the expensive part"""
+    import torchaudio
+
+    return torchaudio.transforms.Resample(orig_sr, target_sr)
+
+
+def decode_audio(path: str):
+    """Decode a file to a float32 (channels, samples) tensor and its sample rate"""
+    try:
+        import soundfile as sf
+
+        data, sr = sf.read(path, dtype="float32", always_2d=True)
+        return torch.from_numpy(data.T), sr
+    except (ImportError, RuntimeError):
+        # Formats libsndfile cannot read go through torchaudio
+        import torchaudio
+
+        return torchaudio.load(path)
+
+
+def load_clip(path: str, sample_rate: int, max_samples: int = None):
+    """Mono float32 clip at sample_rate, cropped to max_samples"""
+    waveform, sr = decode_audio(path)
+    waveform = waveform.mean(dim=0, keepdim=True)
+    if max_samples is not None and sr != sample_rate:
+        # Resample only what survives the crop, plus a little filter context
+        waveform = waveform[:, :int(max_samples * sr / sample_rate) + 64]
+    if sr != sample_rate:
+        waveform = get_resampler(sr, sample_rate)(waveform)
+    if max_samples is not None:
+        waveform = waveform[:, :max_samples]
+    return waveform[0]
+
+
+def read_metadata(data_dir: str):
+    """Training samples: metadata.json entries that exist, minus the files ingestion rejected
+
+    metadata.json stays the source of truth once a manifest exists. Entries
+    added since the last ingest are used unvalidated, with a warning to run
+    ingest again.
+    """
+    manifest_path = os.path.join(data_dir, MANIFEST_FILE)
+    manifest = read_manifest(manifest_path) if os.path.exists(manifest_path) else None
+    items = _metadata_items(data_dir)
+    if manifest is not None and not items:
+        items = list(manifest.values())  # metadata.json is gone; the manifest is all there is
+
+    samples = []
+    unvalidated = 0
+    for item in items:
+        audio_path = os.path.join(data_dir, item["audio_file"])
+        record = manifest.get(item["audio_file"]) if manifest is not None else None
+        if record is not None:
+            if not record["valid"]:
+                continue
+        elif not os.path.exists(audio_path):
+            continue
+        elif manifest is not None:
+            unvalidated += 1
+        samples.append({
+            "audio_file": item["audio_file"],
+            "audio_path": audio_path,
+            "prompt": item["prompt"],
+            "genre": item.get("genre", ""),
+            "mood": item.get("mood", ""),
+        })
+    if unvalidated:
+        logger.warning(f"{unvalidated} metadata.json entries are not in {MANIFEST_FILE}; "
+                       f"run `python training_data.py ingest` to validate them")
+    return samples
+
+
+def _metadata_items(data_dir: str):
+    metadata_file = os.path.join(data_dir, "metadata.json")
+    if not os.path.exists(metadata_file):
+        return []
+    with open(metadata_file, "r") as f:
+        return json.load(f)
+
+
+def read_manifest(path: str):
+    """Manifest records keyed by audio_file; a truncated last line is ignored"""
+    records = {}
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["audio_file"]] = record
+    return records
+
+
+def probe_audio(path: str, verify: bool = False):
+    """Header facts for one file, or the reason it is unusable
+
+    verify=True also decodes the whole file, which catches truncated or
+    corrupt payloads behind a valid header. Files libsndfile cannot read are
+    probed through torchaudio, the same fallback decode_audio() uses.
+    """
+    try:
+        try:
+            sample_rate, channels, frames = _probe_soundfile(path, verify)
+        except (ImportError, RuntimeError):
+            sample_rate, channels, frames = _probe_torchaudio(path, verify)
+        if frames <= 0 or sample_rate <= 0:
+            raise ValueError("no audio frames")
+        return {"sample_rate": sample_rate, "channels": channels,
+                "duration": frames / sample_rate, "valid": True, "error": None}
+    except Exception as e:
+        return {"valid": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def _probe_soundfile(path: str, verify: bool):
+    import soundfile as sf
+
+    info = sf.info(path)
+    if verify:
+        for _ in sf.blocks(path, blocksize=1 << 16, dtype="float32"):
+            pass
+    return info.samplerate, info.channels, info.frames
+
+
+def _probe_torchaudio(path: str, verify: bool):
+    import torchaudio
+
+    info = getattr(torchaudio, "info", None)  # removed in recent torchaudio releases
+    if info is not None and not verify:
+        metadata = info(path)
+        if metadata.num_frames > 0:
+            return metadata.sample_rate, metadata.num_channels, metadata.num_frames
+    # Some containers (e.g. mp3) carry no frame count; decoding is the only check left
+    waveform, sr = torchaudio.load(path)
+    return sr, waveform.shape[0], waveform.shape[1]
+
+
+def ingest(data_dir: str, workers: int = None, verify: bool = False):
+    """Validate every metadata.json entry in parallel and write manifest.jsonl
+
+    Files whose size and mtime match the previous manifest are not probed
+    again. Records are appended to a .partial file as they complete, so an
+    interrupted run resumes where it stopped.
+    """
+    manifest_path = os.path.join(data_dir, MANIFEST_FILE)
+    partial_path = f"{manifest_path}.partial"
+    previous = {}
+    for path in (manifest_path, partial_path):
+        if os.path.exists(path):
+            previous.update(read_manifest(path))
+
+    start = time.perf_counter()
+    records = []
+    pending = {}
+    reused = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(partial_path, "a") as partial:
+        for item in _metadata_items(data_dir):
+            record = {
+                "audio_file": item["audio_file"],
+                "prompt": item["prompt"],
+                "genre": item.get("genre", ""),
+                "mood": item.get("mood", ""),
+            }
+            records.append(record)
+            audio_path = os.path.join(data_dir, item["audio_file"])
+            try:
+                stat = os.stat(audio_path)
+            except OSError as e:
+                record.update(valid=False, error=f"{type(e).__name__}: {e}")
+                continue
+            record.update(size=stat.st_size, mtime=stat.st_mtime)
+
+            known = previous.get(item["audio_file"])
+            if known and known.get("size") == stat.st_size and known.get("mtime") == stat.st_mtime \
+                    and (known.get("verified") or not verify):
+                record.update({key: known[key] for key in ("sample_rate", "channels", "duration", "valid", "error", "verified")
+                               if key in known})
+                reused += 1
+            else:
+                pending[pool.submit(probe_audio, audio_path, verify)] = record
+
+        # Checkpoint in completion order so one slow file holds nothing up; the manifest keeps metadata order
+        for future in as_completed(pending):
+            record = pending[future]
+            record.update(future.result(), verified=verify)
+            partial.write(json.dumps(record) + "\n")
+            partial.flush()
+
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, manifest_path)
+    os.remove(partial_path)
+
+    elapsed = time.perf_counter() - start
+    rejected = [record for record in records if not record.get("valid")]
+    logger.info(f"Ingested {len(records)} files ({len(pending)} probed, {reused} reused) "
+                f"in {elapsed:.2f}s, {len(pending) / elapsed if elapsed else 0:.0f} files/s probed; "
+                f"{len(rejected)} rejected")
+    for record in rejected:
+        logger.warning(f"Rejected {record['audio_file']}: {record['error']}")
+    return records
+
+
+def preprocess(data_dir: str, output_dir: str, sample_rate: int = 32000, max_duration: float = 30.0,
+               dtype: str = "int16"):
+    """Decode the whole corpus once into a packed sample file and an index
+
+    Clips are appended one at a time, so memory use does not grow with the
+    corpus. Clips keep their own length (up to max_duration); padding is left
+    to the reader.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    np_dtype = SHARD_DTYPES[dtype]
+    max_samples = int(max_duration * sample_rate)
+    clips = []
+    offset = 0
+    start = time.perf_counter()
+
+    samples = read_metadata(data_dir)
+    with open(os.path.join(output_dir, SAMPLES_FILE), "wb") as f:
+        for sample in samples:
+            try:
+                clip = load_clip(sample["audio_path"], sample_rate, max_samples).numpy()
+            except Exception as e:
+                logger.warning(f"Skipping {sample['audio_path']}: {e}")
+                continue
+            if np_dtype is np.int16:
+                clip = np.clip(clip, -1.0, 1.0) * 32767
+            f.write(clip.astype(np_dtype).tobytes())
+            clips.append({
+                "offset": offset,
+                "length": len(clip),
+                "audio_file": sample["audio_file"],
+                "prompt": sample["prompt"],
+                "genre": sample["genre"],
+                "mood": sample["mood"],
+            })
+            offset += len(clip)
+
+    index = {"sample_rate": sample_rate, "dtype": dtype, "total_samples": offset, "clips": clips}
+    with open(os.path.join(output_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Packed {len(clips)}/{len(samples)} clips ({offset / sample_rate / 3600:.2f} h of audio) "
+                f"into {output_dir} in {elapsed:.1f}s")
+    return index
+
+
+class ShardReader:
+    """Zero-copy access to clips in a preprocessed shard"""
+
+    def __init__(self, shard_dir: str):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, INDEX_FILE), "r") as f:
+            self.index = json.load(f)
+        self.clips = self.index["clips"]
+        self.sample_rate = self.index["sample_rate"]
+        self.dtype = SHARD_DTYPES[self.index["dtype"]]
+        self._samples = None
+
+    @property
+    def samples(self):
+        # Mapped lazily so DataLoader workers each open their own map after fork/spawn
+        if self._samples is None:
+            if self.index["total_samples"] == 0:
+                self._samples = np.zeros(0, dtype=self.dtype)
+            else:
+                # Copy-on-write keeps slices writable for torch without touching the file
+                self._samples = np.memmap(os.path.join(self.shard_dir, SAMPLES_FILE), dtype=self.dtype,
+                                          mode="c", shape=(self.index["total_samples"],))
+        return self._samples
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_samples"] = None
+        return state
+
+    def __len__(self):
+        return len(self.clips)
+
+    def raw(self, idx: int, start: int = 0, length: int = None):
+        """Memory-mapped view of a clip (or a window of it) in the shard's dtype"""
+        clip = self.clips[idx]
+        length = clip["length"] - start if length is None else min(length, clip["length"] - start)
+        offset = clip["offset"] + start
+        return self.samples[offset:offset + length]
+
+    def audio(self, idx: int, num_samples: int = None):
+        """Float32 (1, num_samples) tensor, zero-padded or cropped like MusicDataset"""
+        view = self.raw(idx, length=num_samples)
+        audio = torch.zeros(1, num_samples if num_samples is not None else len(view))
+        source = torch.from_numpy(view)
+        if self.dtype is np.int16:
+            torch.mul(source, 1.0 / 32767, out=audio[0, :len(view)])
+        else:
+            audio[0, :len(view)] = source
+        return audio
+
+    def item(self, idx: int, num_samples: int = None):
+        clip = self.clips[idx]
+        return {
+            "audio": self.audio(idx, num_samples),
+            "prompt": clip["prompt"],
+            "genre": clip["genre"],
+            "mood": clip["mood"],
+        }
+
+
+class ShardDataset(Dataset):
+    """Map-style dataset over a preprocessed shard, with the same items as MusicDataset"""
+
+    def __init__(self, shard_dir: str, duration: float = 10):
+        self.reader = ShardReader(shard_dir)
+        self.sample_rate = self.reader.sample_rate
+        self.num_samples = int(self.sample_rate * duration) if duration else None
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, idx):
+        return self.reader.item(idx, self.num_samples)
+
+
+class ShardStreamDataset(IterableDataset):
+    """Sequential pass over a shard for corpora larger than RAM
+
+    Clips are read in file order, so the OS sees one forward scan per worker;
+    a small shuffle buffer decorrelates neighbouring clips. DataLoader workers
+    each take a contiguous range of clips.
+    """
+
+    def __init__(self, shard_dir: str, duration: float = 10, shuffle_buffer: int = 64, seed: int = 0):
+        self.reader = ShardReader(shard_dir)
+        self.sample_rate = self.reader.sample_rate
+        self.num_samples = int(self.sample_rate * duration) if duration else None
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __iter__(self):
+        worker = get_worker_info()
+        num_workers, worker_id = (worker.num_workers, worker.id) if worker else (1, 0)
+        per_worker = -(-len(self.reader) // num_workers)
+        indices = range(worker_id * per_worker, min(len(self.reader), (worker_id + 1) * per_worker))
+
+        rng = random.Random(self.seed + self.epoch * 1000 + worker_id)
+        buffer = []
+        for idx in indices:
+            buffer.append(idx)
+            if len(buffer) >= self.shuffle_buffer:
+                yield self.reader.item(buffer.pop(rng.randrange(len(buffer))), self.num_samples)
+        rng.shuffle(buffer)
+        for idx in buffer:
+            yield self.reader.item(idx, self.num_samples)
+
+
+class LengthBucketSampler(Sampler):
+    """Batch sampler grouping similar-length items under a padded-token budget
+
+    Indices are shuffled, split into pools of `pool_batches` batches' worth,
+    and sorted by length within each pool; batches are cut so that
+    items x longest item stays within max_tokens, then shuffled. Short clips
+    therefore travel in larger batches and little of each batch is padding.
+
+    As with DistributedSampler, call set_epoch(n) before each epoch: the
+    layout, and so __len__, depends only on the seed and that epoch number.
+    """
+
+    def __init__(self, lengths, max_tokens: int, max_length: int = None, pool_batches: int = 32,
+                 shuffle: bool = True, seed: int = 0):
+        self.lengths = [min(length, max_length) if max_length else length for length in lengths]
+        self.max_tokens = max_tokens
+        self.pool_size = max(1, pool_batches * max_tokens // max(1, int(np.median(self.lengths or [1]))))
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self._cached = None  # (epoch, batches)
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _epoch_batches(self):
+        if self._cached is None or self._cached[0] != self.epoch:
+            self._cached = (self.epoch, self._batches(self.epoch))
+        return self._cached[1]
+
+    def _batches(self, epoch):
+        rng = random.Random(self.seed + epoch)
+        order = list(range(len(self.lengths)))
+        if self.shuffle:
+            rng.shuffle(order)
+        batches = []
+        for start in range(0, len(order), self.pool_size):
+            batch, longest = [], 0
+            for idx in sorted(order[start:start + self.pool_size], key=self.lengths.__getitem__):
+                length = self.lengths[idx]
+                if batch and max(longest, length) * (len(batch) + 1) > self.max_tokens:
+                    batches.append(batch)
+                    batch, longest = [], 0
+                batch.append(idx)
+                longest = max(longest, length)
+            if batch:
+                batches.append(batch)
+        if self.shuffle:
+            rng.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        return iter(self._epoch_batches())
+
+    def __len__(self):
+        return len(self._epoch_batches())
+
+
+def collate_audio(items):
+    """Stack fixed-length audio items and keep their prompts as a list"""
+    return {
+        "audio": torch.stack([item["audio"] for item in items]),
+        "prompt": [item["prompt"] for item in items],
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Prepare LoRA training data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    preprocess_parser = subparsers.add_parser("preprocess", help="Pack the corpus into a memory-mapped shard")
+    preprocess_parser.add_argument("--dataset_path", type=str, required=True, help="Directory with metadata.json")
+    preprocess_parser.add_argument("--output_dir", type=str, required=True, help="Shard output directory")
+    preprocess_parser.add_argument("--sample_rate", type=int, default=32000, help="Target sample rate")
+    preprocess_parser.add_argument("--max_duration", type=float, default=30.0, help="Crop clips to this many seconds")
+    preprocess_parser.add_argument("--dtype", choices=sorted(SHARD_DTYPES), default="int16", help="Stored sample type")
+
+    ingest_parser = subparsers.add_parser("ingest", help="Validate the corpus and write manifest.jsonl")
+    ingest_parser.add_argument("--dataset_path", type=str, required=True, help="Directory with metadata.json")
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Probe processes (default: CPU count)")
+    ingest_parser.add_argument("--verify", action="store_true", help="Fully decode each file, not just its header")
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        ingest(args.dataset_path, args.workers, args.verify)
+    elif args.command == "preprocess":
+        preprocess(args.dataset_path, args.output_dir, args.sample_rate, args.max_duration, args.dtype)
@@ -0,0 +1,127 @@
+"""
+Wavetable bank for the advanced mock synthesizer.
+
+The mock only ever plays a handful of voicings: five styles, four-chord
+progressions and fixed harmonic sets, with a few LoRA tweaks. Each noise-free
+one-second measure is therefore rendered once per (style, base frequency,
+LoRA factor, measure index) and requests are assembled by copying cached
+segments, adding noise only when temperature > 1.
+
+The measure index stays in the key because the oscillator phase and the
+decay envelope at a measure's start follow from it; nothing else about the
+request's position does. Only the first HARMONIX_WAVETABLE_MEASURES measures
+are banked, so one long clip cannot flush every other style from the LRU;
+later measures and the per-request noise envelope are rendered directly.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from synthesis import (DEFAULT_STYLE, FINE_STEPS, RENDER_THREADS, SAMPLE_RATE, STYLE_RULES, SynthesisEngine,
+                       SynthesisPlan)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("HARMONIX_WAVETABLE_MAX_MB", "64")) * 1024 * 1024)
+WARM_SECONDS = int(os.environ.get("HARMONIX_WAVETABLE_WARM_SECONDS", "0"))
+# Measures per plan kept in the bank; covers the usual clip lengths
+CACHED_MEASURES = int(os.environ.get("HARMONIX_WAVETABLE_MEASURES", "32"))
+
+
+class WavetableEngine(SynthesisEngine):
+    """SynthesisEngine that renders each noise-free measure once and reuses it"""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, max_bytes: int = DEFAULT_MAX_BYTES,
+                 threads: int = RENDER_THREADS, cached_measures: int = CACHED_MEASURES):
+        super().__init__(sample_rate, threads=threads)
+        self.max_bytes = max_bytes
+        self.cached_measures = cached_measures
+        self.segments = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def render_measures(self, plan: SynthesisPlan, start: int, stop: int, step: float,
+                        temperature: float = 1.0, rng=None, out=None):
+        """Assemble measures [start, stop) from cached segments plus fresh noise"""
+        if step != 1.0 / self.sample_rate:
+            # Clips whose length is not a whole number of samples are slightly stretched; render them directly
+            return super().render_measures(plan, start, stop, step, temperature, rng, out)
+        count = stop - start
+        if out is None:
+            out = np.empty((count, self.sample_rate))
+        banked = min(stop, max(start, self.cached_measures))
+        for row, measure in enumerate(range(start, banked)):
+            key = ("tone", plan.style, plan.base_freq, plan.lora_factor, measure)
+            out[row] = self._cached(key, lambda: self._render_tone(plan, measure, step))
+        if banked < stop:
+            super().render_measures(plan, banked, stop, step, out=out[banked - start:])
+
+        if temperature > 1.0:
+            # Same (measure, note, sample) draw order as the direct renderer
+            noise_factor = (temperature - 1.0) * 0.1
+            noise = (rng or np.random).normal(0, noise_factor, (count, plan.notes, self.sample_rate))
+            noise = noise.sum(axis=1)
+            noise *= self._measure_envelopes(start, stop, step)
+            out += noise
+        return out
+
+    def _render_tone(self, plan, measure, step):
+        """Noise-free measure with its envelope applied, straight from the synthesis engine"""
+        return super().render_measures(plan, measure, measure + 1, step)[0]
+
+    def _measure_envelopes(self, start, stop, step):
+        fine_t = np.arange(FINE_STEPS) * step
+        coarse_t = (np.arange(start * self.rows_per_measure, stop * self.rows_per_measure)
+                    * FINE_STEPS * step)
+        return self._envelope(coarse_t, fine_t).reshape(stop - start, self.sample_rate)
+
+    def _cached(self, key, render):
+        with self.lock:
+            segment = self.segments.get(key)
+            if segment is not None:
+                self.segments.move_to_end(key)
+                self.hits += 1
+                return segment
+            self.misses += 1
+
+        segment = render()
+        segment.flags.writeable = False
+        with self.lock:
+            if key not in self.segments:
+                self.segments[key] = segment
+                self.bytes_used += segment.nbytes
+            while self.bytes_used > self.max_bytes and self.segments:
+                _, evicted = self.segments.popitem(last=False)
+                self.bytes_used -= evicted.nbytes
+                self.evictions += 1
+        return segment
+
+    def warm(self, seconds: int = WARM_SECONDS):
+        """Pre-render the first `seconds` measures of every style without LoRA"""
+        seconds = min(seconds, self.cached_measures)
+        if seconds <= 0:
+            return
+        step = 1.0 / self.sample_rate
+        styles = [(style, base_freq) for _, style, base_freq in STYLE_RULES] + [DEFAULT_STYLE]
+        for style, base_freq in styles:
+            self.render_measures(SynthesisPlan(style, base_freq), 0, seconds, step)
+        logger.info(f"🎼 Wavetable warmed: {len(self.segments)} segments, {self.bytes_used / 1e6:.1f} MB")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "segments": len(self.segments),
+                "bytes": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "cached_measures": self.cached_measures,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,221 @@
+"""
+Multi-process execution mode for CPU generation.
+
+Each worker process loads the model (or the mock synthesizer) once, pins its
+torch/BLAS thread count, and hands finished audio back through POSIX shared
+memory, so only a segment name and shape cross the process boundary instead
+of a pickled float array. Mock workers only import the synthesis modules;
+real-model workers import torch and build a service of their own with no
+pool. Each worker reports its pid and model once loaded, and start() waits
+for every one of them.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import weakref
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from synthesis import render_prompt
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get("HARMONIX_WORKERS", "0"))
+WORKER_THREADS = int(os.environ.get("HARMONIX_WORKER_THREADS", "0"))
+MOCK = os.environ.get("HARMONIX_MODEL_MODE", "eager") == "mock"
+
+# Read by OpenMP/BLAS and the mock renderer when a worker starts, before their pools spin up
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+                   "HARMONIX_RENDER_THREADS")
+# Seconds between checks for a worker that died while loading
+READY_POLL_SECONDS = 1.0
+
+# Per-process state, filled in by _init_worker
+_worker = {}
+
+
+def _init_worker(threads: int, mock: bool, ready=None):
+    """Pin thread counts, load the model (or the mock synthesizer) once, and report (pid, model) on `ready`"""
+    if mock:
+        # Render threads are pinned through HARMONIX_RENDER_THREADS; torch is never needed
+        from wavetable import WavetableEngine
+
+        _worker["synth"] = WavetableEngine()
+        _worker["model_data"] = {"model": "advanced_mock", "processor": None}
+    else:
+        import torch
+
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # already fixed by an earlier parallel call
+
+        # A service of its own: one built with the default worker count would start a nested pool
+        from lightweight_main import MusicGenService
+
+        service = MusicGenService(workers=0)
+        _worker["service"] = service
+        _worker["synth"] = service.synth
+        _worker["model_data"] = service._load_model_sync()
+
+    if ready is not None:
+        model = _worker["model_data"]["model"]
+        ready.put((os.getpid(), model if isinstance(model, str) else "real"))
+
+
+def _ping():
+    """Submitted once per worker so the pool spawns all of them up front"""
+    return os.getpid()
+
+
+def _generate(requests):
+    """Render a batch in this worker and return shared-memory handles"""
+    model_data = _worker["model_data"]
+    if model_data["model"] == "advanced_mock":
+        audio = [
+            render_prompt(
+                _worker["synth"],
+                request.prompt,
+                request.duration,
+                request.temperature,
+                request.lora_model,
+                request.seed
+            )
+            for request in requests
+        ]
+    else:
+        audio = _worker["service"]._generate_batch_with_real_model(model_data, requests)
+    return [_share(clip) for clip in audio]
+
+
+def _share(audio):
+    """Copy audio into a new shared memory segment owned by the parent from now on"""
+    audio = np.asarray(audio, dtype=np.float32)
+    shm = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+    view = np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)
+    view[:] = audio
+    del view
+    shm.close()
+    return shm.name, audio.shape
+
+
+def _attach(name, shape):
+    """Map a worker's segment as a NumPy array without copying it"""
+    shm = shared_memory.SharedMemory(name=name)
+    audio = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    # Drop the name now; the mapping stays valid until the array is released
+    shm.unlink()
+    weakref.finalize(audio, shm.close)
+    return audio
+
+
+class WorkerPool:
+    """Process pool of generation workers, each with its own model and thread budget"""
+
+    def __init__(self, workers: int = WORKERS, threads: int = WORKER_THREADS, mock: bool = MOCK):
+        self.workers = max(1, workers)
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.mock = mock
+        self.executor = None
+        # Threads that block on worker results for the batch scheduler
+        self.dispatcher = ThreadPoolExecutor(max_workers=self.workers)
+        # Updated from the dispatcher threads and the event loop
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.worker_models = {}  # pid -> "advanced_mock" or "real", as each worker reported
+
+    def start(self):
+        """Spawn the workers, wait until each has loaded its model, and return model_data"""
+        logger.info(f"🧵 Starting {self.workers} generation worker(s) with {self.threads} thread(s) each")
+        context = get_context("spawn")
+        ready = context.Queue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.threads, self.mock, ready),
+        )
+
+        # Workers are spawned during submit(), so they inherit these variables; a worker
+        # importing the service module must never see a worker count of its own
+        env = {var: str(self.threads) for var in THREAD_ENV_VARS}
+        env["HARMONIX_WORKERS"] = "0"
+        saved = {var: os.environ.get(var) for var in env}
+        os.environ.update(env)
+        try:
+            pings = [self.executor.submit(_ping) for _ in range(self.workers)]
+        finally:
+            for var, value in saved.items():
+                if value is None:
+                    os.environ.pop(var, None)
+                else:
+                    os.environ[var] = value
+
+        # A ping can run on any worker that is already up, so wait for a report from each one
+        while len(self.worker_models) < self.workers:
+            try:
+                pid, model = ready.get(timeout=READY_POLL_SECONDS)
+            except queue.Empty:
+                for ping in pings:
+                    if ping.done() and ping.exception() is not None:
+                        raise ping.exception()
+                continue
+            self.worker_models[pid] = model
+        ready.close()
+
+        mock = "advanced_mock" in self.worker_models.values()
+        if mock and not self.mock:
+            logger.warning("⚠️ A generation worker fell back to the mock synthesizer")
+        return {"model": "advanced_mock" if mock else "worker_pool", "processor": None}
+
+    @contextmanager
+    def _tracked(self, requests: int):
+        """Count one submission as in flight, and its requests as completed if it succeeds"""
+        with self.lock:
+            self.in_flight += 1
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                if succeeded:
+                    self.completed += requests
+
+    def run_batch(self, requests):
+        """Blocking batch generation, for use from the batch scheduler's executor"""
+        with self._tracked(len(requests)):
+            handles = self.executor.submit(_generate, requests).result()
+        return [_attach(name, shape) for name, shape in handles]
+
+    async def generate(self, request):
+        """Generate a single request on the next free worker"""
+        with self._tracked(1):
+            handles = await asyncio.wrap_future(self.executor.submit(_generate, [request]))
+        name, shape = handles[0]
+        return _attach(name, shape)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.dispatcher.shutdown(wait=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "threads_per_worker": self.threads,
+                "mock": self.mock,
+                "ready_workers": len(self.worker_models),
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+            }